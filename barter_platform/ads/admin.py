@@ -1,5 +1,16 @@
 from django.contrib import admin
-from .models import Ad, ExchangeProposal
+from .models import Ad, AdImage, ArchivedAd, ArchivedProposal, ExchangeProposal, TradeCycle, TradeCycleLeg
+
+
+class AdImageInline(admin.StackedInline):
+    model = AdImage
+    fields = ('source_url', 'status', 'width', 'height', 'error', 'fetched_at')
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False  # создаётся фоновой задачей загрузки
 
 
 class AdAdmin(admin.ModelAdmin):
@@ -13,6 +24,7 @@ class AdAdmin(admin.ModelAdmin):
         prepopulated_fields (dict): Автозаполняемые поля.
         readonly_fields (tuple): Поля только для чтения.
         fieldsets (tuple): Группировка полей при редактировании.
+        inlines (list): Загруженное изображение и его статус.
     """
     
     list_display = ('id', 'title', 'user', 'category', 'condition', 'is_active', 'created_at')
@@ -20,7 +32,11 @@ class AdAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description', 'user__username')
     prepopulated_fields = {}
     list_editable = ('is_active', )
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = (
+        'created_at', 'updated_at',
+        'received_pending_count', 'received_accepted_count',
+        'received_rejected_count', 'sent_pending_count',
+    )
     
     fieldsets = (
         ('Основное', {
@@ -32,7 +48,12 @@ class AdAdmin(admin.ModelAdmin):
         ('Даты', {
             'fields': ('created_at', 'updated_at')
         }),
+        ('Предложения', {
+            'fields': ('received_pending_count', 'received_accepted_count',
+                       'received_rejected_count', 'sent_pending_count')
+        }),
     )
+    inlines = [AdImageInline]
 
 
 class ExchangeProposalAdmin(admin.ModelAdmin):
@@ -50,6 +71,53 @@ class ExchangeProposalAdmin(admin.ModelAdmin):
     raw_id_fields = ('ad_sender', 'ad_receiver')
 
 
+class TradeCycleLegInline(admin.TabularInline):
+    model = TradeCycleLeg
+    raw_id_fields = ('user', 'proposal', 'receives', 'gives')
+    extra = 0
+
+
+class TradeCycleAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели TradeCycle в административной панели.
+
+    Attributes:
+        list_display (tuple): Поля, отображаемые в списке обменов.
+        list_filter (tuple): Поля для фильтрации справа.
+        inlines (list): Участники обмена на странице обмена.
+    """
+
+    list_display = ('id', 'status', 'created_at')
+    list_filter = ('status',)
+    inlines = [TradeCycleLegInline]
+
+
+class ArchiveAdmin(admin.ModelAdmin):
+    """
+    Просмотр архивных записей (см. ``ads.archive``): только чтение.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedAdAdmin(ArchiveAdmin):
+    list_display = ('id', 'title', 'user', 'category', 'condition', 'archived_at')
+    list_filter = ('category', 'condition')
+    search_fields = ('title', 'user__username')
+
+
+class ArchivedProposalAdmin(ArchiveAdmin):
+    list_display = ('id', 'ad_sender_title', 'ad_receiver_title', 'status', 'archived_at')
+    list_filter = ('status',)
+
+
 # Регистрация моделей с кастомными настройками
 admin.site.register(Ad, AdAdmin)
-admin.site.register(ExchangeProposal, ExchangeProposalAdmin)
\ No newline at end of file
+admin.site.register(ExchangeProposal, ExchangeProposalAdmin)
+admin.site.register(TradeCycle, TradeCycleAdmin)
+admin.site.register(ArchivedAd, ArchivedAdAdmin)
+admin.site.register(ArchivedProposal, ArchivedProposalAdmin)
@@ -0,0 +1,194 @@
+"""
+Архив: неактивные объявления и завершённые предложения вне горячих таблиц.
+
+Объявление, неактивное дольше ``ADS_ARCHIVE_AFTER_DAYS`` дней, переносится
+в ``ArchivedAd`` вместе со всеми своими предложениями (в ``ArchivedProposal``).
+Переносятся пачками по ``ADS_ARCHIVE_BATCH_SIZE`` объявлений, каждая пачка —
+в своей транзакции: копии вставляются через ``bulk_create``, строки горячих
+таблиц удаляются одним ``DELETE`` на таблицу.
+
+Не переносятся объявления с ожидающими предложениями (входящими или
+исходящими) и участвующие в обменах по цепочке: такие предложения ещё
+могут измениться, а звенья цепочек ссылаются на объявления.
+
+Сигналы удаления при переносе не отправляются: их действия выполняются
+пачкой здесь же. Счётчики предложений у объявлений, оставшихся в ``Ad``,
+уменьшаются на перенесённые предложения: счётчики (и число предложений
+на вкладках «Моих предложений») совпадают с горячей таблицей.
+
+Первичные ключи сохраняются, поэтому адреса объявлений и предложений
+(``get_absolute_url``) продолжают работать: страницы читают архив, если
+строки нет в горячей таблице.
+"""
+
+import datetime
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, matching, services
+from .models import Ad, AdImage, ArchivedAd, ArchivedProposal, ExchangeProposal, TradeCycleLeg
+from .search import get_backend
+
+# Поля, общие у объявления и его архивной копии
+AD_FIELDS = ('id', 'user_id', 'title', 'description', 'image_url', 'category', 'condition',
+             'created_at', 'updated_at')
+
+
+def get_after_days():
+    return getattr(settings, 'ADS_ARCHIVE_AFTER_DAYS', 90)
+
+
+def get_batch_size():
+    return getattr(settings, 'ADS_ARCHIVE_BATCH_SIZE', 500)
+
+
+def candidates(days=None, now=None):
+    """Объявления, которые можно перенести в архив."""
+    days = get_after_days() if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    pending = ExchangeProposal.objects.filter(status='pending')
+    return Ad.objects.filter(is_active=False, updated_at__lt=cutoff).exclude(
+        pk__in=pending.values('ad_sender')
+    ).exclude(
+        pk__in=pending.values('ad_receiver')
+    ).exclude(
+        pk__in=TradeCycleLeg.objects.values('gives')
+    ).exclude(
+        pk__in=TradeCycleLeg.objects.values('receives')
+    )
+
+
+def archive_batch(days=None, batch_size=None, now=None):
+    """
+    Переносит в архив одну пачку объявлений и их предложения.
+
+    Returns:
+        tuple: (перенесено объявлений, перенесено предложений).
+    """
+    batch_size = batch_size or get_batch_size()
+    with transaction.atomic():
+        ads = list(candidates(days, now).select_for_update().order_by('pk')[:batch_size])
+        if not ads:
+            return 0, 0
+        ids = [ad.pk for ad in ads]
+        proposals = list(ExchangeProposal.objects.filter(
+            Q(ad_sender__in=ids) | Q(ad_receiver__in=ids)
+        ).select_related('ad_sender', 'ad_receiver'))
+
+        ArchivedAd.objects.bulk_create(
+            ArchivedAd(**{field: getattr(ad, field) for field in AD_FIELDS}) for ad in ads
+        )
+        ArchivedProposal.objects.bulk_create(
+            ArchivedProposal(
+                id=proposal.pk,
+                ad_sender=proposal.ad_sender_id,
+                ad_receiver=proposal.ad_receiver_id,
+                ad_sender_title=proposal.ad_sender.title,
+                ad_receiver_title=proposal.ad_receiver.title,
+                sender_id=proposal.ad_sender.user_id,
+                receiver_id=proposal.ad_receiver.user_id,
+                comment=proposal.comment,
+                status=proposal.status,
+                created_at=proposal.created_at,
+            )
+            for proposal in proposals
+        )
+
+        # Завершённые предложения уходят из счётчиков объявлений-получателей,
+        # оставшихся в Ad (ожидающих среди перенесённых нет, см. candidates)
+        deltas = defaultdict(lambda: defaultdict(int))
+        for proposal in proposals:
+            if proposal.ad_receiver_id not in ids:
+                deltas[proposal.ad_receiver_id][services.RECEIVED_COUNTERS[proposal.status]] -= 1
+        services.apply_counter_deltas(deltas)
+
+        # Зависимые строки без сигналов удаляются одним запросом на таблицу
+        matching.remove_ads(ids)
+        AdImage.objects.filter(ad__in=ids).delete()
+        _delete_rows(ExchangeProposal, [proposal.pk for proposal in proposals])
+        _delete_rows(Ad, ids)
+        get_backend().remove(ids)
+
+        caching.invalidate_ads(ids)
+        caching.invalidate_ad_pages(
+            {proposal.ad_sender_id for proposal in proposals}
+            | {proposal.ad_receiver_id for proposal in proposals}
+        )
+    return len(ads), len(proposals)
+
+
+def archive(days=None, batch_size=None, max_batches=None, now=None, progress=None):
+    """
+    Переносит в архив все подходящие объявления (или ``max_batches`` пачек).
+
+    Args:
+        progress: Вызывается после каждой пачки с её результатом
+            (объявлений, предложений).
+
+    Returns:
+        tuple: (перенесено объявлений, перенесено предложений).
+    """
+    total_ads = total_proposals = batches = 0
+    while max_batches is None or batches < max_batches:
+        ads, proposals = archive_batch(days, batch_size, now)
+        if not ads:
+            break
+        batches += 1
+        total_ads += ads
+        total_proposals += proposals
+        if progress is not None:
+            progress(ads, proposals)
+    return total_ads, total_proposals
+
+
+def _delete_rows(model, pks, chunk_size=500):
+    # Без сборщика каскадов и сигналов: их работа выполнена в archive_batch
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), chunk_size):
+            chunk = pks[start:start + chunk_size]
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk
+            )
+
+
+def table_stats(model):
+    """
+    Размер таблицы модели.
+
+    Returns:
+        tuple: (число строк, байт на диске или None, если БД не сообщает размер).
+    """
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    size = None
+    with connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'sqlite':
+                # Виртуальная таблица dbstat есть не во всех сборках SQLite
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                size = cursor.fetchone()[0]
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+                size = cursor.fetchone()[0]
+        except Exception:
+            size = None
+    return model.objects.count(), size
+
+
+def time_query(func, repeat=5):
+    """Лучшее время выполнения ``func`` из ``repeat`` попыток, секунды."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
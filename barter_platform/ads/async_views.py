@@ -0,0 +1,166 @@
+"""
+Асинхронные (ASGI) варианты представлений чтения.
+
+Под uvicorn синхронное представление занимает поток на всё время запросов
+к БД; эти варианты выполняют запросы через асинхронный ORM (``aget``,
+``acount``, ``async for``) и освобождают цикл событий на время ожидания.
+Запросы и бизнес-логика общие с синхронными представлениями из
+``ads.views``: здесь переопределено только получение данных.
+
+Включаются настройкой ``ASYNC_VIEWS`` (см. ``ads.urls``, ``api.urls``);
+шаблон по-прежнему рендерится синхронно — обработчик Django выполняет
+``TemplateResponse.render`` в потоке.
+"""
+
+import importlib
+import inspect
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.urls import clear_url_caches
+
+from . import caching, conditional, facets, views
+from .models import Ad
+
+
+class AsyncViewMixin:
+    """
+    Асинхронный ``dispatch``: пользователь загружается заранее через
+    ``request.auser()``, чтобы проверки доступа (``LoginRequiredMixin``)
+    и шаблоны не обращались к сессии в БД из цикла событий.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        response = super().dispatch(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+class AsyncListMixin(AsyncViewMixin):
+    """``ListView`` со страницей, выбранной асинхронно (``apaginate_queryset``)."""
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        self.paginated = await self.apaginate_queryset(self.object_list, page_size)
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginated
+
+
+class AdListView(AsyncListMixin, views.AdListView):
+    async def get(self, request, *args, **kwargs):
+        key = await caching.afacets_key(request, self.facet_params)
+        self.facet_counts = await cache.aget(key)
+        if self.facet_counts is None:
+            self.facet_counts = await facets.aget_counts(**self.get_facet_arguments())
+            await cache.aset(key, self.facet_counts, caching.get_timeout())
+        return await super().get(request, *args, **kwargs)
+
+    async def aget_etag(self):
+        return conditional.make_etag(await caching.afeed_key(self.request))
+
+    async def aget_last_modified(self):
+        return await caching.afeed_last_modified()
+
+    def get_facets(self):
+        return self.facet_counts
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.request.GET:
+            return await super().apaginate_queryset(queryset, page_size)
+
+        key = await caching.afeed_key(self.request)
+        page = await cache.aget(key)
+        if page is None:
+            paginator, page, object_list, is_paginated = await super().apaginate_queryset(
+                queryset, page_size
+            )
+            await cache.aset(key, page, caching.get_timeout())
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class AdDetailView(AsyncViewMixin, views.AdDetailView):
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.aget_object()
+        except Http404:
+            archived = await self.get_archived_queryset().afirst()
+            if archived is None:
+                raise
+            return self.render_archived(archived)
+        context = await self.aget_context_data()
+        return self.render_to_response(context)
+
+    async def aget_etag(self):
+        pk, user = self.kwargs['pk'], self.request.user
+        parts = [await caching.aad_key(pk, 'page'), user.pk]
+        if user.is_authenticated:
+            parts.append(await caching.asender_ad_key(user, pk))
+        return conditional.make_etag(*parts)
+
+    async def aget_object(self):
+        key = await caching.aad_key(self.kwargs['pk'], 'object')
+        ad = await cache.aget(key)
+        if ad is None:
+            try:
+                ad = await self.get_queryset().aget(pk=self.kwargs['pk'])
+            except Ad.DoesNotExist:
+                raise Http404('Объявление не найдено')
+            await cache.aset(key, ad, caching.get_timeout())
+        return ad
+
+    async def aget_context_data(self):
+        # get_context_data синхронного варианта обращается к БД — пропускаем его
+        context = super(views.AdDetailView, self).get_context_data()
+        user = self.request.user
+        ad = self.object
+
+        context['proposals'] = []
+        context['sender_ad'] = None
+        if user.is_authenticated and user.pk == ad.user_id:
+            key = await caching.aad_key(ad.pk, 'proposals')
+            proposals = await cache.aget(key)
+            if proposals is None:
+                proposals = [proposal async for proposal in self.get_proposals_queryset()]
+                await cache.aset(key, proposals, caching.get_timeout())
+            context['proposals'] = proposals
+        elif user.is_authenticated:
+            key = await caching.asender_ad_key(user, ad.pk)
+            cached = await cache.aget(key)
+            if cached is None:
+                cached = (await self.get_sender_ad_queryset().afirst(),)
+                await cache.aset(key, cached, caching.get_timeout())
+            context['sender_ad'], = cached
+        return context
+
+
+class MyProposalsView(AsyncListMixin, views.MyProposalsView):
+    async def get(self, request, *args, **kwargs):
+        if self.include_counts:
+            self.counts = await Ad.objects.filter(user=request.user).aaggregate(
+                **self.get_counts_arguments()
+            )
+        return await super().get(request, *args, **kwargs)
+
+    def get_counts(self):
+        return self.counts
+
+
+class MyProposalsFragmentView(MyProposalsView, views.MyProposalsFragmentView):
+    pass
+
+
+def reload_urlconf():
+    """
+    Перечитывает маршруты после смены ``settings.ASYNC_VIEWS``: варианты
+    представлений выбираются при импорте модулей ``urls``. Нужна тестам и
+    нагрузочному тесту, которые сравнивают оба варианта в одном процессе.
+    """
+    for name in ('ads.urls', 'api.urls', settings.ROOT_URLCONF):
+        importlib.reload(importlib.import_module(name))
+    clear_url_caches()
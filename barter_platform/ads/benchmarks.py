@@ -0,0 +1,497 @@
+"""
+Бенчмарк сайта: тестовые данные, сценарии и сравнение с базовой линией.
+
+``seed`` заполняет базу пользователями, объявлениями и предложениями с
+распределениями, похожими на реальные: у немногих пользователей много
+объявлений, популярные объявления получают большую часть предложений,
+свежих объявлений больше, чем старых. Генерация детерминирована
+(``seed``), поэтому замеры на разных машинах и ветках сравнимы.
+
+Сценарий — функция, которая по ``BenchmarkState`` строит очередной
+запрос (``Request``). Сценарии выполняются в процессе через тестовый
+клиент Django (``ClientTransport``, с подсчётом SQL-запросов) или по HTTP
+к запущенному серверу (``HTTPTransport``). ``compare`` сверяет результаты
+с базовой линией (JSON) и возвращает список регрессий.
+
+Команды: ``seed_data`` и ``run_benchmarks``.
+"""
+
+import json
+import math
+import random
+import statistics
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.cookies import SimpleCookie
+from itertools import accumulate
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPRedirectHandler, Request as URLRequest, build_opener
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Ad, ExchangeProposal
+from .services import reconcile_counters
+from .signals import ads_saved_in_bulk
+
+# Имена пользователей тестовых данных; по ним сценарии находят клиентов
+SEED_USER_PREFIX = 'seed_user_'
+SEED_PASSWORD = 'seed-password'
+
+# Доли категорий, состояний и статусов предложений
+CATEGORY_WEIGHTS = {'electronics': 30, 'clothing': 25, 'books': 20, 'home': 15, 'other': 10}
+CONDITION_WEIGHTS = {'used': 60, 'new': 25, 'broken': 15}
+STATUS_WEIGHTS = {'pending': 60, 'rejected': 30, 'accepted': 10}
+
+VOCABULARY = {
+    'electronics': ['телефон', 'ноутбук', 'наушники', 'планшет', 'фотоаппарат', 'монитор', 'колонка'],
+    'clothing': ['куртка', 'кроссовки', 'платье', 'свитер', 'джинсы', 'пальто', 'ботинки'],
+    'books': ['роман', 'учебник', 'детектив', 'словарь', 'энциклопедия', 'сборник', 'комикс'],
+    'home': ['чайник', 'лампа', 'кресло', 'сковорода', 'пылесос', 'ковёр', 'полка'],
+    'other': ['велосипед', 'палатка', 'гитара', 'самокат', 'коньки', 'рюкзак', 'мяч'],
+}
+ADJECTIVES = ['старый', 'новый', 'красный', 'большой', 'компактный', 'винтажный', 'детский', 'отличный']
+
+# Абсолютный допуск для задержек: доли миллисекунды — это шум
+LATENCY_SLACK_MS = 1.0
+
+Request = namedtuple('Request', 'method path data user')
+Request.__new__.__defaults__ = (None, None)
+
+
+def _zipf_weights(count, exponent=1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def _title(rng, category):
+    return f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(VOCABULARY[category])}'
+
+
+def seed(users=200, ads=2000, proposals=5000, random_seed=1, batch_size=1000):
+    """
+    Создаёт тестовых пользователей, объявления и предложения.
+
+    Счётчики предложений пересчитываются, объявления индексируются для
+    поиска и подбора обменов, как после массового импорта. Письма и
+    события о предложениях не отправляются.
+
+    Returns:
+        tuple: Число созданных пользователей, объявлений и предложений.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    start = User.objects.filter(username__startswith=SEED_USER_PREFIX).count()
+    password = make_password(SEED_PASSWORD)
+    owners = User.objects.bulk_create(
+        [User(username=f'{SEED_USER_PREFIX}{start + number}', password=password,
+              email=f'{SEED_USER_PREFIX}{start + number}@example.com')
+         for number in range(users)],
+        batch_size=batch_size,
+    )
+
+    # У немногих пользователей много объявлений, у большинства — одно-два
+    authors = rng.choices(owners, weights=_zipf_weights(len(owners)), k=ads)
+    categories = rng.choices(list(CATEGORY_WEIGHTS), weights=CATEGORY_WEIGHTS.values(), k=ads)
+    conditions = rng.choices(list(CONDITION_WEIGHTS), weights=CONDITION_WEIGHTS.values(), k=ads)
+    new_ads = []
+    for author, category, condition in zip(authors, categories, conditions):
+        title = _title(rng, category)
+        new_ads.append(Ad(
+            user=author, title=title, category=category, condition=condition,
+            description=f'{title}, {rng.choice(ADJECTIVES)} {rng.choice(VOCABULARY[category])} в придачу',
+            # Свежих объявлений больше: экспоненциальное распределение возраста
+            created_at=now - timedelta(days=min(rng.expovariate(1 / 20), 180)),
+        ))
+
+    # Популярные объявления получают большую часть предложений
+    popularity = _zipf_weights(len(new_ads), exponent=0.8)
+    rng.shuffle(popularity)
+    popularity = list(accumulate(popularity))
+    pairs = {}
+    for _ in range(proposals * 3):
+        if len(pairs) >= proposals:
+            break
+        receiver = rng.choices(range(len(new_ads)), cum_weights=popularity)[0]
+        sender = rng.randrange(len(new_ads))
+        if new_ads[sender].user_id == new_ads[receiver].user_id or (sender, receiver) in pairs:
+            continue
+        pairs[(sender, receiver)] = rng.choices(list(STATUS_WEIGHTS), weights=STATUS_WEIGHTS.values())[0]
+    # Принятый обмен скрывает оба объявления
+    for (sender, receiver), status in pairs.items():
+        if status == 'accepted':
+            new_ads[sender].is_active = new_ads[receiver].is_active = False
+    for (sender, receiver), status in pairs.items():
+        if status == 'pending' and not (new_ads[sender].is_active and new_ads[receiver].is_active):
+            pairs[(sender, receiver)] = 'rejected'
+
+    created_at = [ad.created_at for ad in new_ads]
+    with transaction.atomic():
+        new_ads = Ad.objects.bulk_create(new_ads, batch_size=batch_size)
+        # auto_now_add перезаписывает дату при вставке
+        for ad, value in zip(new_ads, created_at):
+            ad.created_at = value
+        Ad.objects.bulk_update(new_ads, ['created_at'], batch_size=batch_size)
+        ads_saved_in_bulk(new_ads)
+
+        new_proposals = []
+        for (sender, receiver), status in pairs.items():
+            newest = max(new_ads[sender].created_at, new_ads[receiver].created_at)
+            new_proposals.append(ExchangeProposal(
+                ad_sender=new_ads[sender], ad_receiver=new_ads[receiver], status=status,
+                comment=f'Меняю на {new_ads[sender].title.lower()}',
+                created_at=newest + (now - newest) * rng.random(),
+            ))
+        created_at = [proposal.created_at for proposal in new_proposals]
+        new_proposals = ExchangeProposal.objects.bulk_create(new_proposals, batch_size=batch_size)
+        for proposal, value in zip(new_proposals, created_at):
+            proposal.created_at = value
+        ExchangeProposal.objects.bulk_update(new_proposals, ['created_at'], batch_size=batch_size)
+        reconcile_counters([ad.pk for ad in new_ads], batch_size=batch_size)
+    return len(owners), len(new_ads), len(new_proposals)
+
+
+def clear():
+    """Удаляет тестовых пользователей вместе с их объявлениями и предложениями."""
+    users = User.objects.filter(username__startswith=SEED_USER_PREFIX)
+    count = users.count()
+    users.delete()
+    return count
+
+
+class BenchmarkState:
+    """
+    Данные, из которых сценарии выбирают параметры запросов.
+
+    Attributes:
+        rng (random.Random): Генератор со стартовым зерном замера.
+        ads (list): Активные объявления тестовых пользователей: (id, username).
+        pending (list): Ожидающие предложения: (id, отправитель, получатель, username получателя).
+        pairs (set): Пары объявлений (отправитель, получатель), между которыми уже есть предложение.
+        closed_ads (set): Объявления, скрытые принятыми в ходе замера предложениями.
+    """
+
+    def __init__(self, random_seed=1):
+        self.rng = random.Random(random_seed)
+        seeded = Ad.objects.filter(user__username__startswith=SEED_USER_PREFIX)
+        self.ads = list(seeded.filter(is_active=True).order_by('pk').values_list('pk', 'user__username'))
+        self.pending = list(
+            ExchangeProposal.objects.filter(
+                status='pending', ad_receiver__in=seeded, ad_sender__is_active=True, ad_receiver__is_active=True,
+            ).order_by('pk').values_list('pk', 'ad_sender_id', 'ad_receiver_id', 'ad_receiver__user__username')
+        )
+        self.rng.shuffle(self.pending)
+        self.pairs = set(ExchangeProposal.objects.filter(ad_receiver__in=seeded)
+                         .values_list('ad_sender_id', 'ad_receiver_id'))
+        self.closed_ads = set()
+
+    def random_ad(self):
+        return self.rng.choice(self.ads)
+
+    def take_pending(self):
+        """Следующее ожидающее предложение, объявления которого ещё открыты."""
+        while self.pending:
+            proposal = self.pending.pop()
+            if self.closed_ads.isdisjoint(proposal[1:3]):
+                return proposal
+        return None
+
+
+SCENARIOS = {}
+
+
+def scenario(name, description):
+    """Регистрирует функцию ``(state) -> Request | None`` как сценарий."""
+    def decorator(func):
+        func.description = description
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def _filters(rng):
+    params = {}
+    if rng.random() < 0.5:
+        params['category'] = rng.choice(list(CATEGORY_WEIGHTS))
+    if rng.random() < 0.3:
+        params['condition'] = rng.choice(list(CONDITION_WEIGHTS))
+    return params
+
+
+@scenario('feed', 'Лента с фильтрами по категории и состоянию')
+def feed(state):
+    params = _filters(state.rng)
+    return Request('GET', '/' + (f'?{urlencode(params)}' if params else ''))
+
+
+@scenario('search', 'Полнотекстовый поиск в ленте')
+def search(state):
+    words = VOCABULARY[state.rng.choice(list(VOCABULARY))]
+    params = {'q': state.rng.choice(words), **_filters(state.rng)}
+    return Request('GET', f'/?{urlencode(params)}')
+
+
+@scenario('detail', 'Страница объявления (владелец видит полученные предложения)')
+def detail(state):
+    pk, username = state.random_ad()
+    user = username if state.rng.random() < 0.3 else None
+    return Request('GET', f'/{pk}/', user=user)
+
+
+@scenario('create_proposal', 'Отправка предложения обмена')
+def create_proposal(state):
+    for _ in range(100):
+        (sender, owner), (receiver, receiver_owner) = state.random_ad(), state.random_ad()
+        if owner != receiver_owner and (sender, receiver) not in state.pairs:
+            state.pairs.add((sender, receiver))
+            return Request('POST', f'/propose/{sender}/to/{receiver}/',
+                           {'comment': 'Предлагаю обмен'}, user=owner)
+    return None
+
+
+@scenario('accept', 'Принятие предложения (скрывает объявления, отклоняет конкурирующие)')
+def accept(state):
+    proposal = state.take_pending()
+    if proposal is None:
+        return None
+    pk, sender, receiver, username = proposal
+    state.closed_ads.update((sender, receiver))
+    return Request('POST', f'/proposal/{pk}/accept/', user=username)
+
+
+@scenario('reject', 'Отклонение предложения')
+def reject(state):
+    proposal = state.take_pending()
+    if proposal is None:
+        return None
+    return Request('POST', f'/proposal/{proposal[0]}/reject/', user=proposal[3])
+
+
+@scenario('api_ads', 'Список объявлений API')
+def api_ads(state):
+    return Request('GET', '/api/ads/')
+
+
+@scenario('api_proposals', 'Список предложений API')
+def api_proposals(state):
+    return Request('GET', '/api/proposals/')
+
+
+class ClientTransport:
+    """
+    Запросы через тестовый клиент Django в текущем процессе.
+
+    Считает SQL-запросы каждого запроса. Изменения каждого сценария
+    откатываются (``rollback``), поэтому повторные замеры идут на тех же
+    данных; обработчики ``on_commit`` (фоновые задачи) при этом не
+    выполняются.
+    """
+
+    rolls_back = True
+
+    def __init__(self):
+        self.clients = {None: Client()}
+
+    def prepare(self, requests):
+        # Вход до замера: сессии создаются вне откатываемой транзакции
+        for username in {request.user for request in requests} - self.clients.keys():
+            client = Client()
+            client.force_login(User.objects.get(username=username))
+            self.clients[username] = client
+
+    def run(self, requests, concurrency=1):
+        results = []
+        with transaction.atomic():
+            for request in requests:
+                client = self.clients[request.user]
+                # Журнал запросов ограничен 9000 записями — счёт идёт с нуля
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    start = perf_counter()
+                    response = client.generic(
+                        request.method, request.path,
+                        urlencode(request.data or {}), 'application/x-www-form-urlencoded',
+                    )
+                    duration = perf_counter() - start
+                results.append((duration, response.status_code, len(queries)))
+            transaction.set_rollback(True)
+        return results
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPTransport:
+    """
+    Запросы по HTTP к запущенному серверу (``runserver``, gunicorn, uvicorn).
+
+    Сервер должен работать с той же базой: сессии тестовых пользователей
+    создаются в ней напрямую. Изменения не откатываются. SQL-запросы
+    сервера не считаются.
+    """
+
+    rolls_back = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(_NoRedirect)
+        self.cookies = {None: ''}
+        self.csrf_token = ''
+
+    def prepare(self, requests):
+        if not self.csrf_token:
+            # Форма регистрации выставляет cookie csrftoken
+            cookie = SimpleCookie()
+            for header in self._open(URLRequest(f'{self.base_url}/register/'))[1].get_all('Set-Cookie') or []:
+                cookie.load(header)
+            self.csrf_token = cookie[settings.CSRF_COOKIE_NAME].value
+            self.cookies[None] = f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+        for username in {request.user for request in requests} - self.cookies.keys():
+            client = Client()
+            client.force_login(User.objects.get(username=username))
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            self.cookies[username] = (f'{settings.SESSION_COOKIE_NAME}={session}; '
+                                      f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}')
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers
+        except HTTPError as error:
+            return error.code, error.headers
+
+    def send(self, request):
+        data = urlencode(request.data or {}).encode() if request.method == 'POST' else None
+        headers = {'Cookie': self.cookies[request.user], 'X-CSRFToken': self.csrf_token,
+                   'Referer': f'{self.base_url}/'}
+        start = perf_counter()
+        status, _ = self._open(URLRequest(self.base_url + request.path, data, headers, method=request.method))
+        return perf_counter() - start, status, None
+
+    def run(self, requests, concurrency=1):
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(self.send, requests))
+
+
+def _requests(name, state, count):
+    requests = []
+    for _ in range(count):
+        request = SCENARIOS[name](state)
+        if request is None:
+            break
+        requests.append(request)
+    return requests
+
+
+def run(name, state, transport, count, warmup=0, concurrency=1, repeat=1):
+    """
+    Выполняет ``count`` запросов сценария (после ``warmup`` неучитываемых).
+
+    Замер повторяется ``repeat`` раз; в результат идёт лучшее значение
+    каждой метрики (как в ``timeit``), чтобы шум машины меньше влиял на
+    сравнение с базовой линией.
+
+    Returns:
+        dict: Метрики сценария (см. ``summarize``) или None, если для
+        сценария не нашлось данных.
+    """
+    summaries, requests = [], None
+    for _ in range(repeat):
+        # Изменения, которые не откатываются, нельзя повторить теми же запросами
+        if requests is None or not transport.rolls_back:
+            requests = _requests(name, state, warmup + count)
+        if len(requests) <= warmup:
+            break
+        transport.prepare(requests)
+        transport.run(requests[:warmup], concurrency)
+        start = perf_counter()
+        results = transport.run(requests[warmup:], concurrency)
+        summaries.append(summarize(results, perf_counter() - start))
+    return best_of(summaries) if summaries else None
+
+
+def _percentile(values, fraction):
+    return values[max(math.ceil(len(values) * fraction) - 1, 0)]
+
+
+def summarize(results, elapsed):
+    timings = sorted(duration for duration, _, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'throughput': round(len(results) / elapsed, 1),
+        'p50_ms': round(statistics.median(timings) * 1000, 2),
+        'p95_ms': round(_percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(timings, 0.99) * 1000, 2),
+        'queries_mean': round(statistics.mean(queries), 1) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        'errors': sum(status >= 400 for _, status, _ in results),
+    }
+
+
+def best_of(summaries):
+    """Лучшие значения метрик из нескольких повторов замера."""
+    best = dict(summaries[0])
+    for summary in summaries[1:]:
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            best[key] = min(best[key], summary[key])
+        best['throughput'] = max(best['throughput'], summary['throughput'])
+        best['errors'] = max(best['errors'], summary['errors'])
+    return best
+
+
+def compare(results, baseline, tolerance=0.5):
+    """
+    Сравнивает метрики сценариев с базовой линией.
+
+    Регрессия — ошибки в ответах, больше SQL-запросов на запрос, чем в
+    базовой линии (число запросов не зависит от машины и сравнивается
+    строго), медиана или p95 выше базовых больше чем на ``tolerance`` (и
+    на ``LATENCY_SLACK_MS``) или пропускная способность ниже на ``tolerance``.
+
+    Returns:
+        list: Описания регрессий (пустой — регрессий нет).
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if metrics is None:
+            continue
+        if metrics['errors']:
+            regressions.append(f'{name}: ошибок в ответах — {metrics["errors"]}')
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        if None not in (metrics['queries_max'], base.get('queries_max')) \
+                and metrics['queries_max'] > base['queries_max']:
+            regressions.append(f'{name}: SQL-запросов {metrics["queries_max"]} '
+                               f'(в базовой линии {base["queries_max"]})')
+        for percentile in ('p50', 'p95'):
+            value, base_value = metrics[f'{percentile}_ms'], base[f'{percentile}_ms']
+            if value > max(base_value * (1 + tolerance), base_value + LATENCY_SLACK_MS):
+                regressions.append(f'{name}: {percentile} {value} мс (в базовой линии {base_value} мс)')
+        if metrics['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{name}: {metrics["throughput"]} запр/с '
+                               f'(в базовой линии {base["throughput"]} запр/с)')
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_baseline(path, results, **meta):
+    data = {'meta': meta, 'scenarios': {name: metrics for name, metrics in results.items() if metrics}}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
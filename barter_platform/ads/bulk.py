@@ -0,0 +1,185 @@
+"""
+Массовый импорт и экспорт объявлений в CSV и JSONL.
+
+Импорт читает строки потоком, проверяет каждую (по умолчанию через
+``AdForm``, API передаёт свою проверку через сериализатор), вставляет
+объявления пачками через ``bulk_create`` и продолжает работу после
+ошибочных строк, собирая ошибки по номерам строк.
+
+Экспорт отдаёт генератор текстовых фрагментов: строки выбираются через
+``values_list().iterator(chunk_size=...)``, поэтому память не зависит от
+размера таблицы. Генератор подходит и для файла, и для
+``StreamingHttpResponse``.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .forms import AdForm
+from .models import Ad
+from .signals import ads_saved_in_bulk
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+EXPORT_FIELDS = (
+    'id', 'user', 'title', 'description', 'image_url',
+    'category', 'condition', 'is_active', 'created_at',
+)
+
+
+class BulkFormatError(ValueError):
+    """Неизвестный формат файла."""
+
+
+@dataclass
+class ImportResult:
+    """
+    Итог импорта.
+
+    Attributes:
+        created (int): Сколько объявлений создано.
+        errors (list): Ошибки вида ``{'line': номер, 'errors': {поле: [текст]}}``.
+    """
+
+    created: int = 0
+    errors: list = field(default_factory=list)
+
+
+def guess_format(filename, default='csv'):
+    """Формат по расширению имени файла."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def read_rows(lines, fmt):
+    """
+    Разбирает текстовый поток построчно.
+
+    Возвращает пары (номер строки, данные); вместо данных может быть
+    исключение ``ValueError``, если строку не удалось разобрать.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield number, ValueError(f'Некорректный JSON: {error}')
+                continue
+            if not isinstance(row, dict):
+                row = ValueError('Строка должна быть JSON-объектом')
+            yield number, row
+    else:
+        raise BulkFormatError(fmt)
+
+
+def form_validator(user):
+    """
+    Проверка строки через ``AdForm``; все объявления принадлежат ``user``.
+
+    Валидатор возвращает (объявление, None) или (None, ошибки).
+    """
+    def validate(row):
+        form = AdForm(data=row)
+        if not form.is_valid():
+            return None, form.errors.get_json_data()
+        ad = form.save(commit=False)
+        ad.user = user
+        return ad, None
+    return validate
+
+
+def import_ads(rows, validate, batch_size=500, dry_run=False):
+    """
+    Импортирует объявления пачками.
+
+    Args:
+        rows: Пары (номер строки, данные) из ``read_rows``.
+        validate: Валидатор, например ``form_validator(user)``.
+        batch_size: Размер пачки для ``bulk_create``.
+        dry_run: Только проверить строки, ничего не сохраняя.
+
+    Returns:
+        ImportResult: Число созданных объявлений и ошибки по строкам.
+    """
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        if not dry_run:
+            with transaction.atomic():
+                created = Ad.objects.bulk_create(batch, batch_size=batch_size)
+                ads_saved_in_bulk(created)
+        result.created += len(batch)
+        batch.clear()
+
+    for number, row in rows:
+        if isinstance(row, Exception):
+            result.errors.append({'line': number, 'errors': {'__all__': [str(row)]}})
+            continue
+        ad, errors = validate(row)
+        if errors:
+            result.errors.append({'line': number, 'errors': errors})
+            continue
+        batch.append(ad)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+def _export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_ads(queryset, fmt, chunk_size=2000, flush_size=64 * 1024):
+    """
+    Генератор фрагментов файла экспорта.
+
+    Строки копятся в буфере и отдаются фрагментами примерно по
+    ``flush_size`` символов. Поле ``user`` выгружается как первичный ключ
+    пользователя — в том же виде его принимает API.
+    """
+    if fmt not in FORMATS:
+        raise BulkFormatError(fmt)
+    columns = [name if name != 'user' else 'user_id' for name in EXPORT_FIELDS]
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_FIELDS)
+
+    def write(row):
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n')
+
+    for row in rows:
+        write([_export_value(value) for value in row])
+        if buffer.tell() >= flush_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
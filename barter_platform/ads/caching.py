@@ -0,0 +1,185 @@
+"""
+Кеширование ленты и страниц объявлений с инвалидацией по версиям.
+
+Ключи кеша содержат номер версии: общий для ленты и отдельный для каждого
+объявления. Сигналы ``Ad``/``ExchangeProposal`` (см. ``ads.signals``) лишь
+увеличивают версии, а старые записи перестают читаться и истекают по
+таймауту. Лента зависит от пользователя (в ней нет его собственных
+объявлений), поэтому в её ключ входит ``user.pk``.
+
+Версия увеличивается сразу и ещё раз после фиксации транзакции: иначе
+параллельный запрос мог бы между ними закешировать старые данные. Если
+настроены реплики (``ads.routers``), то и в третий раз — фоновой задачей
+через ``DATABASE_REPLICA_STICKY_SECONDS``: запрос, прочитавший отстающую
+реплику, мог закешировать данные до изменения.
+
+Вместе с версией ленты обновляется отметка времени её последнего
+изменения: по ней ленте выставляется ``Last-Modified`` (см.
+``ads.conditional``).
+"""
+
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from jobs.queue import enqueue
+
+from . import routers
+from .models import Ad
+
+FEED_VERSION_KEY = 'ads:feed:version'
+FEED_MODIFIED_KEY = 'ads:feed:modified'
+AD_VERSION_KEY = 'ads:ad:{pk}:version'
+
+
+def get_timeout():
+    return getattr(settings, 'ADS_CACHE_TIMEOUT', 300)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Версия, вытесненная из кеша, не должна начаться заново с 1:
+        # иначе снова стали бы читаться старые записи
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def _aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def bump_versions(keys):
+    for key in keys:
+        _bump_version(key)
+    if FEED_VERSION_KEY in keys:
+        cache.set(FEED_MODIFIED_KEY, time.time(), None)
+
+
+def _bump(keys):
+    bump_versions(keys)
+    transaction.on_commit(lambda: bump_versions(keys))
+    if routers.get_replicas():
+        enqueue('ads.bump_cache_versions', delay=routers.get_sticky_seconds(), keys=keys)
+
+
+def feed_version():
+    return _get_version(FEED_VERSION_KEY)
+
+
+def ad_version(pk):
+    return _get_version(AD_VERSION_KEY.format(pk=pk))
+
+
+def _as_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def feed_last_modified():
+    """
+    Время последнего изменения ленты.
+
+    Отметку обновляет ``bump_versions``; если она вытеснена из кеша,
+    берётся ``MAX(updated_at)`` объявлений.
+    """
+    modified = cache.get(FEED_MODIFIED_KEY)
+    if modified is None:
+        latest = Ad.objects.aggregate(latest=Max('updated_at'))['latest']
+        modified = latest.timestamp() if latest else time.time()
+        if not cache.add(FEED_MODIFIED_KEY, modified, None):
+            modified = cache.get(FEED_MODIFIED_KEY, modified)
+    return _as_datetime(modified)
+
+
+def invalidate_ads(pks):
+    """Сбрасывает закешированные страницы объявлений и ленту."""
+    _bump([FEED_VERSION_KEY] + [AD_VERSION_KEY.format(pk=pk) for pk in set(pks)])
+
+
+def invalidate_ad_pages(pks):
+    """Сбрасывает только страницы объявлений (лента не меняется)."""
+    _bump([AD_VERSION_KEY.format(pk=pk) for pk in set(pks)])
+
+
+def _user_key(user):
+    return str(user.pk) if user.is_authenticated else 'anon'
+
+
+def _params_digest(request, names=None):
+    params = sorted(
+        (key, value) for key, values in request.GET.lists() for value in values
+        if names is None or key in names
+    )
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+def feed_key(request):
+    """Ключ страницы ленты: версия, пользователь и все GET-параметры."""
+    return f'ads:feed:{feed_version()}:{_user_key(request.user)}:{_params_digest(request)}'
+
+
+def facets_key(request, names):
+    """Ключ счётчиков фасетов: версия ленты, пользователь и параметры ``names``."""
+    return f'ads:facets:{feed_version()}:{_user_key(request.user)}:{_params_digest(request, names)}'
+
+
+def ad_key(pk, part):
+    """Ключ данных страницы объявления (``part`` — что именно кешируется)."""
+    return f'ads:ad:{pk}:{ad_version(pk)}:{part}'
+
+
+def sender_ad_key(user, pk):
+    """Ключ объявления пользователя, которое он предложит в обмен на ``pk``."""
+    return f'ads:sender:{feed_version()}:{_user_key(user)}:{pk}'
+
+
+# Асинхронные варианты для async-представлений (``ads.async_views``):
+# версии читаются через ``cache.aget``, не блокируя цикл событий
+
+async def afeed_key(request):
+    version = await _aget_version(FEED_VERSION_KEY)
+    return f'ads:feed:{version}:{_user_key(request.user)}:{_params_digest(request)}'
+
+
+async def afeed_last_modified():
+    modified = await cache.aget(FEED_MODIFIED_KEY)
+    if modified is None:
+        latest = (await Ad.objects.aaggregate(latest=Max('updated_at')))['latest']
+        modified = latest.timestamp() if latest else time.time()
+        if not await cache.aadd(FEED_MODIFIED_KEY, modified, None):
+            modified = await cache.aget(FEED_MODIFIED_KEY, modified)
+    return _as_datetime(modified)
+
+
+async def afacets_key(request, names):
+    version = await _aget_version(FEED_VERSION_KEY)
+    return f'ads:facets:{version}:{_user_key(request.user)}:{_params_digest(request, names)}'
+
+
+async def aad_key(pk, part):
+    version = await _aget_version(AD_VERSION_KEY.format(pk=pk))
+    return f'ads:ad:{pk}:{version}:{part}'
+
+
+async def asender_ad_key(user, pk):
+    version = await _aget_version(FEED_VERSION_KEY)
+    return f'ads:sender:{version}:{_user_key(user)}:{pk}'
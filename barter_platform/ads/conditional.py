@@ -0,0 +1,106 @@
+"""
+Условные GET-запросы: ETag и Last-Modified без рендеринга страницы.
+
+Валидаторы считаются из версий кеша (``ads.caching``), которые сигналы
+увеличивают при каждом изменении объявления или предложений по нему, и из
+отметки времени последнего изменения ленты. Если ``If-None-Match`` или
+``If-Modified-Since`` запроса совпадает, возвращается 304 ещё до выборки
+данных, рендеринга шаблона и сериализации.
+
+ETag строгий и зависит от пользователя (страницы различаются для
+владельца, других пользователей и анонимов), поэтому ответы помечаются
+``Cache-Control: private, no-cache``: браузер хранит страницу, но каждый
+раз переспрашивает сервер.
+"""
+
+import hashlib
+import inspect
+import time
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def make_etag(*parts):
+    """Строгий ETag (в кавычках) из частей ключа."""
+    return '"%s"' % hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Ответ 304, если у клиента актуальная копия; иначе None."""
+    if request.method not in SAFE_METHODS:
+        return None
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """
+    Добавляет ``ETag``/``Last-Modified`` к успешному ответу на GET.
+
+    ``Last-Modified`` точен до секунды, поэтому не отправляется, пока не
+    закончилась секунда последнего изменения: иначе изменение в ту же
+    секунду после ответа не изменило бы его и клиент получил бы 304.
+    """
+    if (etag or last_modified) and response.status_code in (200, 304):
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        if last_modified and int(last_modified.timestamp()) < int(time.time()):
+            response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для GET-представления (синхронного и асинхронного).
+
+    Подклассы переопределяют ``get_etag``/``get_last_modified``; асинхронные
+    варианты представлений — ``aget_etag``/``aget_last_modified``, если
+    валидатору нужна БД. Валидаторы не считаются, пока у пользователя есть
+    непоказанные сообщения (``django.contrib.messages``): их выводит только
+    полный ответ.
+    """
+
+    def get_etag(self):
+        return None
+
+    def get_last_modified(self):
+        return None
+
+    async def aget_etag(self):
+        return self.get_etag()
+
+    async def aget_last_modified(self):
+        return self.get_last_modified()
+
+    def is_conditional(self, request):
+        return request.method in SAFE_METHODS and not len(get_messages(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._adispatch(request, *args, **kwargs)
+        if not self.is_conditional(request):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_etag(), self.get_last_modified()
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    async def _adispatch(self, request, *args, **kwargs):
+        etag = last_modified = response = None
+        if self.is_conditional(request):
+            etag, last_modified = await self.aget_etag(), await self.aget_last_modified()
+            response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        return set_validators(response, etag, last_modified)
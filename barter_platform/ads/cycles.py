@@ -0,0 +1,286 @@
+"""
+Поиск многосторонних обменов (циклов A→B→C→A) среди ожидающих предложений.
+
+Граф строится по пользователям: ожидающее предложение между активными
+объявлениями даёт ребро «владелец отправителя → владелец получателя»
+(отправитель хочет объявление получателя). Цикл из k пользователей —
+обмен, в котором каждый получает то, что хотел, и отдаёт своё объявление,
+которое хотел предыдущий участник.
+
+Поиск инкрементальный: при появлении ребра u→v ищутся только циклы через
+это ребро, то есть пути v ⇝ u длиной до ``max_length - 1``. Сначала
+обратным обходом в ширину от u считаются расстояния до u (по одному
+запросу на уровень), затем рёбра вперёд от v загружаются по уровням и
+обход в глубину идёт только по вершинам, из которых u ещё достижима в
+пределах оставшейся длины. Каждый цикл
+находится ровно один раз — при добавлении последнего ребра. При уходе
+предложения из статуса «ожидает» циклы с ним помечаются неактуальными
+(``break_cycles``), полный пересчёт не нужен.
+
+Граф бывает в памяти (``ProposalGraph`` — для полного прохода и бенчмарка)
+и в базе данных (``DatabaseGraph`` — для обработки одного предложения).
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .models import ExchangeProposal, TradeCycle, TradeCycleLeg
+
+MIN_LENGTH = 3
+
+
+def get_max_length():
+    return getattr(settings, 'ADS_TRADE_CYCLE_MAX_LENGTH', 4)
+
+
+def get_limit():
+    return getattr(settings, 'ADS_TRADE_CYCLE_LIMIT', 10)
+
+
+class ProposalGraph:
+    """
+    Граф пользователей в памяти.
+
+    Между двумя пользователями может быть несколько предложений, поэтому
+    для каждого ребра хранится их число: ребро исчезает вместе с последним.
+    """
+
+    def __init__(self):
+        self.successors = defaultdict(set)
+        self.predecessors = defaultdict(set)
+        self.multiplicity = defaultdict(int)
+
+    def __len__(self):
+        return len(self.multiplicity)
+
+    def add_edge(self, source, target):
+        """Добавляет предложение; True, если ребро появилось впервые."""
+        self.multiplicity[source, target] += 1
+        if self.multiplicity[source, target] > 1:
+            return False
+        self.successors[source].add(target)
+        self.predecessors[target].add(source)
+        return True
+
+    def remove_edge(self, source, target):
+        """Убирает предложение; True, если ребро исчезло."""
+        count = self.multiplicity.get((source, target), 0)
+        if count > 1:
+            self.multiplicity[source, target] = count - 1
+            return False
+        if count:
+            del self.multiplicity[source, target]
+            self.successors[source].discard(target)
+            self.predecessors[target].discard(source)
+        return bool(count)
+
+    def in_edges(self, nodes):
+        return {node: self.predecessors.get(node, ()) for node in nodes}
+
+    def out_edges(self, nodes, within):
+        return {
+            node: [target for target in self.successors.get(node, ()) if target in within]
+            for node in nodes
+        }
+
+    @classmethod
+    def from_database(cls):
+        graph = cls()
+        for source, target in _pending_edges().iterator(chunk_size=10000):
+            graph.add_edge(source, target)
+        return graph
+
+
+def _pending_edges(proposals=None):
+    """Пары (владелец отправителя, владелец получателя) ожидающих предложений."""
+    if proposals is None:
+        proposals = ExchangeProposal.objects.all()
+    return proposals.filter(
+        status='pending', ad_sender__is_active=True, ad_receiver__is_active=True
+    ).exclude(ad_sender__user=F('ad_receiver__user')).values_list(
+        'ad_sender__user', 'ad_receiver__user'
+    )
+
+
+class DatabaseGraph:
+    """Граф пользователей, рёбра которого читаются из базы по мере обхода."""
+
+    def in_edges(self, nodes):
+        edges = defaultdict(set)
+        for source, target in _pending_edges().filter(ad_receiver__user__in=nodes).distinct():
+            edges[target].add(source)
+        return edges
+
+    def out_edges(self, nodes, within):
+        edges = defaultdict(list)
+        rows = _pending_edges().filter(
+            ad_sender__user__in=nodes, ad_receiver__user__in=within
+        ).distinct()
+        for source, target in rows:
+            edges[source].append(target)
+        return edges
+
+
+def find_cycles(graph, source, target, max_length=None, limit=None):
+    """
+    Циклы пользователей, проходящие через ребро ``source → target``.
+
+    Returns:
+        list: Циклы как списки пользователей, начиная с ``source``;
+        не больше ``limit``, длиной от ``MIN_LENGTH`` до ``max_length``.
+    """
+    max_length = max_length or get_max_length()
+    limit = limit or get_limit()
+    if source == target:
+        return []
+
+    # Расстояния до source по обратным рёбрам, не дальше max_length - 1
+    distance = {source: 0}
+    frontier = {source}
+    for depth in range(1, max_length):
+        next_frontier = set()
+        for predecessors in graph.in_edges(frontier).values():
+            for node in predecessors:
+                if node not in distance:
+                    distance[node] = depth
+                    next_frontier.add(node)
+        frontier = next_frontier
+        if not frontier:
+            break
+    if target not in distance:
+        return []
+
+    # Рёбра вперёд от target загружаются по уровням и только для вершин,
+    # из которых source достижима за оставшееся число рёбер
+    within = set(distance)
+    adjacency = {}
+    frontier = {target}
+    for depth in range(max_length - 1):
+        edges = graph.out_edges(frontier, within)
+        next_frontier = set()
+        for node in frontier:
+            adjacency[node] = edges.get(node, ())
+            for following in adjacency[node]:
+                if (following != source and following not in adjacency
+                        and depth + 2 + distance[following] <= max_length):
+                    next_frontier.add(following)
+        frontier = next_frontier - adjacency.keys()
+        if not frontier:
+            break
+
+    cycles = []
+    path = [source, target]
+    on_path = {source, target}
+
+    def visit(node):
+        for following in adjacency.get(node, ()):
+            if len(cycles) >= limit:
+                return
+            if following == source:
+                if len(path) >= MIN_LENGTH:
+                    cycles.append(list(path))
+                continue
+            if following in on_path or len(path) + distance[following] > max_length:
+                continue
+            path.append(following)
+            on_path.add(following)
+            visit(following)
+            path.pop()
+            on_path.discard(following)
+
+    visit(target)
+    return cycles
+
+
+def _choose_proposals(user_cycles):
+    """
+    Конкретные предложения для рёбер циклов: по самому раннему ожидающему
+    предложению на каждую пару пользователей. Выбор устойчив, поэтому новое
+    предложение между теми же пользователями не порождает дубликат цепочки.
+    """
+    pairs = {(cycle[i], cycle[(i + 1) % len(cycle)]) for cycle in user_cycles for i in range(len(cycle))}
+    condition = Q()
+    for sender_user, receiver_user in pairs:
+        condition |= Q(ad_sender__user=sender_user, ad_receiver__user=receiver_user)
+    rows = ExchangeProposal.objects.filter(
+        condition, status='pending', ad_sender__is_active=True, ad_receiver__is_active=True
+    ).order_by('-created_at', '-id').values_list(
+        'id', 'ad_sender__user', 'ad_receiver__user', 'ad_receiver'
+    )
+    chosen = {}
+    for pk, sender_user, receiver_user, receiver_ad in rows:
+        chosen[sender_user, receiver_user] = (pk, receiver_ad)
+    return chosen
+
+
+def save_cycles(user_cycles):
+    """
+    Сохраняет найденные циклы как ``TradeCycle``; уже известные пропускаются.
+
+    Returns:
+        list: Созданные обмены.
+    """
+    if not user_cycles:
+        return []
+    chosen = _choose_proposals(user_cycles)
+    created = []
+    for cycle in user_cycles:
+        edges = [(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
+        if any(edge not in chosen for edge in edges):
+            continue
+        key = '-'.join(str(pk) for pk in sorted(chosen[edge][0] for edge in edges))
+        if TradeCycle.objects.filter(key=key).exists():
+            continue
+        try:
+            with transaction.atomic():
+                trade = TradeCycle.objects.create(key=key)
+                TradeCycleLeg.objects.bulk_create([
+                    TradeCycleLeg(
+                        cycle=trade,
+                        position=position,
+                        user_id=user,
+                        proposal_id=chosen[edges[position]][0],
+                        receives_id=chosen[edges[position]][1],
+                        # Отдаёт то, что хотел предыдущий участник
+                        gives_id=chosen[edges[position - 1]][1],
+                    )
+                    for position, user in enumerate(cycle)
+                ])
+        except IntegrityError:
+            continue  # ту же цепочку сохранил параллельный процесс
+        created.append(trade)
+    return created
+
+
+def detect_for_proposals(pks):
+    """Ищет и сохраняет циклы через рёбра новых предложений."""
+    graph = DatabaseGraph()
+    created = []
+    for source, target in _pending_edges(ExchangeProposal.objects.filter(pk__in=pks)).distinct():
+        created += save_cycles(find_cycles(graph, source, target))
+    return created
+
+
+def break_cycles(proposal_ids):
+    """Помечает неактуальными ожидающие обмены с этими предложениями."""
+    if proposal_ids:
+        TradeCycle.objects.filter(
+            status='pending', legs__proposal__in=list(proposal_ids)
+        ).update(status='broken')
+
+
+def scan_all(max_length=None, limit=None):
+    """
+    Полный проход: рёбра добавляются в граф в памяти по одному, и для
+    каждого нового ребра ищутся циклы через него. Каждый цикл находится
+    один раз; сохраняются только ещё неизвестные.
+    """
+    graph = ProposalGraph()
+    found = []
+    for source, target in _pending_edges().order_by('created_at', 'id').iterator(chunk_size=10000):
+        if graph.add_edge(source, target):
+            found += find_cycles(graph, source, target, max_length, limit)
+    return save_cycles(found)
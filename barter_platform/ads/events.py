@@ -0,0 +1,227 @@
+"""
+События об изменении предложений обмена для потока SSE (``/events/``).
+
+Создание предложения и смена его статуса публикуются после фиксации
+транзакции (``proposals_changed``): событие получают владельцы обоих
+объявлений. Брокер ``broker`` раздаёт события подписчикам текущего
+процесса, а бэкенд (настройка ``ADS_EVENTS_BACKEND``) решает, как события
+до брокеров доходят:
+
+* ``LocalBackend`` — сразу в брокер этого процесса (один процесс ASGI);
+* ``RedisBackend`` — через Redis pub/sub в брокеры всех процессов
+  (несколько воркеров), нужен пакет ``redis``.
+
+Подписчики — потоки SSE в цикле событий ASGI (``listen``); публикация идёт
+из потока обработки запроса, поэтому брокер потокобезопасен.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import ExchangeProposal
+
+logger = logging.getLogger(__name__)
+
+CREATED = 'proposal_created'
+UPDATED = 'proposal_updated'
+
+# Сколько событий держать для медленного клиента (старые отбрасываются)
+QUEUE_SIZE = 100
+# Через сколько миллисекунд EventSource переподключается после разрыва
+RETRY_MS = 5000
+
+
+def get_keepalive():
+    return getattr(settings, 'ADS_EVENTS_KEEPALIVE', 15)
+
+
+class Broker:
+    """Подписки пользователей в текущем процессе."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def __bool__(self):
+        return bool(self._subscribers)
+
+    def subscribe(self, user_id, callback):
+        """
+        Подписывает ``callback(event)`` на события пользователя. Он вызывается
+        в потоке публикации и не должен блокироваться.
+
+        Returns:
+            callable: Функция отмены подписки.
+        """
+        with self._lock:
+            self._subscribers[user_id].add(callback)
+        return lambda: self.unsubscribe(user_id, callback)
+
+    def unsubscribe(self, user_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(user_id)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._subscribers[user_id]
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            callbacks = list(self._subscribers.get(user_id, ()))
+        for callback in callbacks:
+            callback(event)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """События доставляются только подписчикам текущего процесса."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def is_active(self):
+        """Есть ли кому доставлять события (иначе их можно не собирать)."""
+        return bool(self.broker)
+
+    def start(self):
+        """Вызывается при появлении подписчика в этом процессе."""
+
+    def publish(self, user_id, event):
+        self.broker.deliver(user_id, event)
+
+
+class RedisBackend(LocalBackend):
+    """
+    Рассылка через Redis pub/sub: событие публикуется в канал пользователя,
+    а фоновый поток каждого процесса с подписчиками передаёт его в брокер.
+    Адрес — настройка ``ADS_EVENTS_REDIS_URL``.
+    """
+
+    channel_prefix = 'barter:events:'
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('Для RedisBackend нужен пакет redis')
+        self.redis = redis
+        self.client = redis.Redis.from_url(settings.ADS_EVENTS_REDIS_URL)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def is_active(self):
+        return True  # подписчики могут быть в других процессах
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='ads-events', daemon=True)
+                self._thread.start()
+
+    def publish(self, user_id, event):
+        self.client.publish(f'{self.channel_prefix}{user_id}', json.dumps(event))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.channel_prefix}*')
+                for message in pubsub.listen():
+                    user_id = int(message['channel'].decode().removeprefix(self.channel_prefix))
+                    self.broker.deliver(user_id, json.loads(message['data']))
+            except self.redis.ConnectionError:
+                logger.warning('Потеряно соединение с Redis, переподключение', exc_info=True)
+                time.sleep(1)
+
+
+_backends = {}
+
+
+def get_backend():
+    """Возвращает (и кеширует) бэкенд событий из ``ADS_EVENTS_BACKEND``."""
+    path = getattr(settings, 'ADS_EVENTS_BACKEND', 'ads.events.LocalBackend')
+    if path not in _backends:
+        _backends[path] = import_string(path)(broker)
+    return _backends[path]
+
+
+def proposals_changed(pks, event_type=UPDATED):
+    """Публикует события о предложениях ``pks`` после фиксации транзакции."""
+    pks = list(pks)
+    if pks:
+        # Ошибка доставки не должна превращать уже зафиксированную операцию в 500
+        transaction.on_commit(lambda: publish_proposals(pks, event_type), robust=True)
+
+
+def publish_proposals(pks, event_type):
+    backend = get_backend()
+    if not backend.is_active():
+        return
+    statuses = dict(ExchangeProposal.STATUS_CHOICES)
+    rows = ExchangeProposal.objects.filter(pk__in=pks).values(
+        'id', 'status', 'ad_sender', 'ad_sender__title', 'ad_sender__user',
+        'ad_receiver', 'ad_receiver__title', 'ad_receiver__user',
+    )
+    for row in rows:
+        event = {
+            'type': event_type,
+            'proposal': row['id'],
+            'status': row['status'],
+            'status_display': statuses[row['status']],
+            'ad_sender': {'id': row['ad_sender'], 'title': row['ad_sender__title']},
+            'ad_receiver': {'id': row['ad_receiver'], 'title': row['ad_receiver__title']},
+        }
+        for user_id in {row['ad_sender__user'], row['ad_receiver__user']}:
+            backend.publish(user_id, event)
+
+
+async def listen(user_id, keepalive=None):
+    """
+    Асинхронный генератор событий пользователя. Если событий нет
+    ``keepalive`` секунд, выдаёт None — пора отправить клиенту keepalive.
+    """
+    keepalive = keepalive or get_keepalive()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def callback(event):
+        try:
+            loop.call_soon_threadsafe(put, event)
+        except RuntimeError:
+            pass  # цикл событий уже закрыт
+
+    get_backend().start()
+    unsubscribe = broker.subscribe(user_id, callback)
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+    finally:
+        unsubscribe()
+
+
+def format_sse(event):
+    """Сообщение в формате text/event-stream; None — комментарий-keepalive."""
+    if event is None:
+        return ': keepalive\n\n'
+    data = json.dumps(event, ensure_ascii=False)
+    return f'event: {event["type"]}\ndata: {data}\n\n'
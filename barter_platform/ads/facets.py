@@ -0,0 +1,168 @@
+"""
+Счётчики фасетов ленты: сколько объявлений в каждой категории и состоянии.
+
+Без поиска счётчики собираются из таблицы ``FacetCount`` (одна строка на
+пару категория × состояние), которая обновляется приращениями при каждом
+изменении объявления: обработчики сигналов ``Ad`` (``ads.signals``),
+массовые операции (``ads_saved_in_bulk``) и принятие обмена
+(``ads.services``). Так лента не делает ``GROUP BY`` по всем активным
+объявлениям на каждый запрос. Лента не показывает пользователю его
+собственные объявления, поэтому они вычитаются в том же запросе
+(``UNION ALL`` с выборкой по индексу ``user``).
+
+С поиском (``q``) счётчики считаются одним агрегирующим запросом по
+найденным объявлениям.
+
+Счётчики «дизъюнктивные», как в фильтрах интернет-магазинов: у категорий
+учитывается выбранное состояние, но не выбранная категория (и наоборот),
+поэтому видно, сколько объявлений даст переключение фильтра.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from .models import Ad, FacetCount
+
+# Поля объявления, от которых зависит его ячейка
+FACET_FIELDS = {'category', 'condition', 'is_active'}
+
+FACETS = {
+    'category': Ad.CATEGORY_CHOICE,
+    'condition': Ad.CONDITION_CHOICE,
+}
+
+
+def facet_key(ad):
+    """Ячейка ``FacetCount`` объявления или None, если оно не в ленте."""
+    return (ad.category, ad.condition) if ad.is_active else None
+
+
+def apply_changes(changes):
+    """
+    Обновляет счётчики по изменениям объявлений.
+
+    Args:
+        changes: Пары (ячейка до изменения, ячейка после) — см. ``facet_key``;
+            None у нового, скрытого или удалённого объявления.
+    """
+    deltas = Counter()
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None:
+            deltas[before] -= 1
+        if after is not None:
+            deltas[after] += 1
+    for (category, condition), delta in sorted(deltas.items()):
+        if delta:
+            _apply_delta(category, condition, delta)
+
+
+def _apply_delta(category, condition, delta):
+    cell = FacetCount.objects.filter(category=category, condition=condition)
+    # Разошедшийся счётчик не уходит ниже нуля, его исправит rebuild_facets
+    count = Greatest(F('count') + delta, Value(0)) if delta < 0 else F('count') + delta
+    if not cell.update(count=count) and delta > 0:
+        with transaction.atomic():
+            FacetCount.objects.bulk_create(
+                [FacetCount(category=category, condition=condition)], ignore_conflicts=True
+            )
+            cell.update(count=count)
+
+
+def _grouped(queryset):
+    return queryset.order_by().values_list('category', 'condition').annotate(total=Count('pk'))
+
+
+def count_active():
+    """Счётчики, посчитанные заново по объявлениям: {(категория, состояние): число}."""
+    return Counter({
+        (category, condition): total
+        for category, condition, total in _grouped(Ad.objects.filter(is_active=True))
+    })
+
+
+def rebuild():
+    """
+    Пересчитывает таблицу ``FacetCount`` заново.
+
+    Returns:
+        list: Ячейки, в которых счётчик расходился.
+    """
+    with transaction.atomic():
+        actual = count_active()
+        stored = {
+            (row.category, row.condition): row
+            for row in FacetCount.objects.select_for_update()
+        }
+        drifted = sorted(
+            key for key in actual.keys() | stored.keys()
+            if actual[key] != getattr(stored.get(key), 'count', 0)
+        )
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(
+            FacetCount(category=category, condition=condition, count=total)
+            for (category, condition), total in actual.items()
+        )
+    return drifted
+
+
+def _table_queryset(user=None):
+    rows = FacetCount.objects.filter(count__gt=0).values_list('category', 'condition', 'count')
+    if user is not None and user.is_authenticated:
+        # Собственные объявления пользователя вычитаются в том же запросе
+        own = Ad.objects.filter(user=user, is_active=True).order_by().values_list(
+            'category', 'condition'
+        ).annotate(total=Count('pk') * -1)
+        rows = rows.union(own, all=True)
+    return rows
+
+
+def get_counts(search_queryset=None, user=None, category='', condition=''):
+    """
+    Счётчики фасетов ленты (один запрос к БД).
+
+    Args:
+        search_queryset: Найденные объявления (лента после поиска, без
+            фильтров по категории и состоянию); None — без поиска, из таблицы.
+        user: Пользователь, чьи объявления не входят в ленту (без поиска).
+        category: Выбранная категория.
+        condition: Выбранное состояние.
+
+    Returns:
+        dict: {'category': {значение: число}, 'condition': {значение: число}}.
+    """
+    rows = _grouped(search_queryset) if search_queryset is not None else _table_queryset(user)
+    return _fold(rows, category, condition)
+
+
+async def aget_counts(search_queryset=None, user=None, category='', condition=''):
+    """Асинхронный вариант ``get_counts`` (для ``ads.async_views``)."""
+    rows = _grouped(search_queryset) if search_queryset is not None else _table_queryset(user)
+    return _fold([row async for row in rows], category, condition)
+
+
+def _fold(rows, category, condition):
+    cells = Counter()
+    for row_category, row_condition, total in rows:
+        cells[(row_category, row_condition)] += total
+    counts = {name: {value: 0 for value, _ in choices} for name, choices in FACETS.items()}
+    for (row_category, row_condition), total in cells.items():
+        if total <= 0:
+            continue
+        if not condition or row_condition == condition:
+            counts['category'][row_category] = counts['category'].get(row_category, 0) + total
+        if not category or row_category == category:
+            counts['condition'][row_condition] = counts['condition'].get(row_condition, 0) + total
+    return counts
+
+
+def with_labels(counts):
+    """Счётчики с подписями в порядке вариантов модели: {фасет: [(значение, подпись, число)]}."""
+    return {
+        name: [(value, label, counts[name].get(value, 0)) for value, label in choices]
+        for name, choices in FACETS.items()
+    }
@@ -0,0 +1,265 @@
+"""
+Загрузка изображений объявлений и миниатюры.
+
+Лента и страница объявления не ссылаются на сторонние адреса из
+``Ad.image_url``: после сохранения объявления фоновая задача
+(``ads.tasks.fetch_image``) один раз скачивает файл, проверяет его и
+сохраняет миниатюры фиксированной ширины (``ADS_THUMBNAIL_SIZES``) в WebP и
+JPEG. Имена файлов — хеш содержимого, поэтому файл по адресу никогда не
+меняется и отдаётся с ``Cache-Control: immutable`` (``ThumbnailView``), а
+одинаковые изображения хранятся один раз.
+
+Для генерации миниатюр нужен Pillow. Загрузка ограничена по времени
+(``ADS_IMAGE_FETCH_TIMEOUT``) и размеру (``ADS_IMAGE_MAX_BYTES``); адреса
+во внутренних сетях отклоняются, если не задано ``ADS_IMAGE_ALLOW_PRIVATE``:
+имя хоста разрешается один раз, и соединение идёт на проверенный адрес.
+"""
+
+import hashlib
+import ipaddress
+import socket
+from http.client import HTTPConnection, HTTPSConnection
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import (HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, Request,
+                            build_opener)
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import caching
+from .models import AdImage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Каталог миниатюр в хранилище
+THUMBNAIL_DIR = 'thumbs'
+# Миниатюры не меняются: имя файла — хеш содержимого
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+USER_AGENT = 'BarterPlatform-ImageFetcher/1.0'
+
+
+def get_sizes():
+    return getattr(settings, 'ADS_THUMBNAIL_SIZES', (320, 640))
+
+
+def get_fetch_timeout():
+    return getattr(settings, 'ADS_IMAGE_FETCH_TIMEOUT', 5)
+
+
+def get_max_bytes():
+    return getattr(settings, 'ADS_IMAGE_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def get_max_pixels():
+    return getattr(settings, 'ADS_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def url_digest(url):
+    """Короткий хеш адреса для ключа идемпотентности задачи загрузки."""
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+class ImageError(Exception):
+    """Изображение нельзя использовать; повторная загрузка не поможет."""
+
+
+def check_url(url):
+    """
+    Проверяет схему и наличие хоста (в том числе после перенаправлений).
+    Адрес хоста проверяется при соединении (``_create_connection``).
+
+    Raises:
+        ImageError: Не HTTP(S) или адрес без хоста.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageError(f'Недопустимый адрес: {url}')
+
+
+def resolve(host, port):
+    """
+    Адреса хоста для соединения.
+
+    Raises:
+        ImageError: Хост не найден или во внутренней сети (если не задано
+            ``ADS_IMAGE_ALLOW_PRIVATE``).
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ImageError(f'Хост не найден: {host}')
+    if not getattr(settings, 'ADS_IMAGE_ALLOW_PRIVATE', False):
+        for *_, sockaddr in addresses:
+            if not ipaddress.ip_address(sockaddr[0]).is_global:
+                raise ImageError(f'Адрес во внутренней сети: {host}')
+    return addresses
+
+
+def _create_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # Соединение идёт на тот же адрес, что был проверен: повторное
+    # разрешение имени (DNS rebinding) могло бы вернуть внутренний адрес
+    host, port = address
+    error = None
+    for *_, sockaddr in resolve(host, port):
+        try:
+            return socket.create_connection((sockaddr[0], port), timeout, source_address)
+        except OSError as exc:
+            error = exc
+    raise error
+
+
+class _CheckedConnectionMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_connection
+
+
+class _CheckedHTTPConnection(_CheckedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CheckedHTTPSConnection(_CheckedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CheckedHTTPHandler(HTTPHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(_CheckedHTTPConnection, req, **kwargs)
+
+
+class _CheckedHTTPSHandler(HTTPSHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(_CheckedHTTPSConnection, req, **kwargs)
+
+
+class _CheckedRedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def download(url):
+    """
+    Скачивает изображение.
+
+    Returns:
+        bytes: Содержимое файла.
+
+    Raises:
+        ImageError: Ответ не изображение, слишком большой или ошибка 4xx.
+        OSError: Сетевая ошибка или 5xx — задача будет повторена.
+    """
+    check_url(url)
+    # Без прокси из окружения: проверяется адрес, с которым идёт соединение
+    opener = build_opener(ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler,
+                          _CheckedRedirectHandler)
+    request = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': 'image/*'})
+    max_bytes = get_max_bytes()
+    try:
+        with opener.open(request, timeout=get_fetch_timeout()) as response:
+            content_type = response.headers.get_content_type()
+            if not content_type.startswith('image/'):
+                raise ImageError(f'Ответ не изображение: {content_type}')
+            if int(response.headers.get('Content-Length') or 0) > max_bytes:
+                raise ImageError('Изображение слишком большое')
+            data = response.read(max_bytes + 1)
+    except HTTPError as error:
+        if error.code < 500:
+            raise ImageError(f'Ошибка HTTP {error.code}')
+        raise
+    if len(data) > max_bytes:
+        raise ImageError('Изображение слишком большое')
+    return data
+
+
+def _open(data):
+    if Image is None:
+        # Без Pillow повторы задачи не помогут: изображение сразу помечается ошибочным
+        raise ImageError('Для миниатюр нужен пакет Pillow')
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+        image = Image.open(BytesIO(data))
+        if image.width * image.height > get_max_pixels():
+            raise ImageError('Изображение слишком большое')
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageError(f'Файл не удалось разобрать: {error}')
+    return ImageOps.exif_transpose(image)
+
+
+def _store(data, extension):
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    name = f'{THUMBNAIL_DIR}/{digest[:2]}/{digest}.{extension}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def make_thumbnails(data):
+    """
+    Строит миниатюры шириной ``ADS_THUMBNAIL_SIZES`` (меньшие изображения
+    не увеличиваются) и сохраняет их в хранилище.
+
+    Returns:
+        tuple: (ширина, высота, список миниатюр для ``AdImage.thumbnails``).
+    """
+    image = _open(data)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    thumbnails = []
+    for size in sorted(set(get_sizes())):
+        if thumbnails and size > image.width:
+            break  # больше исходного — та же картинка
+        height = max(round(image.height * min(size, image.width) / image.width), 1)
+        thumb = image.resize((min(size, image.width), height), Image.Resampling.LANCZOS)
+        webp, jpeg = BytesIO(), BytesIO()
+        thumb.save(webp, 'WEBP', quality=80, method=4)
+        if has_alpha:
+            # У JPEG нет прозрачности: подкладываем белый фон
+            background = Image.new('RGB', thumb.size, 'white')
+            background.paste(thumb, mask=thumb.getchannel('A'))
+            thumb = background
+        thumb.save(jpeg, 'JPEG', quality=82, optimize=True, progressive=True)
+        thumbnails.append({
+            'width': thumb.width,
+            'height': thumb.height,
+            'webp': _store(webp.getvalue(), 'webp'),
+            'jpeg': _store(jpeg.getvalue(), 'jpg'),
+        })
+    return image.width, image.height, thumbnails
+
+
+def fetch(ad):
+    """
+    Загружает изображение объявления и сохраняет миниатюры в ``AdImage``.
+
+    Неисправимые ошибки (не изображение, 404, внутренний адрес)
+    сохраняются со статусом ``failed``; сетевые ошибки пробрасываются,
+    чтобы очередь повторила задачу.
+
+    Returns:
+        AdImage: Результат загрузки.
+    """
+    url = ad.image_url
+    try:
+        data = download(url)
+        width, height, thumbnails = make_thumbnails(data)
+    except ImageError as error:
+        defaults = {'source_url': url, 'status': 'failed', 'error': str(error),
+                    'content_hash': '', 'width': None, 'height': None, 'thumbnails': []}
+    else:
+        defaults = {'source_url': url, 'status': 'ready', 'error': '',
+                    'content_hash': hashlib.sha256(data).hexdigest(),
+                    'width': width, 'height': height, 'thumbnails': thumbnails}
+    image, _ = AdImage.objects.update_or_create(ad=ad, defaults=defaults)
+    # Закешированные страницы ленты ещё без миниатюры
+    caching.invalidate_ads([ad.pk])
+    return image
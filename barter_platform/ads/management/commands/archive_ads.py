@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ads import archive
+from ads.models import Ad, ArchivedAd, ArchivedProposal, ExchangeProposal
+from ads.tasks import archive_inactive
+from jobs.queue import enqueue
+
+TABLES = (Ad, ExchangeProposal, ArchivedAd, ArchivedProposal)
+
+
+class Command(BaseCommand):
+    help = ('Переносит неактивные объявления и их завершённые предложения в архивные '
+            'таблицы; показывает размер таблиц и время горячих запросов до и после')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Сколько дней объявление должно быть неактивным '
+                                 '(по умолчанию ADS_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Объявлений в одной транзакции (по умолчанию ADS_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать подходящие объявления')
+        parser.add_argument('--background', action='store_true',
+                            help='Поставить перенос в очередь фоновых задач')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Повторов замера запросов; в отчёт идёт лучший результат')
+
+    def handle(self, *args, **options):
+        days, batch_size = options['days'], options['batch_size']
+        if options['dry_run']:
+            total = archive.candidates(days).count()
+            self.stdout.write(self.style.SUCCESS(f'Можно перенести в архив объявлений: {total}'))
+            return
+        if options['background']:
+            enqueue(archive_inactive, days=days, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS('Перенос в архив поставлен в очередь'))
+            return
+
+        hot_queries = self.get_hot_queries()
+        self.report('До переноса', hot_queries, options['repeat'])
+        ads, proposals = archive.archive(
+            days, batch_size,
+            progress=lambda ads, proposals: self.stdout.write(
+                f'  пачка: объявлений {ads}, предложений {proposals}'
+            ),
+        )
+        self.report('После переноса', hot_queries, options['repeat'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено в архив объявлений: {ads}, предложений: {proposals}'
+        ))
+
+    def get_hot_queries(self):
+        # «Мои предложения» замеряются для пользователя с наибольшим их числом
+        busiest = ExchangeProposal.objects.values('ad_receiver__user').annotate(
+            total=Count('id')
+        ).order_by('-total').values_list('ad_receiver__user', flat=True).first()
+        return {
+            'Лента, первая страница': lambda: list(
+                Ad.objects.filter(is_active=True).select_related('user').order_by('-created_at', '-id')[:10]
+            ),
+            'Мои предложения': lambda: (
+                list(ExchangeProposal.objects.filter(ad_receiver__user=busiest)
+                     .select_related('ad_sender', 'ad_receiver')),
+                list(ExchangeProposal.objects.filter(ad_sender__user=busiest)
+                     .select_related('ad_sender', 'ad_receiver')),
+            ),
+        }
+
+    def report(self, title, hot_queries, repeat):
+        self.stdout.write(f'{title}:')
+        for model in TABLES:
+            rows, size = archive.table_stats(model)
+            size = f', {size / 1024:.0f} КБ' if size is not None else ''
+            self.stdout.write(f'  {model._meta.db_table}: строк {rows}{size}')
+        for label, query in hot_queries.items():
+            seconds = archive.time_query(query, max(repeat, 1))
+            self.stdout.write(f'  {label}: {seconds * 1000:.2f} мс')
@@ -0,0 +1,157 @@
+import os
+import random
+import tempfile
+import threading
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.utils import load_backend
+
+from barter_platform import sqlite
+
+SCHEMA = (
+    'CREATE TABLE ad (id INTEGER PRIMARY KEY, title TEXT, is_active BOOL, created_at REAL)',
+    'CREATE INDEX ad_feed ON ad (is_active, created_at)',
+    'CREATE TABLE proposal (id INTEGER PRIMARY KEY, ad_sender_id INT, ad_receiver_id INT, '
+    'status TEXT, comment TEXT, created_at REAL)',
+    'CREATE INDEX proposal_receiver ON proposal (ad_receiver_id, status)',
+)
+FEED_QUERY = 'SELECT id, title FROM ad WHERE is_active ORDER BY created_at DESC LIMIT 20'
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк одновременных чтений и записей SQLite: настройки Django '
+            'по умолчанию против рабочего режима (SQLITE_PRODUCTION)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность замера для каждого режима, секунд')
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Потоков, создающих и принимающих предложения')
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Потоков, читающих ленту')
+        parser.add_argument('--rows', type=int, default=10_000,
+                            help='Объявлений в тестовой базе')
+        parser.add_argument('--busy-timeout', type=float, default=5,
+                            help='Ожидание занятой базы в обоих режимах, секунд')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        modes = {
+            'По умолчанию': {'OPTIONS': {'timeout': options['busy_timeout']}},
+            'SQLITE_PRODUCTION': sqlite.production_settings(busy_timeout=options['busy_timeout']),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for number, (label, overrides) in enumerate(modes.items()):
+                path = os.path.join(directory, f'bench{number}.sqlite3')
+                self.create_database(path, options['rows'], options['seed'])
+                self.report(label, self.run(path, overrides, options))
+
+    def create_database(self, path, rows, seed):
+        rng = random.Random(seed)
+        connection = self.connect(path, {}, 'bench_setup')
+        try:
+            with connection.cursor() as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+                cursor.executemany(
+                    'INSERT INTO ad (title, is_active, created_at) VALUES (%s, %s, %s)',
+                    [(f'Объявление {i}', rng.random() < 0.9, i) for i in range(rows)],
+                )
+        finally:
+            connection.close()
+
+    def connect(self, path, overrides, alias):
+        databases = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, **overrides},
+        })
+        backend = load_backend(databases[alias]['ENGINE'])
+        return backend.DatabaseWrapper(databases[alias], alias)
+
+    def run(self, path, overrides, options):
+        """Запускает потоки на ``duration`` секунд; возвращает их результаты."""
+        stop = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=self.worker, args=(kind, number, path, overrides, options, stop, results))
+            for kind, count in (('write', options['writers']), ('read', options['readers']))
+            for number in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        stop.wait(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {'duration': options['duration'], 'results': results}
+
+    def worker(self, kind, number, path, overrides, options, stop, results):
+        alias = f'bench_{kind}_{number}'
+        connection = connections[alias] = self.connect(path, overrides, alias)
+        rng = random.Random(options['seed'] + number)
+        operation = self.write if kind == 'write' else self.read
+        timings, errors, connects = [], 0, 0
+        try:
+            while not stop.is_set():
+                # Как между HTTP-запросами: соединение старше CONN_MAX_AGE закрывается
+                connection.close_if_unusable_or_obsolete()
+                if connection.connection is None:
+                    connects += 1
+                start = perf_counter()
+                try:
+                    operation(connection, alias, rng, options['rows'])
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    errors += 1
+                else:
+                    timings.append(perf_counter() - start)
+                connection.close_if_unusable_or_obsolete()
+        finally:
+            connection.close()
+            del connections[alias]
+            results.append((kind, timings, errors, connects))
+
+    def read(self, connection, alias, rng, rows):
+        with connection.cursor() as cursor:
+            cursor.execute(FEED_QUERY)
+            cursor.fetchall()
+            cursor.execute('SELECT COUNT(*) FROM proposal WHERE ad_receiver_id = %s', [rng.randrange(rows)])
+            cursor.fetchone()
+
+    def write(self, connection, alias, rng, rows):
+        # Как ExchangeProposalCreateView: проверка существующих предложений, затем запись
+        sender, receiver = rng.randrange(rows), rng.randrange(rows)
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM proposal WHERE ad_sender_id = %s AND ad_receiver_id = %s',
+                [sender, receiver],
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(
+                    'INSERT INTO proposal (ad_sender_id, ad_receiver_id, status, comment, created_at) '
+                    'VALUES (%s, %s, %s, %s, %s)',
+                    [sender, receiver, 'pending', 'Предложение обмена', perf_counter()],
+                )
+            cursor.execute(
+                "UPDATE proposal SET status = 'accepted' WHERE ad_receiver_id = %s AND status = 'pending'",
+                [receiver],
+            )
+
+    def report(self, label, run):
+        self.stdout.write(f'{label}:')
+        for kind, title in (('read', 'Чтения'), ('write', 'Записи')):
+            timings, errors, connects = [], 0, 0
+            for result_kind, result_timings, result_errors, result_connects in run['results']:
+                if result_kind == kind:
+                    timings += result_timings
+                    errors += result_errors
+                    connects += result_connects
+            timings.sort()
+            p99 = timings[max(int(len(timings) * 0.99) - 1, 0)] * 1000 if timings else 0
+            self.stdout.write(
+                f'  {title}: {len(timings) / run["duration"]:.0f} оп/с, p99 {p99:.2f} мс, '
+                f'database is locked: {errors}, новых соединений: {connects}'
+            )
@@ -0,0 +1,69 @@
+import random
+import statistics
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from ads.cycles import ProposalGraph, find_cycles
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк инкрементального поиска обменов по цепочке '
+            'на синтетическом графе (по умолчанию 1 млн рёбер)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edges', type=int, default=1_000_000,
+                            help='Число рёбер (предложений) в исходном графе')
+        parser.add_argument('--users', type=int, default=50_000,
+                            help='Число вершин (пользователей)')
+        parser.add_argument('--operations', type=int, default=10_000,
+                            help='Сколько рёбер добавить и удалить после построения')
+        parser.add_argument('--max-length', type=int, default=4,
+                            help='Максимальное число участников цепочки')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Сколько цепочек искать через одно ребро')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = options['users']
+        graph = ProposalGraph()
+
+        start = perf_counter()
+        while len(graph) < options['edges']:
+            source, target = rng.randrange(users), rng.randrange(users)
+            if source != target:
+                graph.add_edge(source, target)
+        self.report('Построение графа', perf_counter() - start,
+                    f'{len(graph)} рёбер, {users} вершин')
+
+        inserted, timings, found = [], [], 0
+        while len(inserted) < options['operations']:
+            source, target = rng.randrange(users), rng.randrange(users)
+            if source == target or not graph.add_edge(source, target):
+                continue
+            start = perf_counter()
+            found += len(find_cycles(graph, source, target, options['max_length'], options['limit']))
+            timings.append(perf_counter() - start)
+            inserted.append((source, target))
+        self.report_latency('Добавление ребра + поиск цепочек', timings)
+        self.stdout.write(f'  найдено цепочек: {found}')
+
+        timings = []
+        for source, target in inserted:
+            start = perf_counter()
+            graph.remove_edge(source, target)
+            timings.append(perf_counter() - start)
+        self.report_latency('Удаление ребра', timings)
+
+    def report(self, label, seconds, details=''):
+        self.stdout.write(f'{label}: {seconds:.2f} с {details}'.rstrip())
+
+    def report_latency(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+        self.stdout.write(
+            f'{label}: {len(timings)} операций, '
+            f'медиана {statistics.median(timings) * 1000:.3f} мс, '
+            f'p95 {p95 * 1000:.3f} мс, максимум {timings[-1] * 1000:.3f} мс'
+        )
@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from ads.models import ExchangeProposal
+from ads.views import AdListView, MyProposalsView, UserAdsView
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит план выполнения (EXPLAIN QUERY PLAN в SQLite) для запросов '
+        'основных представлений, чтобы убедиться, что используются индексы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username',
+                            help='Пользователь, от имени которого строятся запросы')
+        parser.add_argument('--sql', action='store_true',
+                            help='Также печатать текст SQL')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['username'])
+        for name, queryset in self.get_queries(user):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        # Для пустой базы план строится от имени несохранённого пользователя
+        return User.objects.order_by('pk').first() or User(pk=0, username='explain')
+
+    def get_queries(self, user):
+        factory = RequestFactory()
+
+        def build_view(view_class, params=None):
+            request = factory.get('/', params or {})
+            request.user = user
+            view = view_class()
+            view.setup(request)
+            return view
+
+        yield 'AdListView', build_view(AdListView).get_queryset()
+        yield 'AdListView (category)', build_view(
+            AdListView, {'category': 'books'}).get_queryset()
+        yield 'AdListView (condition)', build_view(
+            AdListView, {'condition': 'new'}).get_queryset()
+        yield 'AdListView (q)', build_view(
+            AdListView, {'q': 'книга'}).get_queryset()
+        yield 'UserAdsView', build_view(UserAdsView).get_queryset()
+
+        proposals_view = build_view(MyProposalsView)
+        yield 'MyProposalsView (received)', proposals_view.get_received_queryset()
+        yield 'MyProposalsView (sent)', proposals_view.get_sent_queryset()
+
+        # Проверка дубликата в ExchangeProposalCreateView.dispatch
+        yield 'ExchangeProposalCreateView (duplicate)', ExchangeProposal.objects.filter(
+            ad_sender_id=1, ad_receiver_id=2
+        )
+        # Выборка предложения в ProposalAcceptView/ProposalRejectView
+        yield 'ProposalAcceptView', ExchangeProposal.objects.filter(
+            pk=1, ad_receiver__user=user, status='pending'
+        )
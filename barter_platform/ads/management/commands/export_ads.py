@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from ads.bulk import FORMATS, export_ads, guess_format
+from ads.models import Ad
+
+
+class Command(BaseCommand):
+    help = 'Выгружает объявления в CSV или JSONL потоком'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='Путь к файлу или «-» для stdout')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат файла (по умолчанию — по расширению, иначе CSV)')
+        parser.add_argument('--user', help='Выгрузить объявления только этого пользователя')
+        parser.add_argument('--active', action='store_true',
+                            help='Только активные объявления')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Сколько строк читать из базы за раз')
+
+    def handle(self, *args, **options):
+        queryset = Ad.objects.all()
+        if options['user']:
+            queryset = queryset.filter(user__username=options['user'])
+        if options['active']:
+            queryset = queryset.filter(is_active=True)
+
+        output = options['output']
+        fmt = options['format'] or guess_format(output)
+        chunks = export_ads(queryset, fmt, chunk_size=options['chunk_size'])
+        if output == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        else:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                file.writelines(chunks)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ads.cycles import get_limit, get_max_length, scan_all
+
+
+class Command(BaseCommand):
+    help = ('Полный поиск обменов по цепочке среди ожидающих предложений '
+            '(новые предложения обрабатываются автоматически)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=get_max_length(),
+                            help='Максимальное число участников цепочки')
+        parser.add_argument('--limit', type=int, default=get_limit(),
+                            help='Сколько цепочек искать через одно предложение')
+
+    def handle(self, *args, **options):
+        created = scan_all(options['max_length'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Найдено новых цепочек: {len(created)}'))
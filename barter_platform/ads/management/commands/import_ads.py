@@ -0,0 +1,53 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.bulk import FORMATS, form_validator, guess_format, import_ads, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Импортирует объявления из CSV или JSONL (проверка через AdForm)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или «-» для stdin')
+        parser.add_argument('--user', required=True,
+                            help='Имя пользователя — владельца объявлений')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат файла (по умолчанию — по расширению)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пачки для bulk_create')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только проверить строки, ничего не сохраняя')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        if path == '-':
+            result = self.run(sys.stdin, fmt, user, options)
+        else:
+            with open(path, encoding='utf-8-sig', newline='') as lines:
+                result = self.run(lines, fmt, user, options)
+
+        for error in result.errors[:20]:
+            self.stderr.write(f'  строка {error["line"]}: {error["errors"]}')
+        if len(result.errors) > 20:
+            self.stderr.write(f'  ... и ещё {len(result.errors) - 20}')
+
+        verb = 'Проверено без ошибок' if options['dry_run'] else 'Создано'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} объявлений: {result.created}, строк с ошибками: {len(result.errors)}'
+        ))
+
+    def run(self, lines, fmt, user, options):
+        return import_ads(
+            read_rows(lines, fmt),
+            form_validator(user),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
@@ -0,0 +1,158 @@
+import asyncio
+import io
+import itertools
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from ads.async_views import reload_urlconf
+from ads.models import Ad
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест: синхронный стек (WSGI, ASYNC_VIEWS=False) против '
+            'асинхронного (ASGI, ASYNC_VIEWS=True) на одних и тех же данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Адреса для запросов (по умолчанию лента, объявление и списки API)')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Число запросов к каждому стеку')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Одновременных запросов (потоков WSGI-сервера или задач ASGI)')
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='Неучитываемых запросов перед замером')
+        parser.add_argument('--stack', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--username', help='Выполнять запросы от имени пользователя')
+        parser.add_argument('--cache', action='store_true',
+                            help='Не отключать кеш (по умолчанию сравнивается работа с БД)')
+
+    def handle(self, *args, **options):
+        cookie = b''
+        client = None
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {options["username"]} не найден')
+            client = Client()
+            client.force_login(user)
+            name = settings.SESSION_COOKIE_NAME
+            cookie = f'{name}={client.cookies[name].value}'.encode()
+
+        paths = options['paths'] or self.default_paths(client is not None)
+        # Один клиент шлёт все запросы: ограничение частоты исказило бы замер
+        overrides = {'ALLOWED_HOSTS': [HOST], 'RATELIMIT_ENABLED': False}
+        if not options['cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        stacks = ['sync', 'async'] if options['stack'] == 'both' else [options['stack']]
+        try:
+            with override_settings(**overrides):
+                for stack in stacks:
+                    with override_settings(ASYNC_VIEWS=stack == 'async'):
+                        reload_urlconf()
+                        run = self.run_sync if stack == 'sync' else self.run_async
+                        run(paths, options['warmup'], cookie, options['concurrency'])
+                        elapsed, results = run(paths, options['requests'], cookie, options['concurrency'])
+                    self.report(stack, elapsed, results)
+        finally:
+            reload_urlconf()
+            if client is not None:
+                client.logout()
+
+    def default_paths(self, authenticated):
+        paths = ['/', '/api/ads/', '/api/proposals/']
+        ad = Ad.objects.filter(is_active=True).order_by('-created_at').first()
+        if ad is not None:
+            paths.insert(1, f'/{ad.pk}/')
+        if authenticated:
+            paths.append('/my-proposals/')
+        return paths
+
+    def run_sync(self, paths, total, cookie, concurrency):
+        """Запросы к WSGIHandler из пула потоков, как у многопоточного WSGI-сервера."""
+        handler = WSGIHandler()
+
+        def request(path):
+            url = urlsplit(path)
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+                'SCRIPT_NAME': '', 'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST,
+                'REMOTE_ADDR': '127.0.0.1', 'HTTP_COOKIE': cookie.decode(),
+                'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+            }
+            status = []
+            start = perf_counter()
+            body = handler(environ, lambda value, headers, exc_info=None: status.append(value))
+            for _ in body:
+                pass
+            body.close()
+            return perf_counter() - start, int(status[0].split()[0])
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            start = perf_counter()
+            results = list(pool.map(request, itertools.islice(itertools.cycle(paths), total)))
+            return perf_counter() - start, results
+
+    def run_async(self, paths, total, cookie, concurrency):
+        """Запросы к ASGIHandler из одного цикла событий, как у uvicorn."""
+        handler = ASGIHandler()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(path):
+            url = urlsplit(path)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': url.path,
+                'raw_path': url.path.encode(), 'query_string': url.query.encode(),
+                'headers': [(b'host', HOST.encode()), (b'cookie', cookie)],
+                'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Future()  # клиент не отключается; задачу отменит обработчик
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with semaphore:
+                start = perf_counter()
+                await handler(scope, receive, send)
+                return perf_counter() - start, status[0]
+
+        async def main():
+            start = perf_counter()
+            tasks = [request(path) for path in itertools.islice(itertools.cycle(paths), total)]
+            results = await asyncio.gather(*tasks)
+            return perf_counter() - start, results
+
+        return asyncio.run(main())
+
+    def report(self, stack, elapsed, results):
+        timings = sorted(duration for duration, _ in results)
+        errors = sum(status >= 400 for _, status in results)
+        p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+        label = 'sync (WSGI)' if stack == 'sync' else 'async (ASGI)'
+        self.stdout.write(
+            f'{label}: {len(results)} запросов за {elapsed:.2f} с, '
+            f'{len(results) / elapsed:.1f} запр/с, '
+            f'медиана {statistics.median(timings) * 1000:.1f} мс, '
+            f'p99 {p99 * 1000:.1f} мс, максимум {timings[-1] * 1000:.1f} мс, '
+            f'ошибок {errors}'
+        )
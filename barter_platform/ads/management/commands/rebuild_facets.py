@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ads import caching, facets
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики фасетов ленты (категории и состояния) по объявлениям'
+
+    def handle(self, *args, **options):
+        drifted = facets.rebuild()
+        for category, condition in drifted[:20]:
+            self.stdout.write(f'  {category} / {condition}')
+        if len(drifted) > 20:
+            self.stdout.write(f'  ... и ещё {len(drifted) - 20}')
+        caching.invalidate_ads([])
+        self.stdout.write(self.style.SUCCESS(f'Исправлено счётчиков: {len(drifted)}'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ads import matching
+from ads.models import Ad, AdMatch
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает текстовые векторы объявлений и списки подходящих обменов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько объявлений обрабатывать за раз')
+        parser.add_argument('--missing', action='store_true',
+                            help='Только активные объявления без списка (например, после импорта)')
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            # Список ключей берётся заранее: пересчёт пишет в AdMatch
+            pks = list(Ad.objects.filter(is_active=True).exclude(
+                pk__in=AdMatch.objects.values('ad')
+            ).values_list('pk', flat=True))
+            batch_size = options['batch_size']
+            for start in range(0, len(pks), batch_size):
+                ads = Ad.objects.filter(pk__in=pks[start:start + batch_size])
+                for ad in ads:
+                    matching.update_matches(ad)
+            total = len(pks)
+        else:
+            total = matching.rebuild(options['batch_size'], stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано объявлений: {total}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from ads.models import Ad
+from ads.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='Псевдоним базы данных')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько объявлений индексировать за раз')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        batch_size = options['batch_size']
+        backend = get_backend(using)
+        backend.uninstall()
+        backend.install()
+
+        batch, total = [], 0
+        for ad in Ad.objects.using(using).only('id', 'title', 'description').iterator(chunk_size=batch_size):
+            batch.append(ad)
+            if len(batch) >= batch_size:
+                backend.index(batch)
+                total += len(batch)
+                batch = []
+        backend.index(batch)
+        total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано объявлений: {total} ({type(backend).__name__})'
+        ))
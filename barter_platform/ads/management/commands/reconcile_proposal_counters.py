@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from ads.services import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики предложений у объявлений и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пачки для bulk_update')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать расхождения, ничего не сохраняя')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_counters(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        for ad in drifted[:20]:
+            self.stdout.write(f'  #{ad.pk}')
+        if len(drifted) > 20:
+            self.stdout.write(f'  ... и ещё {len(drifted) - 20}')
+
+        verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} объявлений с неверными счётчиками: {len(drifted)}'
+        ))
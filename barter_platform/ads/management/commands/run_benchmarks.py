@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from ads import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк сценариев сайта на данных seed_data: пропускная способность, '
+            'перцентили задержки и SQL-запросы на запрос; сравнение с базовой линией')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='Сценарии (по умолчанию все): ' + '; '.join(
+                                f'{name} — {func.description}' for name, func in benchmarks.SCENARIOS.items()
+                            ))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов в каждом сценарии')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Неучитываемых запросов перед замером')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Повторов замера; в отчёт идёт лучший результат')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Зерно выбора параметров запросов')
+        parser.add_argument('--url',
+                            help='Адрес запущенного сервера (по умолчанию — запросы в процессе)')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Одновременных запросов к серверу (только с --url)')
+        parser.add_argument('--cache', action='store_true',
+                            help='Не отключать кеш (в процессе; по умолчанию сравнивается работа с БД)')
+        parser.add_argument('--baseline', help='JSON базовой линии: регрессии завершают команду с ошибкой')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Допустимое ухудшение задержки и пропускной способности (доля); '
+                                 'число SQL-запросов сравнивается строго')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Сохранить результаты как базовую линию')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(benchmarks.SCENARIOS)
+        unknown = set(names) - benchmarks.SCENARIOS.keys()
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        if not benchmarks.BenchmarkState(options['seed']).ads:
+            raise CommandError('Нет тестовых данных: сначала выполните seed_data')
+
+        overrides = {}
+        if options['url']:
+            transport = benchmarks.HTTPTransport(options['url'])
+        else:
+            transport = benchmarks.ClientTransport()
+            overrides['ALLOWED_HOSTS'] = [*settings.ALLOWED_HOSTS, 'testserver']
+            # Один клиент шлёт все запросы: ограничение частоты исказило бы замер
+            overrides['RATELIMIT_ENABLED'] = False
+            if not options['cache']:
+                overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        results = {}
+        with override_settings(**overrides):
+            for name in names:
+                # Данные сценария не зависят от того, какие сценарии выполнялись до него
+                state = benchmarks.BenchmarkState(options['seed'])
+                results[name] = metrics = benchmarks.run(
+                    name, state, transport, options['requests'],
+                    warmup=options['warmup'], concurrency=options['concurrency'],
+                    repeat=options['repeat'],
+                )
+                self.report(name, metrics)
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(
+                options['save_baseline'], results,
+                requests=options['requests'], repeat=options['repeat'], seed=options['seed'],
+                transport='http' if options['url'] else 'client',
+            )
+            self.stdout.write(f'Базовая линия сохранена: {options["save_baseline"]}')
+
+        if options['baseline']:
+            regressions = benchmarks.compare(
+                results, benchmarks.load_baseline(options['baseline']), options['tolerance']
+            )
+            if regressions:
+                raise CommandError('Регрессии относительно базовой линии:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
+
+    def report(self, name, metrics):
+        if metrics is None:
+            self.stdout.write(f'{name}: нет данных для сценария')
+            return
+        queries = ''
+        if metrics['queries_max'] is not None:
+            queries = f'SQL {metrics["queries_mean"]} (макс. {metrics["queries_max"]}), '
+        self.stdout.write(
+            f'{name}: {metrics["requests"]} запр., {metrics["throughput"]} запр/с, '
+            f'p50 {metrics["p50_ms"]} мс, p95 {metrics["p95_ms"]} мс, p99 {metrics["p99_ms"]} мс, '
+            f'{queries}ошибок {metrics["errors"]}'
+        )
@@ -0,0 +1,37 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from ads import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми пользователями, объявлениями и предложениями '
+            'для бенчмарков (run_benchmarks)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--ads', type=int, default=2000)
+        parser.add_argument('--proposals', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Зерно генератора: одинаковое зерно — одинаковые данные')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Размер пачки для bulk_create')
+        parser.add_argument('--clear', action='store_true',
+                            help='Сначала удалить ранее созданные тестовые данные')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f'Удалено тестовых пользователей: {benchmarks.clear()}')
+        start = perf_counter()
+        users, ads, proposals = benchmarks.seed(
+            users=options['users'],
+            ads=options['ads'],
+            proposals=options['proposals'],
+            random_seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {users}, объявлений: {ads}, предложений: {proposals} '
+            f'за {perf_counter() - start:.1f} с (пароль: {benchmarks.SEED_PASSWORD})'
+        ))
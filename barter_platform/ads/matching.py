@@ -0,0 +1,391 @@
+"""
+Подбор обменов: для объявления — чужие активные объявления, на которые
+его разумно обменять.
+
+Оценка кандидата от 0 до 1 складывается из четырёх частей (веса — ``WEIGHTS``):
+
+* ``text`` — косинусная близость TF-IDF векторов заголовка и описания.
+  Слова приводятся к основе (``ads.stemming``) и хешируются в 32-битные
+  числа; нормированные векторы хранятся в ``AdTerm``, который заодно
+  служит инвертированным индексом для отбора кандидатов;
+* ``category`` — совместимость категорий: одинаковые категории и пары,
+  которые часто встречаются в истории предложений;
+* ``condition`` — близость состояний товаров;
+* ``reciprocal`` — встречный интерес: владельцы уже предлагали друг другу
+  обмен или интересовались такими категориями.
+
+Оценка симметрична, поэтому лучшие ``ADS_MATCHES_PER_AD`` кандидатов
+хранятся в ``AdMatch`` для обеих сторон: при изменении объявления
+(``ads.signals``) фоновая задача пересчитывает его список, а само
+объявление добавляется в списки кандидатов. Страница подбора читает готовый список
+одним запросом по индексу. IDF фиксируется при индексации объявления;
+команда ``rebuild_matches`` пересчитывает всё заново.
+"""
+
+import math
+import zlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+
+from .models import Ad, AdMatch, AdTerm, ExchangeProposal
+from .stemming import tokenize
+
+WEIGHTS = {'text': 0.5, 'category': 0.2, 'condition': 0.1, 'reciprocal': 0.2}
+TITLE_WEIGHT = 2.0
+# Сколько самых весомых терминов объявления используется для отбора кандидатов
+CANDIDATE_TERMS = 8
+TEXT_CANDIDATES = 200
+CATEGORY_CANDIDATES = 100
+RECIPROCAL_CANDIDATES = 50
+# Пары разных категорий никогда не оцениваются выше этой доли
+CROSS_CATEGORY_MAX = 0.8
+
+CONDITION_SCORES = {
+    frozenset({'new', 'used'}): 0.6,
+    frozenset({'used', 'broken'}): 0.5,
+    frozenset({'new', 'broken'}): 0.2,
+}
+
+AFFINITY_CACHE_KEY = 'ads:matching:affinity'
+TOTAL_CACHE_KEY = 'ads:matching:total'
+CACHE_TIMEOUT = 600
+
+
+def get_matches_per_ad():
+    return getattr(settings, 'ADS_MATCHES_PER_AD', 20)
+
+
+def term_hash(token):
+    """32-битный хеш основы слова (со знаком, помещается в IntegerField)."""
+    return zlib.crc32(token.encode()) - 2 ** 31
+
+
+def term_counts(ad):
+    """Взвешенные частоты терминов: слова заголовка весомее слов описания."""
+    counts = Counter()
+    for text, weight in ((ad.title, TITLE_WEIGHT), (ad.description, 1.0)):
+        for token in tokenize(text):
+            counts[term_hash(token)] += weight
+    return counts
+
+
+def _document_frequencies(terms):
+    rows = AdTerm.objects.filter(term__in=terms).values('term').annotate(
+        df=Count('id')
+    ).order_by()
+    return {row['term']: row['df'] for row in rows}
+
+
+def _total_ads():
+    return cache.get_or_set(
+        TOTAL_CACHE_KEY, lambda: Ad.objects.filter(is_active=True).count(), CACHE_TIMEOUT
+    )
+
+
+def weighted_vector(counts, frequencies, total):
+    """Нормированный TF-IDF вектор {термин: вес}."""
+    vector = {
+        term: (1 + math.log(count)) * (math.log((total + 1) / (frequencies.get(term, 0) + 1)) + 1)
+        for term, count in counts.items()
+    }
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+    return {term: weight / norm for term, weight in vector.items()}
+
+
+def index_terms(ads, frequencies=None, total=None):
+    """
+    Пересчитывает векторы объявлений в ``AdTerm``.
+
+    Без ``frequencies`` частоты терминов читаются из индекса одним запросом.
+    """
+    ads = list(ads)
+    if not ads:
+        return
+    counts = {ad.pk: term_counts(ad) for ad in ads}
+    if frequencies is None:
+        frequencies = _document_frequencies(
+            list({term for ad_counts in counts.values() for term in ad_counts})
+        )
+    if total is None:
+        total = _total_ads()
+
+    rows = [
+        AdTerm(ad_id=pk, term=term, weight=weight)
+        for pk, ad_counts in counts.items()
+        for term, weight in weighted_vector(ad_counts, frequencies, total).items()
+    ]
+    with transaction.atomic():
+        AdTerm.objects.filter(ad__in=list(counts)).delete()
+        AdTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def _vectors(pks):
+    vectors = defaultdict(dict)
+    for pk, term, weight in AdTerm.objects.filter(ad__in=pks).values_list('ad', 'term', 'weight'):
+        vectors[pk][term] = weight
+    return vectors
+
+
+def category_affinity():
+    """
+    Совместимость пар разных категорий {frozenset(пара): 0..1}.
+
+    Считается по истории предложений: чем чаще товары двух категорий
+    предлагали друг на друга, тем выше оценка.
+    """
+    affinity = cache.get(AFFINITY_CACHE_KEY)
+    if affinity is None:
+        counts = Counter()
+        rows = ExchangeProposal.objects.values(
+            'ad_sender__category', 'ad_receiver__category'
+        ).annotate(total=Count('id')).order_by()
+        for row in rows:
+            pair = frozenset((row['ad_sender__category'], row['ad_receiver__category']))
+            if len(pair) == 2:
+                counts[pair] += row['total']
+        top = max(counts.values(), default=1)
+        affinity = {pair: CROSS_CATEGORY_MAX * total / top for pair, total in counts.items()}
+        cache.set(AFFINITY_CACHE_KEY, affinity, CACHE_TIMEOUT)
+    return affinity
+
+
+def _interest(user_id, category, rows):
+    """
+    Интерес владельца по его исходящим предложениям ``rows``
+    (пары «владелец получателя, категория получателя»).
+    """
+    score = 0.0
+    for receiver_user, receiver_category in rows:
+        if receiver_user == user_id:
+            return 1.0
+        if receiver_category == category:
+            score = 0.5
+    return score
+
+
+def _reciprocal_scores(ad, candidates):
+    """
+    Встречный интерес {pk кандидата: 0..1}: среднее интереса владельца
+    кандидата к объявлению и владельца объявления к кандидату.
+    """
+    users = {candidate.user_id for candidate in candidates}
+    sent = defaultdict(list)
+    rows = ExchangeProposal.objects.filter(
+        Q(ad_sender__user__in=users) | Q(ad_sender__user=ad.user_id)
+    ).values_list('ad_sender__user', 'ad_receiver__user', 'ad_receiver__category')
+    for sender_user, receiver_user, receiver_category in rows:
+        sent[sender_user].append((receiver_user, receiver_category))
+
+    own = sent.get(ad.user_id, [])
+    return {
+        candidate.pk: (
+            _interest(ad.user_id, ad.category, sent.get(candidate.user_id, [])) +
+            _interest(candidate.user_id, candidate.category, own)
+        ) / 2
+        for candidate in candidates
+    }
+
+
+def _condition_score(first, second):
+    if first == second:
+        return 1.0
+    return CONDITION_SCORES.get(frozenset((first, second)), 0.0)
+
+
+def _candidate_ids(ad, vector):
+    """Кандидаты: общие редкие слова, та же категория и встречный интерес."""
+    active = Ad.objects.filter(is_active=True).exclude(user=ad.user_id)
+    ids = set()
+    if vector:
+        terms = sorted(vector, key=vector.get, reverse=True)[:CANDIDATE_TERMS]
+        postings = AdTerm.objects.filter(
+            term__in=terms, ad__is_active=True
+        ).exclude(ad__user=ad.user_id).values('ad').annotate(
+            shared=Sum('weight')
+        ).order_by('-shared')[:TEXT_CANDIDATES]
+        ids.update(row['ad'] for row in postings)
+
+    ids.update(active.filter(category=ad.category).order_by(
+        '-created_at'
+    ).values_list('pk', flat=True)[:CATEGORY_CANDIDATES])
+
+    interested = ExchangeProposal.objects.filter(
+        ad_receiver__user=ad.user_id
+    ).values('ad_sender__user')
+    ids.update(active.filter(user__in=interested).order_by(
+        '-created_at'
+    ).values_list('pk', flat=True)[:RECIPROCAL_CANDIDATES])
+
+    ids.discard(ad.pk)
+    return ids
+
+
+def compute_matches(ad, limit=None):
+    """
+    Оценивает кандидатов для объявления.
+
+    Returns:
+        list: Пары (pk кандидата, оценка), лучшие первыми, не больше ``limit``.
+    """
+    limit = limit or get_matches_per_ad()
+    vector = _vectors([ad.pk]).get(ad.pk, {})
+    ids = _candidate_ids(ad, vector)
+    if not ids:
+        return []
+
+    candidates = list(Ad.objects.filter(pk__in=ids).only('id', 'user', 'category', 'condition'))
+    vectors = _vectors(ids)
+    affinity = category_affinity()
+    reciprocal = _reciprocal_scores(ad, candidates)
+
+    scored = []
+    for candidate in candidates:
+        candidate_vector = vectors.get(candidate.pk, {})
+        parts = {
+            'text': sum(weight * candidate_vector.get(term, 0.0) for term, weight in vector.items()),
+            'category': (1.0 if candidate.category == ad.category else
+                         affinity.get(frozenset((ad.category, candidate.category)), 0.0)),
+            'condition': _condition_score(ad.condition, candidate.condition),
+            'reciprocal': reciprocal[candidate.pk],
+        }
+        score = sum(WEIGHTS[name] * value for name, value in parts.items())
+        scored.append((candidate.pk, round(score, 6)))
+
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored[:limit]
+
+
+def update_matches(ad, limit=None):
+    """
+    Пересчитывает список подходящих обменов объявления.
+
+    Объявление также добавляется в списки своих кандидатов, если проходит
+    в их первые ``limit`` мест, и вытесняет из них последних. В остальных
+    списках его запись остаётся с прежней оценкой (всё пересчитывает
+    ``rebuild_matches``). Неактивное объявление убирается отовсюду.
+    """
+    limit = limit or get_matches_per_ad()
+    with transaction.atomic():
+        if not ad.is_active:
+            AdMatch.objects.filter(Q(ad=ad) | Q(candidate=ad)).delete()
+            return []
+        matches = compute_matches(ad, limit)
+        owners = [pk for pk, _ in matches]
+        # Пересчитываются только свой список и записи в списках кандидатов
+        AdMatch.objects.filter(Q(ad=ad) | Q(ad__in=owners, candidate=ad)).delete()
+
+        lists = {
+            row['ad']: row
+            for row in AdMatch.objects.filter(ad__in=owners).values(
+                'ad'
+            ).annotate(size=Count('id'), lowest=Min('score')).order_by()
+        }
+        rows = [AdMatch(ad=ad, candidate_id=pk, score=score) for pk, score in matches]
+        full = []
+        for pk, score in matches:
+            current = lists.get(pk)
+            if current is None or current['size'] < limit:
+                rows.append(AdMatch(ad_id=pk, candidate=ad, score=score))
+            elif score > current['lowest']:
+                rows.append(AdMatch(ad_id=pk, candidate=ad, score=score))
+                full.append(pk)
+        AdMatch.objects.bulk_create(rows)
+        _trim(full, limit)
+    return matches
+
+
+def _trim(owners, limit):
+    # Полные списки, в которые добавлена запись, обрезаются до limit лучших
+    for pk in owners:
+        extra = list(AdMatch.objects.filter(ad_id=pk).order_by(
+            '-score', '-candidate_id'
+        ).values_list('pk', flat=True)[limit:])
+        if extra:
+            AdMatch.objects.filter(pk__in=extra).delete()
+
+
+def remove_ads(pks):
+    """Убирает неактивные объявления из индекса и из всех списков."""
+    AdMatch.objects.filter(Q(ad__in=pks) | Q(candidate__in=pks)).delete()
+    AdTerm.objects.filter(ad__in=pks).delete()
+
+
+def refresh_ad(pk):
+    """Переиндексирует текст объявления и пересчитывает его совпадения."""
+    ad = Ad.objects.filter(pk=pk).only(
+        'id', 'user', 'title', 'description', 'category', 'condition', 'is_active'
+    ).first()
+    if ad is None:
+        return
+    if not ad.is_active:
+        remove_ads([pk])
+        return
+    index_terms([ad])
+    update_matches(ad)
+
+
+def get_matches(ad, limit=None):
+    """
+    Готовый список подходящих обменов (``AdMatch`` с кандидатами).
+
+    Если у активного объявления списка ещё нет, он считается и сохраняется.
+    """
+    limit = limit or get_matches_per_ad()
+    queryset = AdMatch.objects.filter(
+        ad=ad, candidate__is_active=True
+    ).select_related('candidate__user').order_by('-score', '-candidate_id')
+    matches = list(queryset[:limit])
+    if not matches and ad.is_active and not AdMatch.objects.filter(ad=ad).exists():
+        if not AdTerm.objects.filter(ad=ad).exists():
+            index_terms([ad])
+        update_matches(ad, limit)
+        matches = list(queryset[:limit])
+    return matches
+
+
+def rebuild(batch_size=1000, stdout=None):
+    """
+    Полный пересчёт: векторы всех объявлений и списки всех активных.
+
+    Частоты терминов считаются одним проходом по таблице, поэтому IDF
+    у всех векторов согласован.
+    """
+    ads = Ad.objects.filter(is_active=True).only(
+        'id', 'user', 'title', 'description', 'category', 'condition', 'is_active'
+    ).order_by('pk')
+
+    frequencies, total = Counter(), 0
+    for ad in ads.iterator(chunk_size=batch_size):
+        frequencies.update(term_counts(ad).keys())
+        total += 1
+
+    AdTerm.objects.all().delete()
+    batch = []
+    for ad in ads.iterator(chunk_size=batch_size):
+        batch.append(ad)
+        if len(batch) >= batch_size:
+            index_terms(batch, frequencies, total)
+            batch = []
+    index_terms(batch, frequencies, total)
+    cache.delete_many([AFFINITY_CACHE_KEY, TOTAL_CACHE_KEY])
+
+    AdMatch.objects.all().delete()
+    limit = get_matches_per_ad()
+    rows, processed = [], 0
+    for ad in ads.iterator(chunk_size=batch_size):
+        rows.extend(
+            AdMatch(ad_id=ad.pk, candidate_id=pk, score=score)
+            for pk, score in compute_matches(ad, limit)
+        )
+        processed += 1
+        if len(rows) >= batch_size:
+            AdMatch.objects.bulk_create(rows)
+            rows = []
+        if stdout is not None and processed % batch_size == 0:
+            stdout.write(f'  {processed}/{total}')
+    AdMatch.objects.bulk_create(rows)
+    return total
@@ -0,0 +1,205 @@
+"""
+Метрики запросов: число SQL-запросов, время в БД и общее время ответа.
+
+Данные копятся в памяти процесса в ``registry`` (гистограммы по имени
+URL и список самых медленных SQL-запросов с местом вызова) и отдаются
+представлением ``/metrics`` в текстовом формате Prometheus. Сбор ведёт
+``ads.middleware.QueryMetricsMiddleware``; его можно выключить на лету
+через ``registry.enabled``.
+"""
+
+import heapq
+import itertools
+import os
+import sys
+import threading
+from time import perf_counter
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин.
+
+    Attributes:
+        buckets (tuple): Верхние границы корзин (без +Inf).
+        counts (list): Число наблюдений по корзинам (не накопительное).
+        total (float): Сумма наблюдений.
+        count (int): Число наблюдений.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """Пары (граница, накопленное число) в формате Prometheus."""
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+
+class ViewStats:
+    """Статистика одного представления (имени URL)."""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+
+
+class QueryRecorder:
+    """
+    Обёртка ``connection.execute_wrapper``: считает запросы одного HTTP-запроса.
+
+    Место вызова (первый кадр стека из кода проекта) определяется только для
+    запросов, которые могут попасть в список самых медленных.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.count = 0
+        self.duration = 0.0
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.registry.is_slow(duration):
+                self.slow.append((duration, sql, _query_origin()))
+
+
+class MetricsRegistry:
+    """
+    Хранилище метрик процесса.
+
+    Attributes:
+        enabled (bool): Включён ли сбор метрик.
+        slow_query_limit (int): Сколько самых медленных запросов хранить.
+    """
+
+    def __init__(self, enabled=True, slow_query_limit=20):
+        self.enabled = enabled
+        self.slow_query_limit = slow_query_limit
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self._slow_queries = []  # min-куча (длительность, номер, sql, view, origin)
+            self._sequence = itertools.count()
+
+    def is_slow(self, duration):
+        """Попадёт ли запрос с такой длительностью в список медленных."""
+        slow = self._slow_queries
+        if len(slow) < self.slow_query_limit:
+            return True
+        # При METRICS_SLOW_QUERY_LIMIT=0 список всегда пуст
+        return bool(slow) and duration > slow[0][0]
+
+    def observe(self, view_name, latency, recorder):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = ViewStats()
+            stats.latency.observe(latency)
+            stats.db_time.observe(recorder.duration)
+            stats.queries.observe(recorder.count)
+            for duration, sql, origin in recorder.slow:
+                item = (duration, next(self._sequence), sql, view_name, origin)
+                if len(self._slow_queries) < self.slow_query_limit:
+                    heapq.heappush(self._slow_queries, item)
+                elif self._slow_queries and duration > self._slow_queries[0][0]:
+                    heapq.heapreplace(self._slow_queries, item)
+
+    def slow_queries(self):
+        """Самые медленные запросы, от самого медленного."""
+        with self._lock:
+            return sorted(self._slow_queries, reverse=True)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            views = sorted(self._views.items())
+        lines = []
+        for name, help_text, attribute in (
+            ('barter_http_request_duration_seconds', 'Время обработки запроса', 'latency'),
+            ('barter_db_time_seconds', 'Время SQL-запросов за HTTP-запрос', 'db_time'),
+            ('barter_db_queries_per_request', 'Число SQL-запросов за HTTP-запрос', 'queries'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for view_name, stats in views:
+                histogram = getattr(stats, attribute)
+                view = _label(view_name)
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{view="{view}"}} {histogram.total}')
+                lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+
+        name = 'barter_slow_query_duration_seconds'
+        lines.append(f'# HELP {name} Самые медленные SQL-запросы и место их вызова')
+        lines.append(f'# TYPE {name} gauge')
+        for rank, (duration, _, sql, view_name, origin) in enumerate(self.slow_queries(), start=1):
+            lines.append(
+                f'{name}{{rank="{rank}",view="{_label(view_name)}",'
+                f'origin="{_label(origin)}",sql="{_label(sql[:300])}"}} {duration}'
+            )
+
+        lines.append('# HELP barter_metrics_enabled Включён ли сбор метрик')
+        lines.append('# TYPE barter_metrics_enabled gauge')
+        lines.append(f'barter_metrics_enabled {int(self.enabled)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    """Экранирует значение метки Prometheus."""
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+# Кадры самого сборщика метрик не считаются местом вызова
+_SKIP_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'middleware.py'),
+}
+
+
+def _query_origin():
+    """Ближайший кадр стека из кода проекта (не Django и не этот модуль)."""
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(base_dir) and filename not in _SKIP_FILES
+                and 'site-packages' not in filename):
+            return (f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} '
+                    f'in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return 'unknown'
+
+
+registry = MetricsRegistry(
+    enabled=getattr(settings, 'METRICS_ENABLED', True),
+    slow_query_limit=getattr(settings, 'METRICS_SLOW_QUERY_LIMIT', 20),
+)
@@ -0,0 +1,113 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+from . import routers
+from .metrics import QueryRecorder, registry
+
+
+class QueryMetricsMiddleware:
+    """
+    Собирает метрики каждого запроса: число SQL-запросов, время в БД
+    и общее время ответа, сгруппированные по имени URL.
+
+    Когда сбор выключен (``registry.enabled = False``), стоимость —
+    одна проверка флага. Работает и под ASGI, не переводя цепочку
+    middleware в синхронный режим.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not registry.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(registry)
+        start = perf_counter()
+        with _record_queries(recorder):
+            response = self.get_response(request)
+        self.observe(request, start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not registry.enabled:
+            return await self.get_response(request)
+
+        # Под ASGI запросы к БД идут в потоке sync_to_async (один на
+        # HTTP-запрос), и соединения там свои: обёртка ставится в нём
+        recorder = QueryRecorder(registry)
+        start = perf_counter()
+        stack = await sync_to_async(_record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(request, start, recorder)
+        return response
+
+    def observe(self, request, start, recorder):
+        latency = perf_counter() - start
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        registry.observe(view_name, latency, recorder)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Направляет чтения представлений с ``replica_reads = True`` на реплику
+    и закрепляет клиента за основной базой после изменяющих запросов
+    (см. ``ads.routers``). Без настроенных реплик ничего не делает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.set_replica(None)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.set_replica(None)
+        return self.process_response(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Под ASGI метод выполняется через sync_to_async, который переносит
+        # изменения contextvars обратно в задачу запроса
+        view_class = getattr(view_func, 'view_class', None)
+        routers.set_replica(routers.choose_replica(request, view_class))
+
+    def process_response(self, request, response):
+        if (routers.get_replicas() and request.method not in routers.SAFE_METHODS
+                and response.status_code < 400):
+            routers.pin(response)
+        return response
+
+
+def _record_queries(recorder):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
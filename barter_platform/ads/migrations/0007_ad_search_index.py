@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from ads.search import get_backend
+
+    alias = schema_editor.connection.alias
+    backend = get_backend(alias)
+    backend.install()
+    backend.index(apps.get_model('ads', 'Ad').objects.using(alias).iterator())
+
+
+def uninstall_search_index(apps, schema_editor):
+    from ads.search import get_backend
+
+    get_backend(schema_editor.connection.alias).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_ad_is_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
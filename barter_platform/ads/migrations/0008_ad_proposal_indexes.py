@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 17:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def remove_duplicate_proposals(apps, schema_editor):
+    """
+    Оставляет одно предложение для каждой пары объявлений.
+
+    Принятое предложение важнее отклонённого, завершённое — ожидающего:
+    иначе удаление дубликатов отменило бы уже состоявшийся обмен. Среди
+    предложений с одним статусом остаётся самое раннее.
+    """
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    db_alias = schema_editor.connection.alias
+    proposals = ExchangeProposal.objects.using(db_alias)
+    duplicates = proposals.values('ad_sender', 'ad_receiver').annotate(
+        total=Count('id')
+    ).filter(total__gt=1)
+    rank = Case(
+        When(status='accepted', then=Value(0)),
+        When(status='rejected', then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    for pair in duplicates:
+        group = proposals.filter(ad_sender=pair['ad_sender'], ad_receiver=pair['ad_receiver'])
+        keep_id = group.annotate(rank=rank).order_by('rank', 'id').values_list('id', flat=True)[0]
+        group.exclude(id=keep_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_ad_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='ad_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at'], name='ad_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['condition', '-created_at'], name='ad_active_condition_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created_at'], name='ad_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['ad_receiver', 'status', '-created_at'], name='proposal_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['ad_sender', 'status', '-created_at'], name='proposal_sender_status_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_proposals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangeproposal',
+            constraint=models.UniqueConstraint(fields=('ad_sender', 'ad_receiver'), name='unique_proposal_pair'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 17:21
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    db_alias = schema_editor.connection.alias
+    proposals = ExchangeProposal.objects.using(db_alias)
+
+    received = proposals.values('ad_receiver', 'status').annotate(total=Count('id')).order_by()
+    for row in received:
+        Ad.objects.using(db_alias).filter(pk=row['ad_receiver']).update(
+            **{f'received_{row["status"]}_count': row['total']}
+        )
+    sent = proposals.filter(status='pending').values('ad_sender').annotate(total=Count('id')).order_by()
+    for row in sent:
+        Ad.objects.using(db_alias).filter(pk=row['ad_sender']).update(
+            sent_pending_count=row['total']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_ad_proposal_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='received_accepted_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Входящих принято'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Входящих в ожидании'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_rejected_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Входящих отклонено'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='sent_pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Исходящих в ожидании'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0009_ad_proposal_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата расчёта')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='ads.ad', verbose_name='Объявление')),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ads.ad', verbose_name='Подходящее объявление')),
+            ],
+            options={
+                'verbose_name': 'Подходящий обмен',
+                'verbose_name_plural': 'Подходящие обмены',
+                'indexes': [models.Index(fields=['ad', '-score'], name='admatch_ad_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ad', 'candidate'), name='unique_ad_match')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AdTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.IntegerField(verbose_name='Термин')),
+                ('weight', models.FloatField(verbose_name='Вес')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='ads.ad', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Термин объявления',
+                'verbose_name_plural': 'Термины объявлений',
+                'indexes': [models.Index(fields=['term', 'ad'], name='adterm_term_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ad', 'term'), name='unique_ad_term')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0010_ad_matching'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ цепочки')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('accepted', 'Принята'), ('rejected', 'Отклонена'), ('broken', 'Неактуальна')], default='pending', max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Обмен по цепочке',
+                'verbose_name_plural': 'Обмены по цепочке',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TradeCycleLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(verbose_name='Номер')),
+                ('confirmed', models.BooleanField(default=False, verbose_name='Подтверждено')),
+                ('cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='ads.tradecycle', verbose_name='Обмен')),
+                ('gives', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ads.ad', verbose_name='Отдаёт')),
+                ('proposal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cycle_legs', to='ads.exchangeproposal', verbose_name='Предложение')),
+                ('receives', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ads.ad', verbose_name='Получает')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trade_cycle_legs', to=settings.AUTH_USER_MODEL, verbose_name='Участник')),
+            ],
+            options={
+                'verbose_name': 'Участник обмена по цепочке',
+                'verbose_name_plural': 'Участники обменов по цепочке',
+                'ordering': ['cycle', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('cycle', 'position'), name='unique_cycle_position'), models.UniqueConstraint(fields=('cycle', 'user'), name='unique_cycle_user')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0011_trade_cycles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_url', models.URLField(verbose_name='Ссылка на изображение')),
+                ('status', models.CharField(choices=[('ready', 'Готово'), ('failed', 'Ошибка')], max_length=20, verbose_name='Статус')),
+                ('content_hash', models.CharField(blank=True, max_length=64, verbose_name='Хеш содержимого')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('thumbnails', models.JSONField(blank=True, default=list, verbose_name='Миниатюры')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('fetched_at', models.DateTimeField(auto_now=True, verbose_name='Дата загрузки')),
+                ('ad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='image', to='ads.ad', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Изображение объявления',
+                'verbose_name_plural': 'Изображения объявлений',
+            },
+        ),
+    ]
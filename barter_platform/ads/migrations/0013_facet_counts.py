@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_facets(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    FacetCount = apps.get_model('ads', 'FacetCount')
+    db_alias = schema_editor.connection.alias
+    rows = Ad.objects.using(db_alias).filter(is_active=True).values(
+        'category', 'condition'
+    ).annotate(total=Count('id')).order_by()
+    FacetCount.objects.using(db_alias).bulk_create([
+        FacetCount(category=row['category'], condition=row['condition'], count=row['total'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0012_ad_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=50, verbose_name='Категория')),
+                ('condition', models.CharField(max_length=50, verbose_name='Состояние')),
+                ('count', models.IntegerField(default=0, verbose_name='Объявлений')),
+            ],
+            options={
+                'verbose_name': 'Счётчик фасета',
+                'verbose_name_plural': 'Счётчики фасетов',
+                'constraints': [models.UniqueConstraint(fields=('category', 'condition'), name='unique_facet_count')],
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
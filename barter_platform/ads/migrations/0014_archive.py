@@ -0,0 +1,73 @@
+# Generated by Django 5.2 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0013_facet_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAd',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('description', models.TextField(verbose_name='Описание')),
+                ('image_url', models.URLField(blank=True, null=True, verbose_name='Ссылка на изображение')),
+                ('category', models.CharField(choices=[('electronics', 'Электроника'), ('clothing', 'Одежда'), ('books', 'Книги'), ('home', 'Для дома'), ('other', 'Другое')], max_length=50, verbose_name='Категория')),
+                ('condition', models.CharField(choices=[('new', 'Новый'), ('used', 'Б/у'), ('broken', 'Требует ремонта')], max_length=50, verbose_name='Состояние товара')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Объявление в архиве',
+                'verbose_name_plural': 'Объявления в архиве',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedProposal',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ad_sender', models.BigIntegerField(db_index=True, verbose_name='Объявление отправителя')),
+                ('ad_receiver', models.BigIntegerField(db_index=True, verbose_name='Объявление получателя')),
+                ('ad_sender_title', models.CharField(max_length=200, verbose_name='Заголовок объявления отправителя')),
+                ('ad_receiver_title', models.CharField(max_length=200, verbose_name='Заголовок объявления получателя')),
+                ('comment', models.TextField(verbose_name='Комментарий')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('accepted', 'Принята'), ('rejected', 'Отклонена')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Предложение в архиве',
+                'verbose_name_plural': 'Предложения в архиве',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['updated_at'], name='ad_inactive_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_ads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='archivedproposal',
+            name='receiver',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Получатель'),
+        ),
+        migrations.AddField(
+            model_name='archivedproposal',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель'),
+        ),
+    ]
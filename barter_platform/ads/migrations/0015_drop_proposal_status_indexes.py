@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 20:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0014_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='exchangeproposal',
+            name='proposal_receiver_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='exchangeproposal',
+            name='proposal_sender_status_idx',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 20:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0015_drop_proposal_status_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ad_active_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ad_active_category_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ad_active_condition_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ad',
+            name='ad_user_active_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='ad_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at', '-id'], name='ad_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['condition', '-created_at', '-id'], name='ad_active_condition_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created_at', '-id'], name='ad_user_active_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from django.db import models
 from django.urls import reverse
 
@@ -17,6 +19,13 @@ class Ad(models.Model):
         created_at (DateTimeField): Дата создания объявления (автоматически).
         updated_at (DateTimeField): Дата последнего обновления (автоматически).
         is_active (BooleanField): Доступность товара (активный/не активный)
+        received_pending_count (PositiveIntegerField): Входящие предложения в ожидании.
+        received_accepted_count (PositiveIntegerField): Принятые входящие предложения.
+        received_rejected_count (PositiveIntegerField): Отклонённые входящие предложения.
+        sent_pending_count (PositiveIntegerField): Исходящие предложения в ожидании.
+
+    Счётчики предложений денормализованы: их обновляет ``ads.services``,
+    а расхождения исправляет команда ``reconcile_proposal_counters``.
     """
 
     # Выбор категории
@@ -77,6 +86,58 @@ class Ad(models.Model):
         default=True, 
         verbose_name="Активно"
     )
+    received_pending_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Входящих в ожидании'
+    )
+    received_accepted_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Входящих принято'
+    )
+    received_rejected_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Входящих отклонено'
+    )
+    sent_pending_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Исходящих в ожидании'
+    )
+
+    # Счётчики меняются только через F()-выражения, поэтому обычное
+    # сохранение объявления их не перезаписывает устаревшими значениями
+    COUNTER_FIELDS = (
+        'received_pending_count', 'received_accepted_count',
+        'received_rejected_count', 'sent_pending_count',
+    )
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.COUNTER_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def received_proposals_total(self):
+        return (self.received_pending_count + self.received_accepted_count +
+                self.received_rejected_count)
+
+    @property
+    def thumbnail(self):
+        """Миниатюры текущего изображения (``AdImage``) или None, пока их нет."""
+        try:
+            image = self.image
+        except ObjectDoesNotExist:
+            return None
+        if image.status == 'ready' and image.source_url == self.image_url:
+            return image
+        return None
 
     def get_absolute_url(self):
         return reverse('ad_detail', kwargs={'pk': self.pk})
@@ -88,6 +149,111 @@ class Ad(models.Model):
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
         ordering = ['-created_at']
+        # Все горячие запросы работают только с активными объявлениями,
+        # поэтому индексы частичные: неактивные строки в них не попадают.
+        # Индексы заканчиваются полным ключом курсора (-created_at, -id):
+        # страница читается по индексу без сортировки
+        indexes = [
+            # Лента: новые сверху
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_created_idx'
+            ),
+            # Лента с фильтрами по категории и состоянию
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_category_idx'
+            ),
+            models.Index(
+                fields=['condition', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_active_condition_idx'
+            ),
+            # «Мои объявления»
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='ad_user_active_idx'
+            ),
+            # Кандидаты на перенос в архив (ads.archive)
+            models.Index(
+                fields=['updated_at'],
+                condition=models.Q(is_active=False),
+                name='ad_inactive_updated_idx'
+            ),
+        ]
+
+
+class AdImage(models.Model):
+    """
+    Загруженное изображение объявления и его миниатюры (см. ``ads.images``).
+
+    Attributes:
+        STATUS_CHOICES (list): Варианты статусов загрузки.
+        ad (OneToOneField): Объявление.
+        source_url (URLField): Адрес, с которого загружено изображение.
+        status (CharField): Статус загрузки.
+        content_hash (CharField): SHA-256 исходного файла.
+        width (PositiveIntegerField): Ширина исходного изображения.
+        height (PositiveIntegerField): Высота исходного изображения.
+        thumbnails (JSONField): Миниатюры от меньшей к большей: словари с
+            ключами ``width``, ``height``, ``webp`` и ``jpeg`` (имена файлов
+            в хранилище).
+        error (TextField): Почему изображение не удалось загрузить.
+        fetched_at (DateTimeField): Дата загрузки.
+    """
+
+    STATUS_CHOICES = [
+        ('ready', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    ad = models.OneToOneField(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='image',
+        verbose_name='Объявление'
+    )
+    source_url = models.URLField(verbose_name='Ссылка на изображение')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name='Статус')
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name='Хеш содержимого')
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name='Ширина')
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name='Высота')
+    thumbnails = models.JSONField(default=list, blank=True, verbose_name='Миниатюры')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    fetched_at = models.DateTimeField(auto_now=True, verbose_name='Дата загрузки')
+
+    def _srcset(self, image_format):
+        return ', '.join(
+            f'{default_storage.url(item[image_format])} {item["width"]}w'
+            for item in self.thumbnails
+        )
+
+    @property
+    def webp_srcset(self):
+        return self._srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        return self._srcset('jpeg')
+
+    @property
+    def largest(self):
+        return self.thumbnails[-1]
+
+    @property
+    def src(self):
+        """Наибольшая JPEG-миниатюра — для браузеров без ``srcset``."""
+        return default_storage.url(self.largest['jpeg'])
+
+    def __str__(self):
+        return f'{self.source_url} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Изображение объявления'
+        verbose_name_plural = 'Изображения объявлений'
 
 
 class ExchangeProposal(models.Model):
@@ -142,3 +308,319 @@ class ExchangeProposal(models.Model):
         verbose_name = 'Предложение обмена'
         verbose_name_plural = 'Предложения обмена'
         ordering = ['-created_at']
+        # Отдельных индексов для «Моих предложений» нет: выборка идёт по
+        # объявлениям пользователя через индексы внешних ключей, а общий
+        # порядок по нескольким объявлениям индекс предложения дать не может
+        constraints = [
+            # Одна пара объявлений — одно предложение (индекс покрывает
+            # и поиск дубликата, и выборку по ad_sender)
+            models.UniqueConstraint(
+                fields=['ad_sender', 'ad_receiver'],
+                name='unique_proposal_pair'
+            ),
+        ]
+
+
+class AdTerm(models.Model):
+    """
+    Термин текстового вектора объявления (инвертированный индекс подбора обменов).
+
+    Attributes:
+        ad (ForeignKey): Объявление.
+        term (IntegerField): Хеш основы слова (см. ``ads.matching.term_hash``).
+        weight (FloatField): Вес термина в объявлении без учёта IDF.
+    """
+
+    ad = models.ForeignKey(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='terms',
+        verbose_name='Объявление'
+    )
+    term = models.IntegerField(verbose_name='Термин')
+    weight = models.FloatField(verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'Термин объявления'
+        verbose_name_plural = 'Термины объявлений'
+        constraints = [
+            models.UniqueConstraint(fields=['ad', 'term'], name='unique_ad_term'),
+        ]
+        indexes = [
+            # Поиск объявлений по термину и частота термина
+            models.Index(fields=['term', 'ad'], name='adterm_term_idx'),
+        ]
+
+
+class AdMatch(models.Model):
+    """
+    Предвычисленная рекомендация обмена: ``candidate`` подходит для ``ad``.
+
+    Attributes:
+        ad (ForeignKey): Объявление, для которого подобран обмен.
+        candidate (ForeignKey): Подходящее чужое объявление.
+        score (FloatField): Оценка от 0 до 1, чем больше — тем лучше.
+        updated_at (DateTimeField): Когда оценка была посчитана.
+    """
+
+    ad = models.ForeignKey(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='matches',
+        verbose_name='Объявление'
+    )
+    candidate = models.ForeignKey(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Подходящее объявление'
+    )
+    score = models.FloatField(verbose_name='Оценка')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Подходящий обмен'
+        verbose_name_plural = 'Подходящие обмены'
+        constraints = [
+            models.UniqueConstraint(fields=['ad', 'candidate'], name='unique_ad_match'),
+        ]
+        indexes = [
+            # Лучшие совпадения объявления
+            models.Index(fields=['ad', '-score'], name='admatch_ad_score_idx'),
+        ]
+
+
+class FacetCount(models.Model):
+    """
+    Число активных объявлений с данной парой категории и состояния.
+
+    Счётчики фасетов ленты без поиска читаются из этой таблицы, а не
+    считаются ``GROUP BY`` по всем объявлениям. Их обновляет
+    ``ads.facets`` при создании, изменении, скрытии и удалении объявлений;
+    расхождения исправляет команда ``rebuild_facets``.
+
+    Attributes:
+        category (CharField): Категория.
+        condition (CharField): Состояние.
+        count (IntegerField): Число активных объявлений.
+    """
+
+    category = models.CharField(max_length=50, verbose_name='Категория')
+    condition = models.CharField(max_length=50, verbose_name='Состояние')
+    count = models.IntegerField(default=0, verbose_name='Объявлений')
+
+    class Meta:
+        verbose_name = 'Счётчик фасета'
+        verbose_name_plural = 'Счётчики фасетов'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'condition'], name='unique_facet_count'),
+        ]
+
+
+class TradeCycle(models.Model):
+    """
+    Многосторонний обмен по цепочке ожидающих предложений (A→B→C→A).
+
+    Каждый участник отдаёт своё объявление предыдущему участнику цепочки
+    и получает объявление следующего. Обмен совершается, когда его
+    подтвердили все участники (см. ``ads.services.accept_cycle``).
+
+    Attributes:
+        STATUS_CHOICES (list): Варианты статусов обмена.
+        key (CharField): Отсортированные id предложений цепочки (для дедупликации).
+        status (CharField): Текущий статус обмена.
+        created_at (DateTimeField): Дата обнаружения цепочки (автоматически).
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('accepted', 'Принята'),
+        ('rejected', 'Отклонена'),
+        ('broken', 'Неактуальна'),
+    ]
+
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Ключ цепочки'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Статус'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    def __str__(self):
+        return f'Цепочка #{self.id} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Обмен по цепочке'
+        verbose_name_plural = 'Обмены по цепочке'
+        ordering = ['-created_at']
+
+
+class TradeCycleLeg(models.Model):
+    """
+    Участник обмена по цепочке.
+
+    Attributes:
+        cycle (ForeignKey): Обмен, к которому относится участник.
+        position (PositiveSmallIntegerField): Номер участника в цепочке.
+        user (ForeignKey): Участник (владелец отправителя предложения).
+        proposal (ForeignKey): Предложение участника, на котором основано звено.
+        receives (ForeignKey): Объявление, которое участник получает.
+        gives (ForeignKey): Объявление участника, которое он отдаёт.
+        confirmed (BooleanField): Подтвердил ли участник обмен.
+    """
+
+    cycle = models.ForeignKey(
+        TradeCycle,
+        on_delete=models.CASCADE,
+        related_name='legs',
+        verbose_name='Обмен'
+    )
+    position = models.PositiveSmallIntegerField(verbose_name='Номер')
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='trade_cycle_legs',
+        verbose_name='Участник'
+    )
+    proposal = models.ForeignKey(
+        ExchangeProposal,
+        on_delete=models.CASCADE,
+        related_name='cycle_legs',
+        verbose_name='Предложение'
+    )
+    receives = models.ForeignKey(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Получает'
+    )
+    gives = models.ForeignKey(
+        Ad,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Отдаёт'
+    )
+    confirmed = models.BooleanField(default=False, verbose_name='Подтверждено')
+
+    class Meta:
+        verbose_name = 'Участник обмена по цепочке'
+        verbose_name_plural = 'Участники обменов по цепочке'
+        ordering = ['cycle', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['cycle', 'position'], name='unique_cycle_position'),
+            models.UniqueConstraint(fields=['cycle', 'user'], name='unique_cycle_user'),
+        ]
+
+
+class ArchivedAd(models.Model):
+    """
+    Объявление в архиве (см. ``ads.archive``).
+
+    Сюда переносятся объявления, неактивные дольше ``ADS_ARCHIVE_AFTER_DAYS``
+    дней, чтобы они не занимали горячую таблицу ``Ad``. Первичный ключ
+    сохраняется, поэтому адрес объявления не меняется.
+
+    Attributes:
+        id (BigIntegerField): Первичный ключ объявления.
+        user (ForeignKey): Пользователь, создавший объявление.
+        title (CharField): Заголовок объявления.
+        description (TextField): Подробное описание товара.
+        image_url (URLField): Ссылка на изображение товара.
+        category (CharField): Категория товара.
+        condition (CharField): Состояние товара.
+        created_at (DateTimeField): Дата создания объявления.
+        updated_at (DateTimeField): Дата последнего обновления.
+        archived_at (DateTimeField): Дата переноса в архив (автоматически).
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='archived_ads',
+        verbose_name='Пользователь'
+    )
+    title = models.CharField(max_length=200, verbose_name='Заголовок')
+    description = models.TextField(verbose_name='Описание')
+    image_url = models.URLField(blank=True, null=True, verbose_name='Ссылка на изображение')
+    category = models.CharField(max_length=50, choices=Ad.CATEGORY_CHOICE, verbose_name='Категория')
+    condition = models.CharField(max_length=50, choices=Ad.CONDITION_CHOICE, verbose_name='Состояние товара')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    def get_absolute_url(self):
+        return reverse('ad_detail', kwargs={'pk': self.pk})
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'Объявление в архиве'
+        verbose_name_plural = 'Объявления в архиве'
+        ordering = ['-created_at']
+
+
+class ArchivedProposal(models.Model):
+    """
+    Завершённое предложение обмена в архиве (см. ``ads.archive``).
+
+    Объявления предложения могут быть и в архиве, и в таблице ``Ad``,
+    поэтому они хранятся первичными ключами, а заголовки и владельцы —
+    копией на момент архивации.
+
+    Attributes:
+        id (BigIntegerField): Первичный ключ предложения.
+        ad_sender (BigIntegerField): Объявление отправителя.
+        ad_receiver (BigIntegerField): Объявление получателя.
+        ad_sender_title (CharField): Заголовок объявления отправителя.
+        ad_receiver_title (CharField): Заголовок объявления получателя.
+        sender (ForeignKey): Владелец объявления отправителя.
+        receiver (ForeignKey): Владелец объявления получателя.
+        comment (TextField): Комментарий к предложению.
+        status (CharField): Статус предложения (принято или отклонено).
+        created_at (DateTimeField): Дата создания предложения.
+        archived_at (DateTimeField): Дата переноса в архив (автоматически).
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    ad_sender = models.BigIntegerField(db_index=True, verbose_name='Объявление отправителя')
+    ad_receiver = models.BigIntegerField(db_index=True, verbose_name='Объявление получателя')
+    ad_sender_title = models.CharField(max_length=200, verbose_name='Заголовок объявления отправителя')
+    ad_receiver_title = models.CharField(max_length=200, verbose_name='Заголовок объявления получателя')
+    sender = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Отправитель'
+    )
+    receiver = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Получатель'
+    )
+    comment = models.TextField(verbose_name='Комментарий')
+    status = models.CharField(max_length=20, choices=ExchangeProposal.STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    def get_absolute_url(self):
+        return reverse('proposal_detail', kwargs={'pk': self.pk})
+
+    def __str__(self):
+        return f'Предложение #{self.id} ({self.status}, архив)'
+
+    class Meta:
+        verbose_name = 'Предложение в архиве'
+        verbose_name_plural = 'Предложения в архиве'
+        ordering = ['-created_at']
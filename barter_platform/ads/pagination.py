@@ -0,0 +1,222 @@
+"""
+Keyset-пагинация (пагинация по курсору).
+
+Вместо ``OFFSET`` следующая страница выбирается условием «строго после
+последней показанной строки» по упорядочиванию вида
+``('-created_at', '-id')``, поэтому глубина страницы не влияет на скорость
+запроса, а ``COUNT(*)`` не нужен: выбирается ``per_page + 1`` строка, и
+лишняя строка говорит о наличии следующей страницы.
+
+Курсор — подписанная (``django.core.signing``) строка с позицией и
+направлением. Подпись привязана к упорядочиванию, поэтому подделанный или
+чужой курсор отклоняется исключением ``InvalidCursor``.
+"""
+
+import datetime
+from dataclasses import dataclass
+
+from django.core import signing
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_SALT = 'ads.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    """Курсор повреждён, подделан или создан для другого упорядочивания."""
+
+
+@dataclass
+class Position:
+    """
+    Позиция курсора.
+
+    Attributes:
+        values (list): Значения полей упорядочивания у граничной строки.
+        reverse (bool): True, если курсор ведёт на предыдущую страницу.
+    """
+
+    values: list
+    reverse: bool = False
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации.
+
+    Повторяет ту часть интерфейса ``django.core.paginator.Page``, которая
+    имеет смысл без подсчёта строк.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Постраничная выборка по ключу упорядочивания.
+
+    Attributes:
+        queryset (QuerySet): Исходная выборка.
+        per_page (int): Размер страницы.
+        ordering (tuple): Поля упорядочивания; последнее должно быть уникальным.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.salt = f'{CURSOR_SALT}:{",".join(self.ordering)}'
+
+    def page(self, cursor=None):
+        """Возвращает страницу по курсору (None — первая страница)."""
+        position = self.decode(cursor)
+        return self.build_page(list(self.page_queryset(position)), position)
+
+    async def apage(self, cursor=None):
+        """Асинхронный вариант ``page`` для async-представлений."""
+        position = self.decode(cursor)
+        return self.build_page([row async for row in self.page_queryset(position)], position)
+
+    def page_queryset(self, position):
+        """Запрос строк страницы; на одну строку больше размера страницы."""
+        reverse = position is not None and position.reverse
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._after(position.values, reverse))
+        return queryset[:self.per_page + 1]
+
+    def build_page(self, rows, position):
+        """Собирает страницу из строк, выбранных ``page_queryset``."""
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if position is not None and position.reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode(Position(self._values(rows[-1])))
+        if rows and has_previous:
+            previous_cursor = self.encode(Position(self._values(rows[0]), reverse=True))
+        return KeysetPage(rows, has_next, has_previous, next_cursor, previous_cursor)
+
+    def encode(self, position):
+        values = [_encode_value(value) for value in position.values]
+        return signing.dumps([values, int(position.reverse)], salt=self.salt)
+
+    def decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values, reverse = signing.loads(cursor, salt=self.salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        return Position(values, bool(reverse))
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _order_by(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(
+            name if descending else f'-{name}'
+            for name, descending in self._fields()
+        )
+
+    def _after(self, values, reverse):
+        """
+        Условие «строка идёт после позиции» для составного ключа:
+        (a < x) OR (a = x AND b < y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _values(self, row):
+        return [
+            row[name] if isinstance(row, dict) else getattr(row, name)
+            for name, _ in self._fields()
+        ]
+
+
+def _encode_value(value):
+    # isoformat сохраняет микросекунды, в отличие от DjangoJSONEncoder
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset-пагинация для ``ListView``.
+
+    Страница выбирается по параметру ``cursor``. Нумерованные страницы
+    (с ``COUNT(*)``) используются, только если явно передан ``page``.
+    """
+
+    cursor_ordering = ('-created_at', '-id')
+    cursor_kwarg = 'cursor'
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.request.GET or self.page_kwarg in self.kwargs:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_cursor_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы')
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Асинхронный вариант ``paginate_queryset`` (``acount`` вместо ``count``)."""
+        if self.page_kwarg in self.request.GET or self.page_kwarg in self.kwargs:
+            paginator = self.get_paginator(queryset, page_size)
+            paginator.count = await queryset.acount()
+            number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+            try:
+                page = paginator.page(paginator.num_pages if number == 'last' else number)
+            except InvalidPage:
+                raise Http404('Некорректный номер страницы')
+            page.object_list = [row async for row in page.object_list]
+            return paginator, page, page.object_list, page.has_other_pages()
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_cursor_ordering())
+        try:
+            page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы')
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,290 @@
+"""
+Ограничение частоты запросов (token bucket).
+
+Бюджет задаётся строкой ``"N/период"`` (``20/m``, ``1000/h``, ``5/10s``):
+в «ведре» ``N`` жетонов, и за период они полностью восстанавливаются. Запрос
+тратит жетон; когда жетонов нет, он отклоняется ответом 429 с заголовком
+``Retry-After`` — через сколько секунд появится следующий жетон.
+
+Ведро хранится одним значением (алгоритм GCRA): временем, когда ведро
+снова станет полным. Проверка — одно чтение и одна запись в кеш
+``RATELIMIT_CACHE`` независимо от бюджета и числа запросов. Если общий кеш
+(Redis) недоступен, ведра временно хранятся в памяти процесса. Чтение и
+запись не атомарны: одновременные запросы одного клиента могут разово
+превысить бюджет на число параллельных запросов.
+
+Бюджеты (настройка ``RATELIMITS``, имя бюджета → строка или None) действуют:
+
+* ``RateLimitMiddleware`` — на все запросы с одного IP (бюджет ``global``);
+* декоратор ``ratelimit`` — на отдельные представления, по пользователю
+  (анонимы — по IP);
+* классы ``api.throttling`` — на запросы к API.
+"""
+
+import functools
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_RE = re.compile(r'(\d+)/(\d*)([smhd])[a-z]*')
+
+# Запасное хранилище на время недоступности общего кеша
+_local = LocMemCache('ads.ratelimit', {'OPTIONS': {'MAX_ENTRIES': 10000}})
+
+
+@dataclass
+class Decision:
+    """
+    Результат проверки бюджета.
+
+    Attributes:
+        allowed (bool): Запрос пропущен.
+        remaining (int): Сколько запросов ещё можно сделать сразу.
+        retry_after (float): Через сколько секунд появится жетон (0, если пропущен).
+    """
+
+    allowed: bool
+    remaining: int
+    retry_after: float = 0
+
+
+def is_enabled():
+    return getattr(settings, 'RATELIMIT_ENABLED', True)
+
+
+def get_rate(scope):
+    """Бюджет ``scope`` из ``RATELIMITS``; None — без ограничения."""
+    return getattr(settings, 'RATELIMITS', {}).get(scope)
+
+
+def parse_rate(rate):
+    """
+    Разбирает ``"N/период"``.
+
+    Returns:
+        tuple: (жетонов в ведре, период в секундах) или None без ограничения.
+
+    Raises:
+        ImproperlyConfigured: Строка бюджета в неверном формате.
+    """
+    if rate is None:
+        return None
+    match = RATE_RE.fullmatch(rate)
+    if not match:
+        raise ImproperlyConfigured(f'Неверный бюджет запросов: {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def client_ip(request):
+    """
+    IP клиента. За обратным прокси берётся последний адрес из заголовка
+    ``RATELIMIT_IP_HEADER`` (его дописывает сам прокси, подделать нельзя).
+    """
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request, by='user'):
+    """Ключ клиента: пользователь (``by='user'``, анонимы — по IP) или IP."""
+    user = getattr(request, 'user', None)
+    if by == 'user' and user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def _store():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+
+
+def _decide(tat, now, limit, period, cost):
+    # tat — момент, когда ведро снова полное; жетон восстанавливается за interval.
+    # Больше полного ведра запрос не тратит, иначе его нельзя было бы пропустить
+    cost = min(cost, limit)
+    interval = period / limit
+    tat = max(tat or now, now)
+    new_tat = tat + interval * cost
+    allow_at = new_tat - period
+    if allow_at > now:
+        return Decision(False, 0, allow_at - now), None
+    return Decision(True, int((now - allow_at) / interval)), new_tat
+
+
+def _read(cache_key):
+    try:
+        store = _store()
+        return store, store.get(cache_key)
+    except Exception:
+        logger.warning('Кеш ограничения запросов недоступен, ведра хранятся в памяти', exc_info=True)
+        return _local, _local.get(cache_key)
+
+
+def _write(store, cache_key, tat, now):
+    try:
+        store.set(cache_key, tat, math.ceil(tat - now))
+    except Exception:
+        _local.set(cache_key, tat, math.ceil(tat - now))
+
+
+def hit(scope, key, rate=None, cost=1, consume=True):
+    """
+    Тратит ``cost`` жетонов из ведра ``scope`` клиента ``key``.
+
+    Args:
+        rate: Бюджет; по умолчанию — ``RATELIMITS[scope]``.
+        cost: Сколько жетонов стоит запрос (например, число элементов
+            пакета); больше размера ведра не списывается.
+        consume: False — только проверить, пропустили бы запрос, не тратя жетоны.
+
+    Returns:
+        Decision: Пропущен ли запрос.
+    """
+    parsed = parse_rate(get_rate(scope) if rate is None else rate)
+    if parsed is None or not is_enabled():
+        return Decision(True, -1)
+    cache_key = f'ratelimit:{scope}:{key}'
+    now = time.time()
+    store, tat = _read(cache_key)
+    decision, new_tat = _decide(tat, now, *parsed, cost)
+    if new_tat is not None and consume:
+        _write(store, cache_key, new_tat, now)
+    return decision
+
+
+def refund(scope, key, rate=None, cost=1):
+    """
+    Возвращает в ведро ``cost`` жетонов, потраченных ``hit``: например,
+    когда запрос всё же отклонён по другому бюджету.
+    """
+    parsed = parse_rate(get_rate(scope) if rate is None else rate)
+    if parsed is None or not is_enabled():
+        return
+    limit, period = parsed
+    cache_key = f'ratelimit:{scope}:{key}'
+    now = time.time()
+    store, tat = _read(cache_key)
+    if tat is None:
+        return
+    tat -= period / limit * min(cost, limit)
+    if tat > now:
+        _write(store, cache_key, tat, now)
+    else:
+        # Ведро снова полное
+        try:
+            store.delete(cache_key)
+        except Exception:
+            _local.delete(cache_key)
+
+
+async def ahit(scope, key, rate=None, cost=1):
+    """Асинхронный вариант ``hit`` (``cache.aget``/``aset``)."""
+    parsed = parse_rate(get_rate(scope) if rate is None else rate)
+    if parsed is None or not is_enabled():
+        return Decision(True, -1)
+    cache_key = f'ratelimit:{scope}:{key}'
+    now = time.time()
+    try:
+        store = _store()
+        tat = await store.aget(cache_key)
+    except Exception:
+        logger.warning('Кеш ограничения запросов недоступен, ведра хранятся в памяти', exc_info=True)
+        store = _local
+        tat = store.get(cache_key)
+    decision, new_tat = _decide(tat, now, *parsed, cost)
+    if new_tat is not None:
+        try:
+            await store.aset(cache_key, new_tat, math.ceil(new_tat - now))
+        except Exception:
+            _local.set(cache_key, new_tat, math.ceil(new_tat - now))
+    return decision
+
+
+def too_many_requests(decision):
+    """Ответ 429 с ``Retry-After`` (целые секунды, с округлением вверх)."""
+    response = HttpResponse(
+        'Слишком много запросов. Повторите позже.',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(max(math.ceil(decision.retry_after), 1))
+    return response
+
+
+def ratelimit(scope, rate=None, by='user', methods=('POST',)):
+    """
+    Декоратор представления: бюджет ``scope`` для каждого клиента.
+
+    Для представлений-классов — через ``method_decorator(..., name='dispatch')``.
+
+    Args:
+        scope: Имя бюджета в ``RATELIMITS`` (и часть ключа ведра).
+        rate: Бюджет вместо ``RATELIMITS[scope]``.
+        by: ``'user'`` — по пользователю (анонимы по IP) или ``'ip'``.
+        methods: Какие методы ограничивать; None — все.
+    """
+    def decorator(view):
+        def limited(request):
+            return methods is not None and request.method not in methods
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not limited(request):
+                    decision = await ahit(scope, client_key(request, by), rate)
+                    if not decision.allowed:
+                        return too_many_requests(decision)
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not limited(request):
+                    decision = hit(scope, client_key(request, by), rate)
+                    if not decision.allowed:
+                        return too_many_requests(decision)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """
+    Общий бюджет ``global`` на все запросы с одного IP.
+
+    Стоит до сессий и аутентификации: отклонённый запрос не обращается к БД.
+    """
+
+    sync_capable = True
+    async_capable = True
+    scope = 'global'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        decision = hit(self.scope, client_key(request, 'ip'))
+        if not decision.allowed:
+            return too_many_requests(decision)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        decision = await ahit(self.scope, client_key(request, 'ip'))
+        if not decision.allowed:
+            return too_many_requests(decision)
+        return await self.get_response(request)
@@ -0,0 +1,85 @@
+"""
+Чтение с реплик базы данных.
+
+Реплики — псевдонимы из настройки ``DATABASE_REPLICAS`` (копии основной
+базы, которые поддерживает внешняя репликация). На реплику идут только
+чтения GET/HEAD-запросов к представлениям с атрибутом
+``replica_reads = True`` (лента, страница объявления, GET API); остальное
+— запись, POST-обработчики, сессии и очередь задач — работает с ``default``.
+
+Реплика отстаёт от основной базы, поэтому после изменяющего запроса
+клиент получает cookie ``PIN_COOKIE``: следующие
+``DATABASE_REPLICA_STICKY_SECONDS`` секунд его запросы читают с основной
+базы и видят собственные изменения. Реплика выбирается одна на запрос,
+чтобы все его чтения видели один и тот же срез данных.
+"""
+
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+# Таблицы, которые читаются сразу после записи в том же запросе
+PRIMARY_ONLY_APPS = {'sessions', 'jobs'}
+
+_replica = ContextVar('replica', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10)
+
+
+def is_pinned(request):
+    """Клиент недавно что-то изменил и должен читать с основной базы."""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def choose_replica(request, view_class):
+    """Реплика для чтений запроса или None, если читать с основной базы."""
+    replicas = get_replicas()
+    if (not replicas or request.method not in SAFE_METHODS
+            or not getattr(view_class, 'replica_reads', False) or is_pinned(request)):
+        return None
+    return random.choice(replicas)
+
+
+def pin(response):
+    """Закрепляет клиента за основной базой на время задержки репликации."""
+    seconds = get_sticky_seconds()
+    response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                        httponly=True, samesite='Lax')
+
+
+def set_replica(alias):
+    """Задаёт реплику для чтений текущего запроса (None — основная база)."""
+    _replica.set(alias)
+
+
+class ReplicaRouter:
+    """Роутер: чтения — на выбранную для запроса реплику, запись — на ``default``."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — та же база: объекты с неё можно связывать с основными
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in get_replicas()
@@ -0,0 +1,241 @@
+"""
+Полнотекстовый поиск по объявлениям.
+
+Поиск вынесен в подключаемые бэкенды. Каждый бэкенд ведёт собственный
+индекс рядом с таблицей ``ads_ad`` (синхронизируется сигналами из
+``ads.signals``) и умеет отфильтровать QuerySet объявлений по запросу,
+добавив аннотацию ``search_rank`` — чем больше значение, тем релевантнее.
+
+Бэкенд задаётся настройкой ``ADS_SEARCH_BACKEND`` (путь к классу). Если она
+не задана, бэкенд выбирается по движку базы данных:
+
+* SQLite — виртуальная таблица FTS5 с русским стеммингом на стороне Python;
+* PostgreSQL — таблица с ``tsvector`` и GIN-индексом, конфигурация ``russian``;
+* прочие — простой поиск через ``icontains``.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .stemming import WORD_RE, tokenize
+
+SQLITE_BACKEND = 'ads.search.SQLiteFTSBackend'
+POSTGRES_BACKEND = 'ads.search.PostgresSearchBackend'
+SIMPLE_BACKEND = 'ads.search.SimpleSearchBackend'
+
+
+class BaseSearchBackend:
+    """
+    Базовый класс поискового бэкенда.
+
+    Attributes:
+        using (str): Псевдоним базы данных, в которой хранится индекс.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def install(self):
+        """Создаёт структуры индекса (вызывается из миграции)."""
+
+    def uninstall(self):
+        """Удаляет структуры индекса."""
+
+    def index(self, ads):
+        """Добавляет или обновляет объявления в индексе."""
+
+    def remove(self, pks):
+        """Удаляет объявления из индекса по первичным ключам."""
+
+    def search(self, queryset, query):
+        """Фильтрует ``queryset`` по запросу и добавляет ``search_rank``."""
+        raise NotImplementedError
+
+    def empty(self, queryset):
+        """Пустой результат для запроса, в котором нет ни одного слова."""
+        return queryset.none().annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск без индекса: ``icontains`` по заголовку и описанию."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Индекс на виртуальной таблице SQLite FTS5.
+
+    В таблице хранятся уже приведённые к основам слова, поэтому запрос
+    стеммится тем же алгоритмом. Каждое слово запроса ищется по префиксу,
+    релевантность считается через ``bm25`` (заголовок весит вдвое больше).
+    """
+
+    table = 'ads_ad_fts'
+    title_weight = 2.0
+    description_weight = 1.0
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+                "USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, ads):
+        rows = [
+            (ad.pk, ' '.join(tokenize(ad.title)), ' '.join(tokenize(ad.description)))
+            for ad in ads
+        ]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                rows
+            )
+
+    def remove(self, pks):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(pk,) for pk in pks]
+            )
+
+    def build_query(self, query):
+        """Превращает пользовательский запрос в выражение FTS5 (или None)."""
+        terms = [f'"{term}"*' for term in tokenize(query)]
+        return ' '.join(terms) or None
+
+    def search(self, queryset, query):
+        match = self.build_query(query)
+        if match is None:
+            return self.empty(queryset)
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            pk__in=RawSQL(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+                (match,)
+            )
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({self.table}, %s, %s) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "{table}"."id"',
+            (self.title_weight, self.description_weight, match),
+            output_field=FloatField()
+        ))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Индекс на ``tsvector`` с GIN-индексом и русской конфигурацией.
+
+    Заголовок получает вес A, описание — вес B; релевантность считается
+    через ``ts_rank``. Строки индекса удаляются каскадно вместе с объявлением.
+    """
+
+    table = 'ads_ad_search'
+    config = 'russian'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'ad_id bigint PRIMARY KEY REFERENCES ads_ad (id) ON DELETE CASCADE, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table}_document_gin '
+                f'ON {self.table} USING GIN (document)'
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, ads):
+        rows = [(ad.pk, ad.title, ad.description) for ad in ads]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (ad_id, document) VALUES (%s, '
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B')) "
+                'ON CONFLICT (ad_id) DO UPDATE SET document = EXCLUDED.document',
+                rows
+            )
+
+    def remove(self, pks):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE ad_id = ANY(%s)', (list(pks),)
+            )
+
+    def build_query(self, query):
+        """
+        Собирает выражение для ``to_tsquery`` с поиском по префиксу.
+
+        Слова передаются как есть: основу выделяет сама ``to_tsquery`` той же
+        конфигурацией, что и ``to_tsvector`` при индексации. Стемминг на
+        стороне Python выделил бы основу дважды.
+        """
+        terms = [f'{word}:*' for word in WORD_RE.findall(query.lower())]
+        return ' & '.join(terms) or None
+
+    def search(self, queryset, query):
+        match = self.build_query(query)
+        if match is None:
+            return self.empty(queryset)
+        table = queryset.model._meta.db_table
+        tsquery = f"to_tsquery('{self.config}', %s)"
+        return queryset.filter(
+            pk__in=RawSQL(
+                f'SELECT ad_id FROM {self.table} WHERE document @@ {tsquery}',
+                (match,)
+            )
+        ).annotate(search_rank=RawSQL(
+            f'SELECT ts_rank(document, {tsquery}) FROM {self.table} '
+            f'WHERE ad_id = "{table}"."id"',
+            (match,),
+            output_field=FloatField()
+        ))
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLITE_BACKEND,
+    'postgresql': POSTGRES_BACKEND,
+}
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    """Возвращает (и кеширует) поисковый бэкенд для базы ``using``."""
+    path = getattr(settings, 'ADS_SEARCH_BACKEND', None)
+    if not path:
+        path = VENDOR_BACKENDS.get(connections[using].vendor, SIMPLE_BACKEND)
+    key = (path, using)
+    if key not in _backends:
+        _backends[key] = import_string(path)(using=using)
+    return _backends[key]
@@ -0,0 +1,415 @@
+"""
+Операции с предложениями обмена.
+
+Здесь собраны изменения, которые должны происходить вместе со сменой
+статуса предложения: обновление денормализованных счётчиков ``Ad``
+(атомарно, через ``F()``), деактивация объявлений и отклонение
+конкурирующих предложений при принятии обмена, в том числе
+многостороннего (по цепочке, см. ``ads.cycles``).
+Представления сайта и API вызывают эти функции, а не меняют статус сами.
+Создание и удаление предложений учитываются сигналами (``ads.signals``).
+"""
+
+import random
+import time
+from collections import defaultdict
+
+from django.db import OperationalError, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from jobs.queue import enqueue_many
+
+from . import caching, cycles, events, facets, matching, tasks
+from .models import Ad, ExchangeProposal, TradeCycle, TradeCycleLeg
+
+# Счётчик получателя для каждого статуса
+RECEIVED_COUNTERS = {
+    'pending': 'received_pending_count',
+    'accepted': 'received_accepted_count',
+    'rejected': 'received_rejected_count',
+}
+SENT_PENDING_COUNTER = 'sent_pending_count'
+COUNTER_FIELDS = list(Ad.COUNTER_FIELDS)
+# Сколько раз повторять сделку, которой SQLite отказал из-за блокировки
+LOCK_ATTEMPTS = 5
+
+
+def _status_deltas(proposal, old_status, new_status):
+    """Изменения счётчиков {ad_id: {поле: приращение}} при смене статуса."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for status, sign in ((old_status, -1), (new_status, 1)):
+        if status is None:
+            continue
+        deltas[proposal.ad_receiver_id][RECEIVED_COUNTERS[status]] += sign
+        if status == 'pending':
+            deltas[proposal.ad_sender_id][SENT_PENDING_COUNTER] += sign
+    return deltas
+
+
+def _counter_expression(field, delta):
+    # Уменьшение не уходит ниже нуля: разошедшийся счётчик не должен
+    # ломать принятие предложения, его исправит reconcile_proposal_counters
+    if delta < 0:
+        return Greatest(F(field) + delta, Value(0))
+    return F(field) + delta
+
+
+def _merge_deltas(deltas, more):
+    for ad_id, changes in more.items():
+        for field, delta in changes.items():
+            deltas[ad_id][field] += delta
+    return deltas
+
+
+def apply_counter_deltas(deltas):
+    """Применяет приращения счётчиков одним UPDATE на объявление."""
+    for ad_id, changes in deltas.items():
+        changes = {
+            field: _counter_expression(field, delta)
+            for field, delta in changes.items() if delta
+        }
+        if changes:
+            Ad.objects.filter(pk=ad_id).update(**changes)
+    if deltas:
+        caching.invalidate_ad_pages(deltas)
+
+
+def proposals_changed(changes, event_type=events.UPDATED):
+    """
+    Публикует события для потока SSE и ставит в очередь письма участникам.
+
+    Args:
+        changes: Пары (id предложения, новый статус).
+        event_type: Тип события SSE.
+    """
+    if not changes:
+        return
+    events.proposals_changed([pk for pk, _ in changes], event_type)
+    # Ключ защищает от повторного письма о том же статусе
+    enqueue_many(
+        tasks.notify_proposal,
+        [{'proposal_id': pk, 'status': status} for pk, status in changes],
+        keys=[f'notify-proposal:{pk}:{status}' for pk, status in changes],
+    )
+
+
+def update_counters(proposal, old_status, new_status):
+    """
+    Обновляет счётчики после смены статуса предложения, публикует событие
+    и ставит в очередь уведомление (``proposals_changed``); обмены по
+    цепочке с предложением, которое больше не ожидает ответа, становятся
+    неактуальными.
+
+    ``old_status=None`` — предложение создано, ``new_status=None`` — удалено.
+    """
+    if old_status != new_status:
+        apply_counter_deltas(_status_deltas(proposal, old_status, new_status))
+        if new_status is not None:
+            event_type = events.CREATED if old_status is None else events.UPDATED
+            proposals_changed([(proposal.pk, new_status)], event_type)
+    if old_status == 'pending' and new_status != 'pending':
+        cycles.break_cycles([proposal.pk])
+
+
+def update_counters_in_bulk(changes):
+    """
+    Обновляет счётчики после массовой смены статусов (``bulk_create``,
+    ``bulk_update``), по одному UPDATE на объявление, и публикует события.
+
+    Args:
+        changes: Тройки (предложение, старый статус, новый статус).
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    left_pending, created, updated = [], [], []
+    for proposal, old_status, new_status in changes:
+        if old_status != new_status:
+            _merge_deltas(deltas, _status_deltas(proposal, old_status, new_status))
+            if new_status is not None:
+                (created if old_status is None else updated).append((proposal.pk, new_status))
+        if old_status == 'pending' and new_status != 'pending':
+            left_pending.append(proposal.pk)
+    apply_counter_deltas(deltas)
+    cycles.break_cycles(left_pending)
+    proposals_changed(created, events.CREATED)
+    proposals_changed(updated)
+
+
+class ExchangeError(Exception):
+    """Операцию с предложением выполнить нельзя; текст показывается пользователю."""
+
+
+def retry_locked(func):
+    """
+    Выполняет ``func`` и повторяет его, если SQLite отказал из-за блокировки
+    (``database is locked``, ``database table is locked``).
+
+    С настройками SQLite по умолчанию транзакция, начавшаяся с чтения, не
+    может повысить блокировку до записи, пока базу держит другая, и получает
+    отказ сразу (см. ``barter_platform.sqlite``). Повторять можно только
+    целую транзакцию: внутри внешней транзакции повтор бесполезен (её
+    блокировки остаются), и отказ сразу становится ``ExchangeError``.
+
+    Raises:
+        ExchangeError: База занята и после ``LOCK_ATTEMPTS`` попыток.
+    """
+    for attempt in range(1, LOCK_ATTEMPTS + 1):
+        try:
+            return func()
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            if attempt == LOCK_ATTEMPTS or transaction.get_connection().in_atomic_block:
+                raise ExchangeError('Сервис занят другими обменами, повторите попытку') from error
+            time.sleep(random.uniform(0.01, 0.05) * attempt)
+
+
+def _atomic_with_retry(func):
+    # Транзакция целиком откатилась, поэтому её можно повторить
+    def atomic():
+        with transaction.atomic():
+            return func()
+    return retry_locked(atomic)
+
+
+def _close_deal(proposals, ad_ids, stale_message):
+    """
+    Принимает предложения и скрывает объявления, переходящие к новым владельцам.
+
+    Объявления блокируются (``select_for_update``, в порядке ``pk``), статус
+    меняется условным ``UPDATE ... WHERE status='pending'``, поэтому из
+    нескольких одновременных сделок с одними объявлениями успешна только
+    одна. Остальные ожидающие предложения с этими объявлениями отклоняются
+    одним ``UPDATE``.
+    """
+    ad_ids = sorted(set(ad_ids))
+    proposal_ids = [proposal.pk for proposal in proposals]
+    locked = list(Ad.objects.select_for_update().filter(pk__in=ad_ids).order_by('pk').values_list(
+        'category', 'condition', 'is_active'
+    ))
+
+    updated = ExchangeProposal.objects.filter(
+        pk__in=proposal_ids, status='pending'
+    ).update(status='accepted')
+    if updated != len(proposal_ids):
+        raise ExchangeError(stale_message)
+
+    deactivated = Ad.objects.filter(pk__in=ad_ids, is_active=True).update(
+        is_active=False, updated_at=timezone.now()
+    )
+    if deactivated != len(ad_ids):
+        raise ExchangeError('Обмен невозможен: одно из объявлений уже неактивно')
+    facets.apply_changes(((category, condition), None) for category, condition, _ in locked)
+
+    # Конкурирующие предложения: ожидающие, с любым из скрываемых объявлений
+    competing = list(ExchangeProposal.objects.select_for_update().filter(
+        Q(ad_sender__in=ad_ids) | Q(ad_receiver__in=ad_ids),
+        status='pending',
+    ).exclude(pk__in=proposal_ids).only('id', 'ad_sender', 'ad_receiver', 'status'))
+    if competing:
+        ExchangeProposal.objects.filter(
+            pk__in=[item.pk for item in competing]
+        ).update(status='rejected')
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    for proposal in proposals:
+        _merge_deltas(deltas, _status_deltas(proposal, 'pending', 'accepted'))
+    for item in competing:
+        _merge_deltas(deltas, _status_deltas(item, 'pending', 'rejected'))
+    apply_counter_deltas(deltas)
+    caching.invalidate_ads(ad_ids)
+    matching.remove_ads(ad_ids)
+    changed = proposal_ids + [item.pk for item in competing]
+    cycles.break_cycles(changed)
+    proposals_changed(
+        [(pk, 'accepted') for pk in proposal_ids] + [(item.pk, 'rejected') for item in competing]
+    )
+
+
+def accept_proposal(proposal):
+    """
+    Принимает предложение и скрывает оба объявления.
+
+    Всё происходит в одной транзакции (см. ``_close_deal``): из нескольких
+    одновременных принятий успешно только одно, конкурирующие предложения
+    отклоняются.
+
+    Raises:
+        ExchangeError: Предложение уже обработано или объявление неактивно.
+    """
+    _atomic_with_retry(lambda: _close_deal(
+        [proposal], [proposal.ad_sender_id, proposal.ad_receiver_id],
+        'Предложение уже обработано',
+    ))
+
+    proposal.status = 'accepted'
+    for name in ('ad_sender', 'ad_receiver'):
+        descriptor = getattr(ExchangeProposal, name)
+        if descriptor.is_cached(proposal):
+            getattr(proposal, name).is_active = False
+    return proposal
+
+
+def reject_proposal(proposal):
+    """
+    Отклоняет предложение условным ``UPDATE ... WHERE status='pending'``.
+
+    Raises:
+        ExchangeError: Предложение уже обработано.
+    """
+    def reject():
+        updated = ExchangeProposal.objects.filter(
+            pk=proposal.pk, status='pending'
+        ).update(status='rejected')
+        if not updated:
+            raise ExchangeError('Предложение уже обработано')
+        update_counters(proposal, 'pending', 'rejected')
+
+    _atomic_with_retry(reject)
+    proposal.status = 'rejected'
+    return proposal
+
+
+def accept_cycle(cycle):
+    """
+    Совершает обмен по цепочке: все предложения цепочки принимаются, а
+    объявления, которые участники отдают, скрываются — одной транзакцией.
+
+    Если одно из предложений уже обработано или объявление стало
+    неактивным, обмен помечается неактуальным (``status='broken'``).
+
+    Raises:
+        ExchangeError: Обмен уже принят, отклонён или неактуален.
+    """
+    def accept():
+        claimed = TradeCycle.objects.filter(
+            pk=cycle.pk, status='pending'
+        ).update(status='accepted')
+        if not claimed:
+            raise ExchangeError('Обмен по цепочке уже обработан')
+        legs = list(cycle.legs.select_related('proposal'))
+        try:
+            with transaction.atomic():
+                _close_deal(
+                    [leg.proposal for leg in legs], [leg.gives_id for leg in legs],
+                    'Одно из предложений цепочки уже обработано',
+                )
+        except ExchangeError:
+            TradeCycle.objects.filter(pk=cycle.pk).update(status='broken')
+            return 'broken'
+        return 'accepted'
+
+    cycle.status = _atomic_with_retry(accept)
+    return cycle
+
+
+def confirm_cycle(cycle, user):
+    """
+    Подтверждение обмена по цепочке участником. Когда подтвердили все,
+    обмен совершается (``accept_cycle``).
+
+    Если обмен уже совершил другой участник (например, подтвердивший
+    одновременно), возвращается обмен со статусом ``accepted``.
+
+    Returns:
+        TradeCycle: Обмен с текущим статусом.
+
+    Raises:
+        ExchangeError: Участник уже подтвердил обмен, обмен отклонён или неактуален.
+    """
+    with transaction.atomic():
+        confirmed = TradeCycleLeg.objects.filter(
+            cycle=cycle, user=user, confirmed=False, cycle__status='pending'
+        ).update(confirmed=True)
+        waiting = confirmed and TradeCycleLeg.objects.filter(cycle=cycle, confirmed=False).exists()
+    if waiting:
+        return cycle
+    if confirmed:
+        try:
+            return accept_cycle(cycle)
+        except ExchangeError:
+            pass  # обмен уже обработал другой участник
+
+    # Сообщаем фактический статус обмена, а не общую ошибку
+    cycle.status = TradeCycle.objects.values_list('status', flat=True).get(pk=cycle.pk)
+    if cycle.status == 'accepted':
+        return cycle
+    raise ExchangeError({
+        'pending': 'Вы уже подтвердили обмен, ждём остальных участников',
+        'rejected': 'Обмен по цепочке отклонён',
+        'broken': 'Обмен по цепочке неактуален: одно из предложений уже обработано',
+    }[cycle.status])
+
+
+def decline_cycle(cycle, user):
+    """
+    Отказ участника от обмена по цепочке. Сами предложения остаются
+    в ожидании: двусторонние обмены по ним по-прежнему возможны.
+
+    Raises:
+        ExchangeError: Обмен уже обработан.
+    """
+    declined = TradeCycle.objects.filter(
+        pk=cycle.pk, status='pending', legs__user=user
+    ).update(status='rejected')
+    if not declined:
+        raise ExchangeError('Обмен по цепочке уже обработан')
+    cycle.status = 'rejected'
+    return cycle
+
+
+def count_proposals(ad_ids=None):
+    """
+    Считает правильные значения счётчиков по таблице предложений.
+
+    Возвращает {ad_id: {поле: значение}} только для объявлений, у которых
+    есть хотя бы одно предложение. Предложения, перенесённые в архив
+    (``ads.archive``), в счётчиках не участвуют.
+    """
+    proposals = ExchangeProposal.objects.all()
+    received = proposals
+    sent = proposals.filter(status='pending')
+    if ad_ids is not None:
+        received = received.filter(ad_receiver__in=ad_ids)
+        sent = sent.filter(ad_sender__in=ad_ids)
+
+    counts = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for row in received.values('ad_receiver', 'status').annotate(total=Count('id')).order_by():
+        counts[row['ad_receiver']][RECEIVED_COUNTERS[row['status']]] = row['total']
+    for row in sent.values('ad_sender').annotate(total=Count('id')).order_by():
+        counts[row['ad_sender']][SENT_PENDING_COUNTER] = row['total']
+    return counts
+
+
+def reconcile_counters(ad_ids=None, batch_size=500, dry_run=False):
+    """
+    Пересчитывает счётчики и исправляет расхождения через ``bulk_update``.
+
+    Args:
+        ad_ids: Объявления для проверки; None — все объявления.
+        batch_size: Размер пачки для ``bulk_update``.
+        dry_run: Только посчитать расхождения, ничего не сохраняя.
+
+    Returns:
+        list: Объявления, у которых счётчики расходились.
+    """
+    counts = count_proposals(ad_ids)
+    zero = dict.fromkeys(COUNTER_FIELDS, 0)
+    ads = Ad.objects.only('id', *COUNTER_FIELDS).order_by('pk')
+    if ad_ids is not None:
+        ads = ads.filter(pk__in=ad_ids)
+
+    drifted = []
+    for ad in ads.iterator(chunk_size=batch_size):
+        expected = counts.get(ad.pk, zero)
+        if any(getattr(ad, field) != value for field, value in expected.items()):
+            for field, value in expected.items():
+                setattr(ad, field, value)
+            drifted.append(ad)
+
+    if drifted and not dry_run:
+        with transaction.atomic():
+            Ad.objects.bulk_update(drifted, COUNTER_FIELDS, batch_size=batch_size)
+        caching.invalidate_ad_pages([ad.pk for ad in drifted])
+    return drifted
@@ -0,0 +1,158 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from jobs.queue import enqueue, enqueue_many
+
+from . import caching, cycles, facets, images, matching, services, tasks
+from .models import Ad, ExchangeProposal
+from .search import get_backend
+
+
+@receiver(post_save, sender=Ad)
+def index_ad(sender, instance, raw=False, using='default', **kwargs):
+    """Обновляет объявление в поисковом индексе после сохранения."""
+    if raw:
+        return
+    get_backend(using).index([instance])
+
+
+@receiver(post_delete, sender=Ad)
+def unindex_ad(sender, instance, using='default', **kwargs):
+    """Удаляет объявление из поискового индекса."""
+    get_backend(using).remove([instance.pk])
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+def invalidate_ad_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш ленты и страницы изменённого объявления."""
+    caching.invalidate_ads([instance.pk])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+@receiver(post_delete, sender=ExchangeProposal)
+def invalidate_proposal_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш страниц объявлений, участвующих в предложении."""
+    caching.invalidate_ad_pages([instance.ad_sender_id, instance.ad_receiver_id])
+
+
+@receiver(post_save, sender=Ad)
+def fetch_ad_image(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь загрузку изображения и построение миниатюр."""
+    if not raw:
+        fetch_images([instance])
+
+
+def fetch_images(ads):
+    """
+    Ставит в очередь загрузку изображений объявлений. Каждый адрес
+    загружается для объявления один раз: ключ задачи включает хеш адреса.
+    """
+    ads = [ad for ad in ads if ad.image_url]
+    if ads:
+        enqueue_many(
+            tasks.fetch_image,
+            [{'ad_id': ad.pk, 'url': ad.image_url} for ad in ads],
+            keys=[f'ad-image:{ad.pk}:{images.url_digest(ad.image_url)}' for ad in ads],
+        )
+
+
+@receiver(post_save, sender=Ad)
+def refresh_ad_matches(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь пересчёт подбора обменов (не в запросе пользователя)."""
+    if not raw:
+        enqueue(tasks.refresh_matches, ad_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=Ad)
+def remember_facet(sender, instance, raw=False, using='default', update_fields=None, **kwargs):
+    """Запоминает ячейку счётчиков фасетов до изменения объявления."""
+    if raw:
+        return
+    if instance._state.adding:
+        instance._facet_before = None
+    elif update_fields is None or facets.FACET_FIELDS.intersection(update_fields):
+        row = Ad.objects.using(using).filter(pk=instance.pk).values_list(
+            'category', 'condition', 'is_active'
+        ).first()
+        instance._facet_before = (row[0], row[1]) if row and row[2] else None
+
+
+@receiver(post_save, sender=Ad)
+def count_facet(sender, instance, raw=False, **kwargs):
+    """Учитывает изменение объявления в счётчиках фасетов ленты."""
+    if not raw and '_facet_before' in instance.__dict__:
+        before = instance.__dict__.pop('_facet_before')
+        facets.apply_changes([(before, facets.facet_key(instance))])
+
+
+@receiver(post_delete, sender=Ad)
+def uncount_facet(sender, instance, **kwargs):
+    """Уменьшает счётчики фасетов при удалении объявления (в том числе каскадном)."""
+    facets.apply_changes([(facets.facet_key(instance), None)])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def refresh_proposal_matches(sender, instance, created, raw=False, **kwargs):
+    """Новое предложение меняет встречный интерес владельцев обоих объявлений."""
+    if created and not raw:
+        enqueue(tasks.refresh_matches, key=f'proposal-matches:{instance.pk}',
+                ad_ids=[instance.ad_receiver_id, instance.ad_sender_id])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def detect_trade_cycles(sender, instance, created, raw=False, **kwargs):
+    """Ставит в очередь поиск обменов по цепочке через новое предложение."""
+    if created and not raw and instance.status == 'pending':
+        enqueue(tasks.detect_trade_cycles, key=f'proposal-cycles:{instance.pk}',
+                proposal_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=ExchangeProposal)
+def break_trade_cycles(sender, instance, **kwargs):
+    """Обмены по цепочке с удаляемым предложением становятся неактуальными."""
+    cycles.break_cycles([instance.pk])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def count_proposal(sender, instance, created, raw=False, **kwargs):
+    """Учитывает новое предложение в счётчиках объявлений."""
+    if created and not raw:
+        services.update_counters(instance, None, instance.status)
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def uncount_proposal(sender, instance, **kwargs):
+    """Уменьшает счётчики при удалении предложения (в том числе каскадном)."""
+    services.update_counters(instance, instance.status, None)
+
+
+def ads_saved_in_bulk(ads, using='default', previous=None):
+    """
+    То же, что делают обработчики ``post_save`` для объявлений.
+
+    ``bulk_create`` и ``bulk_update`` не отправляют сигналы, поэтому
+    массовые операции вызывают эту функцию сами после записи пачки.
+    ``previous`` — ячейки фасетов объявлений до ``bulk_update``
+    ({pk: ``facets.facet_key``}); None — объявления только что созданы.
+    """
+    if ads:
+        previous = previous or {}
+        facets.apply_changes((previous.get(ad.pk), facets.facet_key(ad)) for ad in ads)
+        get_backend(using).index(ads)
+        caching.invalidate_ads([ad.pk for ad in ads])
+        # Векторы для подбора обменов; сами списки считаются при первом
+        # открытии страницы подбора (или командой rebuild_matches)
+        matching.index_terms([ad for ad in ads if ad.is_active])
+        matching.remove_ads([ad.pk for ad in ads if not ad.is_active])
+        fetch_images(ads)
+
+
+def proposals_created_in_bulk(proposals):
+    """То же, что делают обработчики ``post_save`` для новых предложений."""
+    services.update_counters_in_bulk(
+        (proposal, None, proposal.status) for proposal in proposals
+    )
+    pending = [proposal.pk for proposal in proposals if proposal.status == 'pending']
+    if pending:
+        enqueue(tasks.detect_trade_cycles, proposal_ids=pending)
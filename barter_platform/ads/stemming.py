@@ -0,0 +1,123 @@
+"""
+Стеммер для русского языка (алгоритм Snowball/Porter).
+
+Используется поисковым индексом SQLite, где нет встроенной русской
+морфологии: и текст объявлений, и поисковый запрос приводятся к основам
+одной и той же функцией, поэтому «книга», «книги» и «книгу» совпадают.
+"""
+
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'),
+                     ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой',
+                  'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их',
+                  'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+         'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+         'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+         'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+             'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+             'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+             'ья', 'я'))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ((), ('ост', 'ость'))
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-я]')
+
+
+def _compile(group):
+    """Объединяет группы окончаний в список, отсортированный по длине."""
+    needs_a, plain = group
+    endings = [(suffix, True) for suffix in needs_a]
+    endings += [(suffix, False) for suffix in plain]
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+_PERFECTIVE_GERUND = _compile(PERFECTIVE_GERUND)
+_ADJECTIVE = _compile(ADJECTIVE)
+_PARTICIPLE = _compile(PARTICIPLE)
+_REFLEXIVE = _compile(REFLEXIVE)
+_VERB = _compile(VERB)
+_NOUN = _compile(NOUN)
+_SUPERLATIVE = _compile(SUPERLATIVE)
+_DERIVATIONAL = _compile(DERIVATIONAL)
+
+
+def _remove(word, endings):
+    """
+    Отрезает самое длинное подходящее окончание.
+
+    Окончания первой группы удаляются только после «а» или «я», как того
+    требует алгоритм. Возвращает пару (новое слово, было ли удаление).
+    """
+    for suffix, needs_a in endings:
+        if not word.endswith(suffix):
+            continue
+        stem = word[:-len(suffix)]
+        if needs_a and not stem.endswith(('а', 'я')):
+            return word, False
+        return stem, True
+    return word, False
+
+
+def _region_after_vowel_consonant(word, start):
+    for i in range(start + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word):
+    """Возвращает основу русского слова; прочие слова не изменяются."""
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.search(word):
+        return word
+
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    r1 = _region_after_vowel_consonant(word, 0)
+    r2 = _region_after_vowel_consonant(word, r1)
+    prefix, rest = word[:rv], word[rv:]
+
+    # Шаг 1: деепричастия, либо возвратные + прилагательные/глаголы/существительные
+    rest, removed = _remove(rest, _PERFECTIVE_GERUND)
+    if not removed:
+        rest, _ = _remove(rest, _REFLEXIVE)
+        rest, removed = _remove(rest, _ADJECTIVE)
+        if removed:
+            rest, _ = _remove(rest, _PARTICIPLE)
+        else:
+            rest, removed = _remove(rest, _VERB)
+            if not removed:
+                rest, _ = _remove(rest, _NOUN)
+
+    # Шаг 2: конечная «и»
+    if rest.endswith('и'):
+        rest = rest[:-1]
+
+    # Шаг 3: словообразовательные окончания в R2
+    r2_start = max(r2 - rv, 0)
+    derivational, removed = _remove(rest[r2_start:], _DERIVATIONAL)
+    if removed:
+        rest = rest[:r2_start] + derivational
+
+    # Шаг 4: превосходная степень, удвоенная «н» и мягкий знак
+    rest, removed = _remove(rest, _SUPERLATIVE)
+    if rest.endswith('нн'):
+        rest = rest[:-1]
+    elif not removed and rest.endswith('ь'):
+        rest = rest[:-1]
+
+    return prefix + rest
+
+
+def tokenize(text):
+    """Разбивает текст на слова и приводит каждое к основе."""
+    return [stem(word) for word in WORD_RE.findall(text or '')]
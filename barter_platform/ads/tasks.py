@@ -0,0 +1,91 @@
+"""
+Фоновые задачи приложения (выполняет воркер ``manage.py run_jobs``).
+
+Задачи ставятся в очередь в той же транзакции, что и изменение, которое
+их вызвало, поэтому после отката не выполняются; перед выполнением они
+перечитывают данные из БД — объект мог измениться или исчезнуть.
+"""
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.urls import reverse
+
+from jobs.queue import enqueue, task
+
+from . import archive, caching, cycles, images, matching
+from .models import Ad, ExchangeProposal
+
+# Статусы в письмах («предложение принято»)
+STATUS_WORDS = {'accepted': 'принято', 'rejected': 'отклонено'}
+
+
+@task(name='ads.refresh_matches')
+def refresh_matches(ad_ids):
+    """Пересчитывает подбор обменов для объявлений."""
+    for pk in ad_ids:
+        matching.refresh_ad(pk)
+
+
+@task(name='ads.detect_trade_cycles')
+def detect_trade_cycles(proposal_ids):
+    """Ищет обмены по цепочке через новые предложения."""
+    cycles.detect_for_proposals(proposal_ids)
+
+
+@task(name='ads.fetch_image')
+def fetch_image(ad_id, url):
+    """Загружает изображение объявления и строит миниатюры."""
+    ad = Ad.objects.filter(pk=ad_id).only('id', 'image_url').first()
+    # Ссылку успели поменять: её загрузит задача, поставленная при изменении
+    if ad is not None and ad.image_url == url:
+        images.fetch(ad)
+
+
+@task(name='ads.bump_cache_versions')
+def bump_cache_versions(keys):
+    """Повторная инвалидация кеша, когда реплики догнали основную базу."""
+    caching.bump_versions(keys)
+
+
+@task(name='ads.archive_inactive')
+def archive_inactive(days=None, batch_size=None):
+    """
+    Переносит в архив пачку неактивных объявлений; пока подходящие
+    остаются, ставит себя в очередь снова.
+    """
+    ads, _ = archive.archive_batch(days, batch_size)
+    if ads:
+        enqueue(archive_inactive, days=days, batch_size=batch_size)
+
+
+def absolute_url(path):
+    """Полный адрес страницы для письма: ``SITE_URL`` и путь."""
+    return getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/') + path
+
+
+@task(name='ads.notify_proposal')
+def notify_proposal(proposal_id, status):
+    """
+    Письмо о предложении: о новом — владельцу объявления-получателя,
+    о принятом или отклонённом — отправителю.
+    """
+    proposal = ExchangeProposal.objects.select_related(
+        'ad_sender__user', 'ad_receiver__user'
+    ).filter(pk=proposal_id).first()
+    if proposal is None:
+        return
+
+    if status == 'pending':
+        user = proposal.ad_receiver.user
+        subject = f'Новое предложение обмена на «{proposal.ad_receiver.title}»'
+        text = (f'Вам предлагают «{proposal.ad_sender.title}» '
+                f'в обмен на «{proposal.ad_receiver.title}».')
+    else:
+        user = proposal.ad_sender.user
+        subject = f'Предложение обмена {STATUS_WORDS[status]}'
+        text = (f'Ваше предложение «{proposal.ad_sender.title}» '
+                f'в обмен на «{proposal.ad_receiver.title}» {STATUS_WORDS[status]}.')
+    if not user.email:
+        return
+    send_mail(subject, f'{text}\n\nВсе предложения: {absolute_url(reverse("my_proposals"))}',
+              None, [user.email])
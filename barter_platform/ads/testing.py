@@ -0,0 +1,216 @@
+"""
+Вспомогательные средства для тестов.
+
+``QueryBudgetMixin`` добавляет в ``TestCase`` проверку «бюджета» SQL-запросов:
+в отличие от ``assertNumQueries`` она допускает меньшее число запросов и при
+превышении печатает все выполненные запросы, чтобы было видно, откуда
+взялся лишний (обычно N+1 в шаблоне).
+
+``AsyncViewsMixin`` подключает асинхронные варианты представлений
+(``ASYNC_VIEWS``) на время тестов класса.
+
+``StubServer`` — локальный HTTP-сервер вместо сторонних хостов
+изображений: отдаёт заданные ответы, в том числе медленные.
+
+``SQLiteReplica`` — реплика тестовой базы в отдельном файле SQLite,
+которая догоняет основную только по вызову ``sync``.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .async_views import reload_urlconf
+
+
+class _QueryBudgetContext(CaptureQueriesContext):
+    def __init__(self, test_case, budget, connection, label):
+        super().__init__(connection)
+        self.test_case = test_case
+        self.budget = budget
+        self.label = label
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None or len(self) <= self.budget:
+            return
+        queries = '\n'.join(
+            f'{number}. {query["sql"]}'
+            for number, query in enumerate(self.captured_queries, start=1)
+        )
+        self.test_case.fail(
+            f'{self.label}: выполнено {len(self)} SQL-запросов '
+            f'при бюджете {self.budget}\n{queries}'
+        )
+
+
+class QueryBudgetMixin:
+    """
+    Примесь для ``TestCase`` с проверкой бюджета SQL-запросов.
+
+    Attributes:
+        query_budgets (dict): Бюджеты по имени URL, используются
+            ``assertViewWithinBudget``.
+    """
+
+    query_budgets = {}
+
+    def assertQueryBudget(self, budget, func=None, *args, using=DEFAULT_DB_ALIAS,
+                          label='Запрос', **kwargs):
+        """
+        Проверяет, что выполнено не больше ``budget`` запросов.
+
+        Используется как контекстный менеджер или с вызываемым объектом,
+        аналогично ``assertNumQueries``.
+        """
+        context = _QueryBudgetContext(self, budget, connections[using], label)
+        if func is None:
+            return context
+        with context:
+            return func(*args, **kwargs)
+
+    def assertViewWithinBudget(self, url_name, url, method='get', **params):
+        """Выполняет запрос к представлению и сверяет его с ``query_budgets``."""
+        budget = self.query_budgets[url_name]
+        with self.assertQueryBudget(budget, label=url_name):
+            response = getattr(self.client, method)(url, params)
+        self.assertLess(response.status_code, 400)
+        return response
+
+
+class AsyncViewsMixin:
+    """Примесь для ``TestCase``: маршруты ведут на ``ads.async_views`` и ``api.async_views``."""
+
+    @classmethod
+    def setUpClass(cls):
+        override = override_settings(ASYNC_VIEWS=True)
+        override.enable()
+        cls.addClassCleanup(reload_urlconf)
+        cls.addClassCleanup(override.disable)
+        reload_urlconf()
+        super().setUpClass()
+
+
+class StubServer:
+    """
+    HTTP-сервер на 127.0.0.1 со случайным портом, работающий в потоке.
+
+    Ответы задаются методом ``add``; на остальные адреса — 404. Каждый
+    запрос записывается в ``requests`` (путь).
+
+    Пример::
+
+        with StubServer() as server:
+            server.add('/a.png', data, 'image/png')
+            url = server.url('/a.png')
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                route = stub.routes.get(self.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                status, body, headers, delay = route
+                time.sleep(delay)
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    pass  # клиент не дождался ответа
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def add(self, path, body=b'', content_type='image/png', status=200, delay=0, headers=None):
+        """Задаёт ответ на GET ``path``; ``delay`` — задержка в секундах."""
+        headers = {'Content-Type': content_type, **(headers or {})}
+        self.routes[path] = (status, body, headers, delay)
+
+    def url(self, path):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SQLiteReplica:
+    """
+    Реплика для чтения (``DATABASE_REPLICAS``) в отдельном файле SQLite.
+
+    Основная база копируется в файл реплики при входе и по вызову
+    ``sync`` (SQLite backup API); между вызовами реплика отстаёт, как при
+    задержке репликации. Основная база должна фиксировать изменения,
+    поэтому помощник используется с ``TransactionTestCase``.
+
+    Соединение создаётся динамически в потоке теста, без записи в
+    ``DATABASES``: его видят тестовый клиент и async-тесты, выполняющие
+    запросы к БД в том же потоке.
+
+    Пример::
+
+        replica = self.enterContext(SQLiteReplica())
+        ...  # записи видны только на основной базе
+        replica.sync()
+    """
+
+    def __init__(self, alias='replica'):
+        self.alias = alias
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, f'{self.alias}.sqlite3')
+        databases = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            self.alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path},
+        })
+        backend = load_backend(databases[self.alias]['ENGINE'])
+        connections[self.alias] = backend.DatabaseWrapper(databases[self.alias], self.alias)
+        self.override = override_settings(DATABASE_REPLICAS=[self.alias])
+        self.override.enable()
+        self.sync()
+        return self
+
+    def sync(self):
+        """Реплика догоняет основную базу."""
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        target = sqlite3.connect(self.path)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+
+    def __exit__(self, *exc_info):
+        self.override.disable()
+        connections[self.alias].close()
+        del connections[self.alias]
+        self.directory.cleanup()
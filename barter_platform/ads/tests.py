@@ -1,7 +1,37 @@
-from django.test import TestCase, Client
-from django.urls import reverse
+import asyncio
+import datetime
+import importlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from io import BytesIO, StringIO
+
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count, F
+from django.db.utils import load_backend
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.urls import resolve, reverse
 from django.contrib.auth.models import User
-from .models import Ad, ExchangeProposal
+from django.core import mail
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from barter_platform import sqlite
+from jobs.models import Job
+from jobs.queue import run_pending
+from . import archive, async_views, benchmarks, bulk, caching, cycles, events, facets, images, matching, ratelimit, routers, search, services, views
+from .metrics import MetricsRegistry, registry as metrics_registry
+from .models import Ad, AdImage, AdMatch, AdTerm, ArchivedAd, ArchivedProposal, ExchangeProposal, FacetCount, TradeCycle
+from .testing import AsyncViewsMixin, QueryBudgetMixin, SQLiteReplica, StubServer
 
 class AdsTestCase(TestCase):
     def setUp(self):
@@ -77,6 +107,23 @@ class AdsTestCase(TestCase):
         response = self.client.get(url, follow=True)
         self.assertContains(response, 'Вы уже отправляли предложение')
 
+    def test_concurrent_duplicate_proposal(self):
+        form_valid = views.ExchangeProposalCreateView.form_valid
+
+        def race(view, form):
+            # Второй запрос прошёл проверку в dispatch и сохранил предложение раньше
+            ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
+            return form_valid(view, form)
+
+        self.client.login(username='user1', password='pass')
+        url = reverse('propose_exchange', kwargs={'sender_pk': self.ad1.pk, 'receiver_pk': self.ad2.pk})
+        with unittest.mock.patch.object(views.ExchangeProposalCreateView, 'form_valid', race):
+            response = self.client.post(url, {'comment': 'Меняемся!'}, follow=True)
+        self.assertRedirects(response, self.ad2.get_absolute_url())
+        self.assertContains(response, 'Вы уже отправляли предложение')
+        self.assertEqual(ExchangeProposal.objects.count(), 1)
+        self.assertEqual(services.reconcile_counters(dry_run=True), [])
+
     def test_accept_proposal(self):
         proposal = ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
         self.client.login(username='user2', password='pass')
@@ -94,3 +141,1721 @@ class AdsTestCase(TestCase):
         response = self.client.post(url, follow=True)
         proposal.refresh_from_db()
         self.assertEqual(proposal.status, 'rejected')
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.book = Ad.objects.create(
+            user=self.user2, title='Книга по Python',
+            description='Учебник', category='books', condition='used'
+        )
+        self.phone = Ad.objects.create(
+            user=self.user2, title='Телефон',
+            description='В комплекте две книги', category='electronics', condition='new'
+        )
+        self.client.login(username='user1', password='pass')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('ad_list'), {'q': query, **params})
+        return list(response.context['ads'])
+
+    def test_search_uses_stemming(self):
+        self.assertEqual(self.search('книгами'), [self.book, self.phone])
+
+    def test_postgres_query_left_to_postgres_stemming(self):
+        backend = search.PostgresSearchBackend()
+        self.assertEqual(backend.build_query('Книгами по Python!'), 'книгами:* & по:* & python:*')
+        self.assertIsNone(backend.build_query('?!'))
+
+    def test_title_match_ranked_first(self):
+        self.phone.title = 'Книги'
+        self.phone.save()
+        self.book.title = 'Учебник'
+        self.book.description = 'Книга для начинающих'
+        self.book.save()
+        self.assertEqual(self.search('книга'), [self.phone, self.book])
+
+    def test_search_keeps_filters(self):
+        self.assertEqual(self.search('книга', category='electronics'), [self.phone])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.book.title = 'Велосипед'
+        self.book.description = 'Горный'
+        self.book.save()
+        self.assertEqual(self.search('велосипеды'), [self.book])
+        self.book.delete()
+        self.assertEqual(self.search('велосипед'), [])
+
+    def test_query_without_words(self):
+        self.assertEqual(self.search('!!!'), [])
+
+
+class IndexesTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.ad1 = Ad.objects.create(
+            user=self.user1, title='Книга', description='...', category='books'
+        )
+        self.ad2 = Ad.objects.create(
+            user=self.user2, title='Телефон', description='...', category='electronics'
+        )
+
+    def test_duplicate_proposal_rejected_by_database(self):
+        ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
+        with self.assertRaises(IntegrityError):
+            ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
+
+    def test_explain_queries_uses_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', username='user1', stdout=out)
+        plan = out.getvalue()
+        for index in ('ad_active_created_idx', 'ad_active_category_idx',
+                      'ad_active_condition_idx', 'ad_user_active_idx'):
+            self.assertIn(index, plan)
+        # Ленты читаются в порядке курсора прямо по индексу, без сортировки
+        for section in plan.split('\n\n'):
+            if section.startswith(('AdListView\n', 'AdListView (category)', 'AdListView (condition)',
+                                   'UserAdsView')):
+                self.assertNotIn('TEMP B-TREE', section)
+        # «Мои предложения» — по индексам внешних ключей предложения
+        for index in ('ads_exchangeproposal_ad_receiver_id', 'ads_exchangeproposal_ad_sender_id'):
+            self.assertIn(index, plan)
+
+
+class DuplicateProposalsMigrationTestCase(TransactionTestCase):
+    """Удаление дубликатов перед ограничением unique_proposal_pair (0008)."""
+
+    def setUp(self):
+        self.constraint = next(
+            constraint for constraint in ExchangeProposal._meta.constraints
+            if constraint.name == 'unique_proposal_pair'
+        )
+        # SQLite пересобирает таблицу по Meta модели, поэтому ограничение
+        # убирается и из неё, как это делает миграция RemoveConstraint
+        others = [c for c in ExchangeProposal._meta.constraints if c is not self.constraint]
+        with unittest.mock.patch.object(ExchangeProposal._meta, 'constraints', others), \
+                connection.schema_editor() as editor:
+            editor.remove_constraint(ExchangeProposal, self.constraint)
+        self.addCleanup(self.restore_constraint)
+        user1 = User.objects.create_user(username='user1', password='pass')
+        user2 = User.objects.create_user(username='user2', password='pass')
+        self.ad1 = Ad.objects.create(user=user1, title='Книга', description='...', category='books')
+        self.ad2 = Ad.objects.create(user=user2, title='Телефон', description='...', category='electronics')
+
+    def restore_constraint(self):
+        with connection.schema_editor() as editor:
+            editor.add_constraint(ExchangeProposal, self.constraint)
+
+    def remove_duplicates(self):
+        migration = importlib.import_module('ads.migrations.0008_ad_proposal_indexes')
+        with connection.schema_editor() as editor:
+            migration.remove_duplicate_proposals(django_apps, editor)
+
+    def propose(self, status):
+        return ExchangeProposal.objects.create(
+            ad_sender=self.ad1, ad_receiver=self.ad2, comment='...', status=status
+        )
+
+    def test_keeps_resolved_proposal(self):
+        self.propose('pending')
+        accepted = self.propose('accepted')
+        self.propose('rejected')
+        self.propose('pending')
+        self.remove_duplicates()
+        self.assertQuerySetEqual(ExchangeProposal.objects.all(), [accepted])
+
+    def test_keeps_earliest_among_equal(self):
+        first = self.propose('pending')
+        self.propose('pending')
+        self.remove_duplicates()
+        self.assertQuerySetEqual(ExchangeProposal.objects.all(), [first])
+
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.ads = [
+            Ad.objects.create(user=self.user2, title=f'Книга {i}', description='...',
+                              category='books' if i % 2 else 'other')
+            for i in range(25)
+        ]
+        self.client.login(username='user1', password='pass')
+
+    def walk(self, params):
+        """Проходит ленту по курсорам и возвращает объявления в порядке показа."""
+        seen, params = [], dict(params)
+        while True:
+            page = self.client.get(reverse('ad_list'), params).context['page_obj']
+            seen += list(page)
+            if not page.has_next():
+                return seen
+            params['cursor'] = page.next_cursor
+
+    def test_cursor_walk_covers_feed(self):
+        self.assertEqual(self.walk({}), list(reversed(self.ads)))
+
+    def test_cursor_walk_keeps_filters(self):
+        expected = [ad for ad in reversed(self.ads) if ad.category == 'books']
+        self.assertEqual(self.walk({'category': 'books'}), expected)
+
+    def test_cursor_walk_over_search_results(self):
+        self.assertEqual(len(self.walk({'q': 'книга'})), 25)
+
+    def test_previous_page(self):
+        first = self.client.get(reverse('ad_list')).context['page_obj']
+        second = self.client.get(reverse('ad_list'), {'cursor': first.next_cursor}).context['page_obj']
+        back = self.client.get(reverse('ad_list'), {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_tampered_cursor(self):
+        first = self.client.get(reverse('ad_list')).context['page_obj']
+        response = self.client.get(reverse('ad_list'), {'cursor': first.next_cursor[:-2] + 'xx'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_only_on_request(self):
+        response = self.client.get(reverse('ad_list'), {'page': 3})
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(len(response.context['ads']), 5)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    # Бюджеты не зависят от размера страницы: 2 запроса уходят на сессию
+    # и пользователя, остальные — на данные представления
+    query_budgets = {
+        'ad_list': 4,  # с запросом счётчиков фасетов
+        'user_ads': 3,
+        'ad_detail': 4,
+        'my_proposals': 4,
+        'proposal_detail': 3,
+    }
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.traders = [
+            User.objects.create_user(username=f'trader{i}', password='pass')
+            for i in range(5)
+        ]
+        self.owner_ads = [
+            Ad.objects.create(user=self.owner, title=f'Вещь {i}', description='...',
+                              category='other')
+            for i in range(12)
+        ]
+        self.proposals = []
+        for trader in self.traders:
+            for i in range(3):
+                ad = Ad.objects.create(user=trader, title=f'Товар {i}', description='...',
+                                       category='books')
+                self.proposals.append(ExchangeProposal.objects.create(
+                    ad_sender=ad, ad_receiver=self.owner_ads[0], comment='...'
+                ))
+                ExchangeProposal.objects.create(
+                    ad_sender=self.owner_ads[1], ad_receiver=ad, comment='...'
+                )
+        self.client.login(username='owner', password='pass')
+
+    def test_ad_list(self):
+        self.assertViewWithinBudget('ad_list', reverse('ad_list'))
+
+    def test_ad_list_search(self):
+        self.assertViewWithinBudget('ad_list', reverse('ad_list'), q='товар')
+
+    def test_user_ads(self):
+        self.assertViewWithinBudget('user_ads', reverse('user_ads'))
+
+    def test_ad_detail_owner(self):
+        response = self.assertViewWithinBudget(
+            'ad_detail', reverse('ad_detail', kwargs={'pk': self.owner_ads[0].pk}))
+        self.assertEqual(len(response.context['proposals']), 15)
+
+    def test_ad_detail_visitor(self):
+        self.client.login(username='trader0', password='pass')
+        response = self.assertViewWithinBudget(
+            'ad_detail', reverse('ad_detail', kwargs={'pk': self.owner_ads[0].pk}))
+        self.assertContains(response, reverse('propose_exchange', kwargs={
+            'sender_pk': response.context['sender_ad'].pk,
+            'receiver_pk': self.owner_ads[0].pk,
+        }))
+
+    def test_my_proposals(self):
+        for tab in ('received', 'sent'):
+            with self.subTest(tab=tab):
+                self.assertViewWithinBudget('my_proposals', reverse('my_proposals'), tab=tab)
+
+    def test_proposal_detail(self):
+        self.assertViewWithinBudget(
+            'proposal_detail', reverse('proposal_detail', kwargs={'pk': self.proposals[0].pk}))
+
+    def test_budget_exceeded_fails(self):
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(1):
+                list(Ad.objects.all())
+                list(ExchangeProposal.objects.all())
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='pass')
+        Ad.objects.create(user=self.user, title='Книга', description='...', category='books')
+        metrics_registry.reset()
+        self.addCleanup(setattr, metrics_registry, 'enabled', metrics_registry.enabled)
+        metrics_registry.enabled = True
+
+    def test_request_metrics_exported(self):
+        self.client.login(username='user1', password='pass')
+        self.client.get(reverse('ad_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('barter_http_request_duration_seconds_count{view="ad_list"} 1', body)
+        self.assertIn('barter_db_queries_per_request_bucket{view="ad_list",le="+Inf"} 1', body)
+        # Место вызова — файл проекта (сессию теперь первым читает расчёт ETag)
+        self.assertRegex(body, r'origin="ads/\w+\.py:\d+ in ')
+
+    def test_toggle_at_runtime(self):
+        self.client.post(reverse('metrics'), {'enabled': '0'})
+        self.assertFalse(metrics_registry.enabled)
+        self.client.login(username='user1', password='pass')
+        self.client.get(reverse('ad_list'))
+        self.assertNotIn('view="ad_list"', self.client.get(reverse('metrics')).content.decode())
+
+    def test_forbidden_outside_internal_ips(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_toggle_without_csrf_token(self):
+        # Скрейпер и curl с внутреннего адреса не передают CSRF-токен
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.post(reverse('metrics'), {'enabled': '0'}).status_code, 200)
+        self.assertFalse(metrics_registry.enabled)
+        # Персонал с внешнего адреса (из браузера) — только с токеном
+        self.user.is_staff = True
+        self.user.save()
+        client.login(username='user1', password='pass')
+        response = client.post(reverse('metrics'), {'enabled': '1'}, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(metrics_registry.enabled)
+
+    @override_settings(RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_internal_ip_behind_proxy(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1',
+                                   HTTP_X_FORWARDED_FOR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1',
+                                   HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_no_slow_queries_kept(self):
+        registry = MetricsRegistry(slow_query_limit=0)
+        self.assertFalse(registry.is_slow(10.0))
+        self.assertEqual(registry.slow_queries(), [])
+
+
+class CachingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.ad1 = Ad.objects.create(user=self.user1, title='Книга', description='...', category='books')
+        self.ad2 = Ad.objects.create(user=self.user2, title='Телефон', description='...', category='electronics')
+
+    def feed(self):
+        return list(self.client.get(reverse('ad_list')).context['ads'])
+
+    def test_feed_served_from_cache(self):
+        self.client.login(username='user1', password='pass')
+        self.feed()
+        # Повторно читаются только сессия и пользователь
+        with self.assertNumQueries(2):
+            self.assertEqual(self.feed(), [self.ad2])
+
+    def test_feed_is_per_user(self):
+        self.client.login(username='user1', password='pass')
+        self.assertEqual(self.feed(), [self.ad2])
+        self.client.login(username='user2', password='pass')
+        self.assertEqual(self.feed(), [self.ad1])
+        self.client.logout()
+        self.assertEqual(self.feed(), [self.ad2, self.ad1])
+
+    def test_ad_save_invalidates_feed(self):
+        self.client.login(username='user1', password='pass')
+        self.feed()
+        ad3 = Ad.objects.create(user=self.user2, title='Куртка', description='...', category='clothing')
+        self.assertEqual(self.feed(), [ad3, self.ad2])
+        self.ad2.is_active = False
+        self.ad2.save()
+        self.assertEqual(self.feed(), [ad3])
+
+    def test_proposal_invalidates_detail(self):
+        self.client.login(username='user2', password='pass')
+        url = reverse('ad_detail', kwargs={'pk': self.ad2.pk})
+        self.assertEqual(self.client.get(url).context['proposals'], [])
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        proposal = ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
+        self.assertEqual(self.client.get(url).context['proposals'], [proposal])
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.ad = Ad.objects.create(user=self.owner, title='Книга', description='...', category='books')
+        # Последнее изменение ленты — в прошлом: Last-Modified уже отправляется
+        cache.set(caching.FEED_MODIFIED_KEY, time.time() - 60, None)
+
+    def test_feed_not_modified(self):
+        response = self.client.get(reverse('ad_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('ad_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # Другие параметры и другой пользователь — другая страница
+        self.assertEqual(self.client.get(reverse('ad_list'), {'category': 'books'},
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(reverse('ad_list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.logout()
+
+        Ad.objects.create(user=self.other, title='Лампа', description='...', category='home')
+        response = self.client.get(reverse('ad_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_last_modified(self):
+        response = self.client.get(reverse('ad_list'))
+        last_modified = response['Last-Modified']
+        response = self.client.get(reverse('ad_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.ad.title = 'Роман'
+        self.ad.save()
+        response = self.client.get(reverse('ad_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        # Изменение в текущей секунде: Last-Modified пока не отправляется
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_feed_watermark_from_updated_at(self):
+        cache.delete(caching.FEED_MODIFIED_KEY)
+        self.ad.refresh_from_db()
+        self.assertEqual(int(caching.feed_last_modified().timestamp()), int(self.ad.updated_at.timestamp()))
+
+    def test_detail_not_modified(self):
+        url = reverse('ad_detail', kwargs={'pk': self.ad.pk})
+        self.client.login(username='owner', password='pass')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Новое предложение меняет страницу владельца
+        sender = Ad.objects.create(user=self.other, title='Лампа', description='...', category='home')
+        ExchangeProposal.objects.create(ad_sender=sender, ad_receiver=self.ad, comment='...')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['proposals']), 1)
+
+    def test_pending_messages_disable_validators(self):
+        request = RequestFactory().get(reverse('ad_list'))
+        request._messages = CookieStorage(request)
+        view = views.AdListView()
+        view.setup(request)
+        self.assertTrue(view.is_conditional(request))
+        messages.success(request, 'Предложение отправлено')
+        self.assertFalse(view.is_conditional(request))
+
+
+class ProposalCountersTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.ad1 = Ad.objects.create(user=self.user1, title='Книга', description='...', category='books')
+        self.ad2 = Ad.objects.create(user=self.user2, title='Телефон', description='...', category='electronics')
+        self.ad3 = Ad.objects.create(user=self.user1, title='Лампа', description='...', category='home')
+
+    def counters(self, ad):
+        ad.refresh_from_db()
+        return (ad.received_pending_count, ad.received_accepted_count,
+                ad.received_rejected_count, ad.sent_pending_count)
+
+    def propose(self, sender, receiver):
+        self.client.login(username=sender.user.username, password='pass')
+        url = reverse('propose_exchange', kwargs={'sender_pk': sender.pk, 'receiver_pk': receiver.pk})
+        self.client.post(url, {'comment': '...'})
+        return ExchangeProposal.objects.get(ad_sender=sender, ad_receiver=receiver)
+
+    def test_create_accept_reject(self):
+        first = self.propose(self.ad1, self.ad2)
+        second = self.propose(self.ad3, self.ad2)
+        self.assertEqual(self.counters(self.ad2), (2, 0, 0, 0))
+        self.assertEqual(self.counters(self.ad1), (0, 0, 0, 1))
+
+        self.client.login(username='user2', password='pass')
+        self.client.post(reverse('proposal_reject', kwargs={'pk': second.pk}))
+        self.assertEqual(self.counters(self.ad2), (1, 0, 1, 0))
+        self.assertEqual(self.counters(self.ad3), (0, 0, 0, 0))
+
+        self.client.post(reverse('proposal_accept', kwargs={'pk': first.pk}))
+        self.assertEqual(self.counters(self.ad2), (0, 1, 1, 0))
+        self.assertEqual(self.counters(self.ad1), (0, 0, 0, 0))
+
+    def test_ad_edit_keeps_counters(self):
+        self.propose(self.ad1, self.ad2)
+        self.ad2.title = 'Новый телефон'
+        self.ad2.save()  # в памяти счётчик ещё нулевой
+        self.assertEqual(self.counters(self.ad2), (1, 0, 0, 0))
+
+    def test_deleting_sender_ad_updates_receiver(self):
+        self.propose(self.ad1, self.ad2)
+        self.ad1.delete()
+        self.assertEqual(self.counters(self.ad2), (0, 0, 0, 0))
+
+    def test_reconcile_command_repairs_drift(self):
+        ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2, comment='...')
+        ExchangeProposal.objects.create(ad_sender=self.ad3, ad_receiver=self.ad2, comment='...', status='rejected')
+        # Изменение в обход сервисов (например, из консоли) рассинхронизирует счётчики
+        ExchangeProposal.objects.filter(ad_sender=self.ad1).update(status='rejected')
+        Ad.objects.filter(pk=self.ad3.pk).update(received_pending_count=5)
+        out = StringIO()
+        call_command('reconcile_proposal_counters', stdout=out)
+        self.assertIn('Исправлено объявлений с неверными счётчиками: 3', out.getvalue())
+        self.assertEqual(self.counters(self.ad2), (0, 0, 2, 0))
+        self.assertEqual(self.counters(self.ad1), (0, 0, 0, 0))
+        self.assertEqual(self.counters(self.ad3), (0, 0, 0, 0))
+
+
+class ProposalAcceptanceTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(4)]
+        self.phone = Ad.objects.create(user=self.users[0], title='Телефон', description='...', category='electronics')
+        self.book = Ad.objects.create(user=self.users[1], title='Книга', description='...', category='books')
+        self.lamp = Ad.objects.create(user=self.users[2], title='Лампа', description='...', category='home')
+        self.chair = Ad.objects.create(user=self.users[3], title='Стул', description='...', category='home')
+        self.accepted = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.phone, comment='...')
+        # Конкуренты: ещё одно предложение за телефон и предложение, где книгу просят
+        self.rival = ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.phone, comment='...')
+        self.for_book = ExchangeProposal.objects.create(ad_sender=self.chair, ad_receiver=self.book, comment='...')
+        self.unrelated = ExchangeProposal.objects.create(ad_sender=self.chair, ad_receiver=self.lamp, comment='...')
+
+    def status(self, proposal):
+        proposal.refresh_from_db()
+        return proposal.status
+
+    def test_accept_rejects_competing_offers(self):
+        self.client.login(username='user0', password='pass')
+        self.client.post(reverse('proposal_accept', kwargs={'pk': self.accepted.pk}))
+
+        self.assertEqual(self.status(self.accepted), 'accepted')
+        self.assertEqual(self.status(self.rival), 'rejected')
+        self.assertEqual(self.status(self.for_book), 'rejected')
+        self.assertEqual(self.status(self.unrelated), 'pending')
+        self.assertEqual(
+            list(Ad.objects.filter(is_active=True).order_by('pk')), [self.lamp, self.chair]
+        )
+        self.assertEqual(services.reconcile_counters(dry_run=True), [])
+
+    def test_already_processed(self):
+        services.reject_proposal(self.accepted)
+        with self.assertRaisesMessage(services.ExchangeError, 'Предложение уже обработано'):
+            services.accept_proposal(self.accepted)
+        self.assertTrue(Ad.objects.get(pk=self.phone.pk).is_active)
+
+    def test_inactive_ad_rolls_back(self):
+        Ad.objects.filter(pk=self.book.pk).update(is_active=False)
+        with self.assertRaises(services.ExchangeError):
+            services.accept_proposal(self.accepted)
+        self.assertEqual(self.status(self.accepted), 'pending')
+        self.assertEqual(self.status(self.rival), 'pending')
+        self.assertTrue(Ad.objects.get(pk=self.phone.pk).is_active)
+
+    def test_stale_accept_returns_404(self):
+        self.client.login(username='user0', password='pass')
+        url = reverse('update_proposal', kwargs={'pk': self.rival.pk})
+        services.accept_proposal(self.accepted)
+        response = self.client.post(reverse('proposal_accept', kwargs={'pk': self.rival.pk}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.status(self.rival), 'rejected')
+        self.assertEqual(self.client.post(url, {'status': 'accepted'}).status_code, 403)
+
+
+# Сессия в подписанной cookie: в общей памяти тестовой БД (shared cache)
+# чтение django_session получает отказ «table is locked» без ожидания,
+# а файловая SQLite ждала бы таймаут
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class ConcurrentAcceptanceTestCase(TransactionTestCase):
+    """Одновременные принятия разных предложений за одно объявление."""
+
+    senders = 6
+
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pass')
+        self.receiver = Ad.objects.create(user=owner, title='Телефон', description='...', category='electronics')
+        self.proposals = []
+        for number in range(self.senders):
+            user = User.objects.create_user(username=f'sender{number}', password='pass')
+            ad = Ad.objects.create(user=user, title=f'Книга {number}', description='...', category='books')
+            self.proposals.append(ExchangeProposal.objects.create(
+                ad_sender=ad, ad_receiver=self.receiver, comment='...'
+            ))
+
+    def accept(self, client, proposal, barrier, outcomes):
+        barrier.wait()
+        try:
+            response = client.post(reverse('proposal_accept', kwargs={'pk': proposal.pk}))
+            levels = [message.level_tag for message in messages.get_messages(response.wsgi_request)]
+            outcomes.append((response.status_code, levels))
+        finally:
+            connection.close()
+
+    def test_exactly_one_accept_wins(self):
+        # Получатель принимает все предложения одновременно из разных вкладок
+        login = Client()
+        login.login(username='owner', password='pass')
+        clients = []
+        for _ in self.proposals:
+            client = Client(raise_request_exception=False)
+            client.cookies = login.cookies
+            clients.append(client)
+        barrier = threading.Barrier(self.senders)
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.accept, args=(client, proposal, barrier, outcomes))
+            for client, proposal in zip(clients, self.proposals)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Ни одной ошибки сервера: один обмен принят, остальным — сообщение
+        # об ошибке или 404, если предложение уже отклонено победителем
+        self.assertEqual(len(outcomes), self.senders)
+        self.assertEqual([levels for _, levels in outcomes].count(['success']), 1)
+        for status_code, levels in outcomes:
+            self.assertIn((status_code, levels), [(302, ['success']), (302, ['error']), (404, [])])
+        statuses = list(ExchangeProposal.objects.values_list('status', flat=True))
+        self.assertEqual(statuses.count('accepted'), 1)
+        self.assertEqual(statuses.count('rejected'), self.senders - 1)
+        winner = ExchangeProposal.objects.get(status='accepted')
+        self.assertEqual(
+            set(Ad.objects.filter(is_active=False).values_list('pk', flat=True)),
+            {self.receiver.pk, winner.ad_sender_id},
+        )
+        self.assertEqual(services.reconcile_counters(dry_run=True), [])
+
+
+class BulkImportExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='partner', password='pass')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_csv_reports_bad_rows(self):
+        path = self.write('ads.csv', (
+            'title,description,category,condition\n'
+            'Велосипед,Горный велосипед,other,used\n'
+            ',Без заголовка,books,new\n'
+            'Чайник,Электрический,kitchen,new\n'
+            'Ноутбук,Почти новый,electronics,new\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_ads', path, user='partner', batch_size=1, stdout=out, stderr=err)
+        self.assertIn('Создано объявлений: 2, строк с ошибками: 2', out.getvalue())
+        self.assertIn('строка 3', err.getvalue())
+        self.assertIn('строка 4', err.getvalue())
+        self.assertEqual(self.user.ads.count(), 2)
+
+        # bulk_create не отправляет сигналы: индекс обновлён явно
+        other = User.objects.create_user(username='buyer', password='pass')
+        self.client.force_login(other)
+        response = self.client.get(reverse('ad_list'), {'q': 'велосипеды'})
+        self.assertContains(response, 'Велосипед')
+
+    def test_import_jsonl_dry_run(self):
+        path = self.write('ads.jsonl', (
+            '{"title": "Лампа", "description": "Настольная", "category": "home", "condition": "used"}\n'
+            'не json\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_ads', path, user='partner', dry_run=True, stdout=out, stderr=err)
+        self.assertIn('Проверено без ошибок объявлений: 1, строк с ошибками: 1', out.getvalue())
+        self.assertIn('Некорректный JSON', err.getvalue())
+        self.assertFalse(Ad.objects.exists())
+
+    def test_export_round_trip(self):
+        for number in range(5):
+            Ad.objects.create(user=self.user, title=f'Книга {number}', description='...', category='books')
+        path = os.path.join(self.directory.name, 'ads.jsonl')
+        call_command('export_ads', output=path, chunk_size=2)
+        with open(path, encoding='utf-8') as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual([row['title'] for row in rows], [f'Книга {number}' for number in range(5)])
+        self.assertEqual(rows[0]['user'], self.user.pk)
+
+        out = StringIO()
+        call_command('import_ads', path, user='partner', stdout=out)
+        self.assertEqual(Ad.objects.count(), 10)
+
+
+class MatchingTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(5)]
+        self.bike = self.create(0, 'Горный велосипед', 'Велосипед для гор, 21 скорость', 'other', 'used')
+        self.kids_bike = self.create(1, 'Велосипед детский', 'Детский велосипед с боковыми колёсами', 'other', 'used')
+        self.scooter = self.create(2, 'Самокат', 'Складной самокат', 'other', 'new')
+        self.book = self.create(3, 'Книга', 'Роман в мягкой обложке', 'books', 'new')
+        self.own = self.create(0, 'Велосипедный насос', 'Насос для велосипеда', 'other', 'used')
+        matching.rebuild()
+
+    def create(self, user, title, description, category, condition):
+        return Ad.objects.create(user=self.users[user], title=title, description=description,
+                                 category=category, condition=condition)
+
+    def candidates(self, ad):
+        return [match.candidate for match in matching.get_matches(ad)]
+
+    def test_ranking(self):
+        candidates = self.candidates(self.bike)
+        self.assertEqual(candidates[0], self.kids_bike)
+        self.assertNotIn(self.own, candidates)
+        self.assertIn(self.scooter, candidates)
+        # Оценка симметрична: велосипед — лучший обмен и для детского велосипеда
+        self.assertEqual(self.candidates(self.kids_bike)[0], self.bike)
+
+    def test_reciprocal_interest(self):
+        baseline = dict(matching.compute_matches(self.bike))
+        # Владелец книги уже предлагал обмен владельцу велосипеда
+        ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.own, comment='...')
+        self.assertGreater(dict(matching.compute_matches(self.bike))[self.book.pk], baseline.get(self.book.pk, 0))
+
+    def test_new_ad_joins_neighbour_lists(self):
+        bmx = self.create(4, 'Велосипед BMX', 'Велосипед для трюков', 'other', 'used')
+        run_pending()  # пересчёт — фоновая задача
+        self.assertIn(bmx, self.candidates(self.bike))
+        self.assertIn(self.bike, self.candidates(bmx))
+
+        bmx.is_active = False
+        bmx.save()
+        run_pending()
+        self.assertNotIn(bmx, self.candidates(self.bike))
+        self.assertFalse(AdMatch.objects.filter(ad=bmx).exists())
+
+    def test_update_keeps_lists_bounded(self):
+        with override_settings(ADS_MATCHES_PER_AD=1):
+            matching.rebuild()
+            # Насос в списке детского велосипеда нет, а он в списке насоса есть
+            self.assertEqual(self.candidates(self.own), [self.kids_bike])
+            self.assertEqual(self.candidates(self.kids_bike), [self.bike])
+            self.kids_bike.description = 'Детский велосипед, колёса 16 дюймов'
+            self.kids_bike.save()
+            bmx = self.create(4, 'Велосипед BMX', 'Горный велосипед для трюков', 'other', 'used')
+            run_pending()
+            # Запись в списке, который не пересчитывался, остаётся, а списки
+            # не растут больше ADS_MATCHES_PER_AD
+            self.assertEqual(self.candidates(self.own), [self.kids_bike])
+        sizes = AdMatch.objects.values('ad').annotate(size=Count('id')).values_list('size', flat=True)
+        self.assertEqual(max(sizes), 1)
+        self.assertTrue(AdMatch.objects.filter(candidate=bmx).exists())
+
+    def test_accepted_ads_leave_lists(self):
+        proposal = ExchangeProposal.objects.create(ad_sender=self.scooter, ad_receiver=self.kids_bike, comment='...')
+        services.accept_proposal(proposal)
+        self.assertFalse(AdMatch.objects.filter(candidate=self.kids_bike).exists())
+        self.assertNotIn(self.kids_bike, self.candidates(self.bike))
+
+    def test_lazy_fill(self):
+        AdMatch.objects.all().delete()
+        self.assertEqual(self.candidates(self.bike)[0], self.kids_bike)
+
+    def test_matches_page(self):
+        self.client.login(username='user0', password='pass')
+        url = reverse('ad_matches', kwargs={'pk': self.bike.pk})
+        with self.assertQueryBudget(4, label='ad_matches'):
+            response = self.client.get(url)
+        self.assertContains(response, 'Велосипед детский')
+        self.assertContains(response, reverse('propose_exchange', kwargs={
+            'sender_pk': self.bike.pk, 'receiver_pk': self.kids_bike.pk
+        }))
+
+    def test_detail_offers_best_matching_ad(self):
+        self.client.login(username='user0', password='pass')
+        response = self.client.get(reverse('ad_detail', kwargs={'pk': self.kids_bike.pk}))
+        self.assertEqual(response.context['sender_ad'], self.bike)
+
+    def test_api(self):
+        response = self.client.get(f'/api/ads/{self.bike.pk}/matches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['ad']['id'], self.kids_bike.pk)
+        self.assertGreater(response.data[0]['score'], response.data[-1]['score'])
+
+
+class TradeCycleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(4)]
+        self.ads = [
+            Ad.objects.create(user=user, title=f'Вещь {i}', description='...', category='other', condition='used')
+            for i, user in enumerate(self.users)
+        ]
+
+    def propose(self, sender, receiver):
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ads[sender], ad_receiver=self.ads[receiver], comment='...'
+        )
+        run_pending()  # поиск цепочек — фоновая задача
+        return proposal
+
+    def create_cycle(self):
+        proposals = [self.propose(0, 1), self.propose(1, 2), self.propose(2, 0)]
+        return proposals, TradeCycle.objects.get()
+
+    def test_find_cycles(self):
+        graph = cycles.ProposalGraph()
+        for source, target in ((1, 2), (2, 3), (3, 1), (2, 1), (3, 4), (4, 1)):
+            graph.add_edge(source, target)
+        self.assertFalse(graph.add_edge(1, 2))  # второе предложение той же пары
+        found = cycles.find_cycles(graph, 1, 2, max_length=4)
+        self.assertCountEqual(found, [[1, 2, 3], [1, 2, 3, 4]])
+        self.assertEqual(cycles.find_cycles(graph, 1, 2, max_length=3), [[1, 2, 3]])
+        self.assertEqual(len(cycles.find_cycles(graph, 1, 2, max_length=4, limit=1)), 1)
+        # Обмен двух участников — обычное предложение, а не цепочка
+        self.assertEqual(cycles.find_cycles(graph, 1, 2, max_length=2), [])
+
+    def test_detected_once(self):
+        proposals, cycle = self.create_cycle()
+        legs = list(cycle.legs.order_by('position'))
+        self.assertEqual([leg.user for leg in legs], self.users[2:3] + self.users[:2])
+        for leg in legs:
+            # Каждый получает желаемое и отдаёт своё объявление
+            self.assertEqual(leg.receives.user, self.users[(self.users.index(leg.user) + 1) % 3])
+            self.assertEqual(leg.gives.user, leg.user)
+        # Ещё одно предложение между теми же пользователями и полный проход
+        # дубликатов не создают
+        self.ads.append(Ad.objects.create(user=self.users[0], title='Ещё вещь', description='...',
+                                          category='other', condition='used'))
+        self.propose(4, 1)
+        self.assertEqual(cycles.scan_all(), [])
+        self.assertEqual(TradeCycle.objects.count(), 1)
+
+    def test_confirm_by_all(self):
+        proposals, cycle = self.create_cycle()
+        competing = self.propose(3, 1)
+        self.client.login(username='user0', password='pass')
+        response = self.client.get(reverse('trade_cycles'))
+        self.assertContains(response, 'Вещь 2')
+        for user in self.users[:3]:
+            self.client.login(username=user.username, password='pass')
+            self.client.post(reverse('trade_cycle_confirm', kwargs={'pk': cycle.pk}))
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.status, 'accepted')
+        self.assertEqual(ExchangeProposal.objects.filter(pk__in=[p.pk for p in proposals], status='accepted').count(), 3)
+        self.assertFalse(Ad.objects.filter(pk__in=[ad.pk for ad in self.ads[:3]], is_active=True).exists())
+        competing.refresh_from_db()
+        self.assertEqual(competing.status, 'rejected')
+        self.assertEqual(services.reconcile_counters(dry_run=True), [])
+
+    def test_outsider_cannot_confirm(self):
+        _, cycle = self.create_cycle()
+        self.client.login(username='user3', password='pass')
+        response = self.client.post(reverse('trade_cycle_confirm', kwargs={'pk': cycle.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejected_proposal_breaks_cycle(self):
+        proposals, cycle = self.create_cycle()
+        services.confirm_cycle(cycle, self.users[0])
+        services.reject_proposal(proposals[1])
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.status, 'broken')
+        with self.assertRaisesMessage(services.ExchangeError, 'неактуален'):
+            services.confirm_cycle(cycle, self.users[1])
+
+    def test_concurrent_confirm_reports_accepted(self):
+        _, cycle = self.create_cycle()
+        for user in self.users[:2]:
+            services.confirm_cycle(cycle, user)
+        with self.assertRaisesMessage(services.ExchangeError, 'уже подтвердили'):
+            services.confirm_cycle(cycle, self.users[0])
+        accept_cycle = services.accept_cycle
+
+        def race(cycle):
+            # Участник, подтвердивший одновременно, успел совершить обмен раньше
+            accept_cycle(TradeCycle.objects.get(pk=cycle.pk))
+            return accept_cycle(cycle)
+
+        with unittest.mock.patch.object(services, 'accept_cycle', race):
+            self.assertEqual(services.confirm_cycle(cycle, self.users[2]).status, 'accepted')
+        # Повторное подтверждение тоже сообщает, что обмен совершён
+        self.client.login(username='user2', password='pass')
+        response = self.client.post(reverse('trade_cycle_confirm', kwargs={'pk': cycle.pk}), follow=True)
+        self.assertContains(response, 'Все участники подтвердили обмен')
+
+    def test_stale_cycle_is_broken_on_accept(self):
+        proposals, cycle = self.create_cycle()
+        # Изменение в обход сервисов: цепочка узнаёт об этом только при принятии
+        ExchangeProposal.objects.filter(pk=proposals[0].pk).update(status='rejected')
+        services.accept_cycle(cycle)
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.status, 'broken')
+        self.assertTrue(Ad.objects.get(pk=self.ads[1].pk).is_active)
+        self.assertEqual(ExchangeProposal.objects.filter(status='accepted').count(), 0)
+
+    def test_decline(self):
+        proposals, cycle = self.create_cycle()
+        services.decline_cycle(cycle, self.users[1])
+        self.assertEqual(TradeCycle.objects.get().status, 'rejected')
+        # Предложения остаются в ожидании
+        self.assertEqual(ExchangeProposal.objects.filter(status='pending').count(), 3)
+
+    def test_commands(self):
+        ExchangeProposal.objects.bulk_create([
+            ExchangeProposal(ad_sender=self.ads[i], ad_receiver=self.ads[(i + 1) % 3], comment='...')
+            for i in range(3)
+        ])
+        out = StringIO()
+        call_command('find_trade_cycles', stdout=out)
+        self.assertEqual(TradeCycle.objects.count(), 1)
+        out = StringIO()
+        call_command('benchmark_trade_cycles', edges=2000, users=300, operations=50, stdout=out)
+        self.assertIn('медиана', out.getvalue())
+
+
+class AsyncViewsTestCase(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(username='user1', password='pass')
+        self.user2 = User.objects.create_user(username='user2', password='pass')
+        self.own = Ad.objects.create(user=self.user1, title='Велосипед', description='...', category='other')
+        self.ads = [
+            Ad.objects.create(user=self.user2, title=f'Книга {i}', description='...', category='books')
+            for i in range(15)
+        ]
+        self.proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.own, comment='Меняю книгу'
+        )
+
+    def test_routes(self):
+        self.assertIs(resolve(reverse('ad_list')).func.view_class, async_views.AdListView)
+        self.assertIs(resolve(reverse('my_proposals')).func.view_class, async_views.MyProposalsView)
+
+    def test_list(self):
+        self.client.login(username='user1', password='pass')
+        first = self.client.get(reverse('ad_list')).context['page_obj']
+        self.assertEqual(list(first), list(reversed(self.ads))[:10])
+        second = self.client.get(reverse('ad_list'), {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(list(second), list(reversed(self.ads))[10:])
+        response = self.client.get(reverse('ad_list'), {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['ads']), 5)
+        self.assertContains(self.client.get(reverse('ad_list'), {'q': 'книга 3'}), 'Книга 3')
+
+    def test_detail(self):
+        self.client.login(username='user1', password='pass')
+        response = self.client.get(reverse('ad_detail', kwargs={'pk': self.own.pk}))
+        self.assertEqual(response.context['proposals'], [self.proposal])
+        self.assertContains(response, 'Меняю книгу')
+        response = self.client.get(reverse('ad_detail', kwargs={'pk': self.ads[1].pk}))
+        self.assertEqual(response.context['sender_ad'], self.own)
+        self.assertEqual(self.client.get(reverse('ad_detail', kwargs={'pk': 10 ** 6})).status_code, 404)
+
+    def test_my_proposals_requires_login(self):
+        response = self.client.get(reverse('my_proposals'))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='user2', password='pass')
+        response = self.client.get(reverse('my_proposals'), {'tab': 'sent'})
+        self.assertEqual(response.context['proposals'], [self.proposal])
+        self.assertEqual(response.context['counts'], {'received': 0, 'sent_pending': 1})
+        response = self.client.get(reverse('my_proposals_fragment'), {'tab': 'received'})
+        self.assertEqual(response.json()['next_cursor'], None)
+        self.assertIn('Нет входящих предложений', response.json()['html'])
+
+    async def test_asgi_stack(self):
+        metrics_registry.reset()
+        await self.async_client.alogin(username='user1', password='pass')
+        response = await self.async_client.get(reverse('ad_detail', kwargs={'pk': self.own.pk}))
+        self.assertContains(response, 'Меняю книгу')
+        # Запросы из потока sync_to_async попадают в метрики
+        body = metrics_registry.render()
+        self.assertIn('barter_db_queries_per_request_count{view="ad_detail"} 1', body)
+        self.assertNotIn('barter_db_queries_per_request_sum{view="ad_detail"} 0\n', body)
+
+
+class LoadTestCommandTestCase(TransactionTestCase):
+    def test_compares_stacks(self):
+        user = User.objects.create_user(username='user1', password='pass')
+        for i in range(3):
+            Ad.objects.create(user=user, title=f'Книга {i}', description='...', category='books')
+        out = StringIO()
+        call_command('load_test', requests=8, warmup=2, concurrency=2, username='user1', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('sync (WSGI): 8 запросов'))
+        self.assertTrue(lines[1].startswith('async (ASGI): 8 запросов'))
+        self.assertTrue(all(line.endswith('ошибок 0') for line in lines))
+        self.assertIs(resolve(reverse('ad_list')).func.view_class, views.AdListView)
+
+
+class ProposalEventsTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(3)]
+        self.ads = [
+            Ad.objects.create(user=user, title=f'Вещь {i}', description='...', category='other', condition='used')
+            for i, user in enumerate(self.users)
+        ]
+        self.received = {user.pk: [] for user in self.users}
+        for user in self.users:
+            self.addCleanup(events.broker.subscribe(user.pk, self.received[user.pk].append))
+
+    def test_created_and_accepted(self):
+        competing = ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1], comment='...')
+        self.client.login(username='user0', password='pass')
+        url = reverse('propose_exchange', kwargs={'sender_pk': self.ads[0].pk, 'receiver_pk': self.ads[1].pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'comment': 'Меняю'})
+        proposal = ExchangeProposal.objects.get(ad_sender=self.ads[0])
+        created = self.received[self.users[1].pk][-1]
+        self.assertEqual(created['type'], events.CREATED)
+        self.assertEqual(created['ad_sender'], {'id': self.ads[0].pk, 'title': 'Вещь 0'})
+        self.assertEqual(self.received[self.users[0].pk][-1], created)
+
+        self.client.login(username='user1', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('proposal_accept', kwargs={'pk': proposal.pk}))
+        updates = {event['proposal']: event['status'] for event in self.received[self.users[1].pk][1:]}
+        self.assertEqual(updates, {proposal.pk: 'accepted', competing.pk: 'rejected'})
+        # Автор отклонённого конкурирующего предложения тоже узнаёт об этом
+        self.assertEqual(self.received[self.users[2].pk][-1]['status'], 'rejected')
+
+    def test_rejected(self):
+        proposal = ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='...')
+        self.client.login(username='user1', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('proposal_reject', kwargs={'pk': proposal.pk}))
+        event = self.received[self.users[0].pk][-1]
+        self.assertEqual((event['type'], event['status_display']), (events.UPDATED, 'Отклонена'))
+
+    def test_no_query_without_subscribers(self):
+        proposal = ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='...')
+        self.doCleanups()
+        with self.assertNumQueries(0):
+            events.publish_proposals([proposal.pk], events.UPDATED)
+
+    def test_anonymous_forbidden(self):
+        self.assertEqual(self.client.get(reverse('proposal_events')).status_code, 403)
+
+    def test_no_stream_under_wsgi(self):
+        # Под WSGI поток занимал бы воркер: 204, и страница его не открывает
+        self.client.login(username='user0', password='pass')
+        self.assertEqual(self.client.get(reverse('proposal_events')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('my_proposals')), reverse('proposal_events'))
+
+    async def test_page_opens_stream_under_asgi(self):
+        await self.async_client.alogin(username='user0', password='pass')
+        response = await self.async_client.get(reverse('my_proposals'))
+        self.assertContains(response, reverse('proposal_events'))
+
+    async def test_stream(self):
+        await self.async_client.alogin(username='user0', password='pass')
+        response = await self.async_client.get(reverse('proposal_events'))
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), f'retry: {events.RETRY_MS}\n\n'.encode())
+        subscribers = len(events.broker._subscribers[self.users[0].pk])
+        chunk = asyncio.ensure_future(anext(stream))
+        while len(events.broker._subscribers[self.users[0].pk]) == subscribers:
+            await asyncio.sleep(0.01)
+        # Публикация идёт из потока обработки запроса
+        event = {'type': events.UPDATED, 'proposal': 1, 'status': 'accepted'}
+        await sync_to_async(events.broker.deliver, thread_sensitive=False)(self.users[0].pk, event)
+        data = (await asyncio.wait_for(chunk, 5)).decode()
+        self.assertEqual(data, f'event: {events.UPDATED}\ndata: {json.dumps(event)}\n\n')
+        # Клиент отключился: обработчик ASGI отменяет задачу потока
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.05)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(len(events.broker._subscribers[self.users[0].pk]), subscribers)
+
+
+@override_settings(SITE_URL='https://barter.example/')
+class ProposalNotificationTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='pass', email=f'user{i}@example.com')
+            for i in range(3)
+        ]
+        self.ads = [
+            Ad.objects.create(user=user, title=f'Вещь {i}', description='...', category='other', condition='used')
+            for i, user in enumerate(self.users)
+        ]
+        run_pending()  # подбор обменов для новых объявлений
+
+    def test_created_and_accepted(self):
+        competing = ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1], comment='...')
+        self.client.login(username='user0', password='pass')
+        url = reverse('propose_exchange', kwargs={'sender_pk': self.ads[0].pk, 'receiver_pk': self.ads[1].pk})
+        self.client.post(url, {'comment': 'Меняю'})
+        # Письма отправляет воркер, а не запрос
+        self.assertEqual(mail.outbox, [])
+        run_pending()
+        self.assertEqual([message.to for message in mail.outbox], [['user1@example.com']] * 2)
+        self.assertIn('Вещь 0', mail.outbox[-1].body)
+        self.assertIn('https://barter.example/my-proposals/', mail.outbox[-1].body)
+
+        mail.outbox.clear()
+        proposal = ExchangeProposal.objects.get(ad_sender=self.ads[0])
+        self.client.login(username='user1', password='pass')
+        self.client.post(reverse('proposal_accept', kwargs={'pk': proposal.pk}))
+        run_pending()
+        self.assertCountEqual(
+            [(message.to, message.subject) for message in mail.outbox],
+            [(['user0@example.com'], 'Предложение обмена принято'),
+             (['user2@example.com'], 'Предложение обмена отклонено')],
+        )
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+    def test_rolled_back_change_is_not_notified(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='...')
+                ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='...')
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_user_without_email(self):
+        self.users[1].email = ''
+        self.users[1].save()
+        ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='...')
+        run_pending()
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+
+def make_image(width, height, image_format='PNG', mode='RGB'):
+    data = BytesIO()
+    images.Image.new(mode, (width, height), 'orange').save(data, image_format)
+    return data.getvalue()
+
+
+@unittest.skipUnless(images.Image, 'нужен Pillow')
+@override_settings(ADS_IMAGE_ALLOW_PRIVATE=True, ADS_THUMBNAIL_SIZES=(320, 640))
+class AdImageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.server = self.enterContext(StubServer())
+        self.user = User.objects.create_user(username='user1', password='pass')
+
+    def create(self, url, title='Велосипед'):
+        return Ad.objects.create(user=self.user, title=title, description='...', category='other',
+                                 condition='used', image_url=url)
+
+    def test_thumbnails(self):
+        self.server.add('/bike.png', make_image(1000, 500))
+        self.server.add('/copy.png', make_image(1000, 500))
+        ad = self.create(self.server.url('/bike.png'))
+        # Лента не ходит на сторонний хост, пока миниатюр нет
+        response = self.client.get(reverse('ad_list'))
+        self.assertNotContains(response, self.server.url('/bike.png'))
+        self.assertContains(response, 'Нет изображения')
+
+        run_pending()
+        image = AdImage.objects.get(ad=ad)
+        self.assertEqual((image.status, image.width, image.height), ('ready', 1000, 500))
+        self.assertEqual([(item['width'], item['height']) for item in image.thumbnails], [(320, 160), (640, 320)])
+
+        response = self.client.get(reverse('ad_list'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, f'srcset="{image.webp_srcset}"')
+        self.assertContains(response, f'src="{image.src}"')
+        self.assertNotContains(response, self.server.url('/bike.png'))
+        self.assertContains(self.client.get(ad.get_absolute_url()), 'loading="eager"')
+
+        response = self.client.get(image.src)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], images.CACHE_CONTROL)
+        webp = self.client.get(image.webp_srcset.split()[0])
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertEqual(images.Image.open(BytesIO(b''.join(webp.streaming_content))).size, (320, 160))
+
+        # Повторное сохранение не загружает изображение снова, а такое же
+        # изображение по другому адресу использует те же файлы
+        ad.save()
+        other = self.create(self.server.url('/copy.png'), title='Ещё велосипед')
+        run_pending()
+        self.assertEqual(self.server.requests, ['/bike.png', '/copy.png'])
+        self.assertEqual(AdImage.objects.get(ad=other).thumbnails, image.thumbnails)
+
+    def test_small_image_is_not_upscaled(self):
+        self.server.add('/small.png', make_image(200, 100, mode='RGBA'))
+        ad = self.create(self.server.url('/small.png'))
+        run_pending()
+        thumbnails = AdImage.objects.get(ad=ad).thumbnails
+        self.assertEqual([(item['width'], item['height']) for item in thumbnails], [(200, 100)])
+
+    def test_invalid_images(self):
+        self.server.add('/page.html', b'<html></html>', 'text/html')
+        self.server.add('/broken.png', b'not an image')
+        for path, error in (('/page.html', 'не изображение'), ('/broken.png', 'не удалось разобрать'),
+                            ('/missing.png', '404')):
+            ad = self.create(self.server.url(path), title=path)
+            run_pending()
+            image = AdImage.objects.get(ad=ad)
+            self.assertEqual(image.status, 'failed')
+            self.assertIn(error, image.error)
+            self.assertIsNone(ad.thumbnail)
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+    def test_without_pillow(self):
+        # Без Pillow задача не тратит повторы: изображение сразу с ошибкой
+        self.server.add('/bike.png', make_image(100, 100))
+        ad = self.create(self.server.url('/bike.png'))
+        with unittest.mock.patch.object(images, 'Image', None):
+            run_pending()
+        self.assertIn('Pillow', AdImage.objects.get(ad=ad).error)
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+    @override_settings(ADS_IMAGE_MAX_BYTES=1000)
+    def test_too_large(self):
+        self.server.add('/big.bmp', make_image(100, 100, 'BMP'), 'image/bmp')
+        ad = self.create(self.server.url('/big.bmp'))
+        run_pending()
+        self.assertIn('слишком большое', AdImage.objects.get(ad=ad).error)
+
+    @override_settings(ADS_IMAGE_FETCH_TIMEOUT=0.1)
+    def test_slow_host_is_retried(self):
+        self.server.add('/slow.png', make_image(100, 100), delay=0.5)
+        ad = self.create(self.server.url('/slow.png'))
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_pending()
+        job = Job.objects.get(name='ads.fetch_image')
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('timed out', job.last_error)
+        self.assertFalse(AdImage.objects.filter(ad=ad).exists())
+
+    @override_settings(ADS_IMAGE_ALLOW_PRIVATE=False)
+    def test_private_address_rejected(self):
+        self.server.add('/bike.png', make_image(100, 100))
+        ad = self.create(self.server.url('/bike.png'))
+        run_pending()
+        self.assertIn('внутренней сети', AdImage.objects.get(ad=ad).error)
+        self.assertEqual(self.server.requests, [])
+
+    @override_settings(ADS_IMAGE_ALLOW_PRIVATE=False)
+    def test_connects_to_checked_address(self):
+        # Первый ответ DNS — внешний адрес, следующие — адрес внутренней сети
+        answers = [[(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 0))]]
+        internal = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 0))]
+        lookups, connections = [], []
+
+        def getaddrinfo(host, port, *args, **kwargs):
+            lookups.append((host, port))
+            return answers.pop() if answers else internal
+
+        def create_connection(address, *args, **kwargs):
+            connections.append(address)
+            raise ConnectionRefusedError
+
+        with unittest.mock.patch.object(images.socket, 'getaddrinfo', getaddrinfo), \
+                unittest.mock.patch.object(images.socket, 'create_connection', create_connection):
+            with self.assertRaises(OSError):
+                images.download('https://rebind.example/a.png')
+        # Имя разрешено один раз (порт по схеме), соединение — с проверенным адресом
+        self.assertEqual(lookups, [('rebind.example', 443)])
+        self.assertEqual(connections, [('93.184.216.34', 443)])
+        self.assertEqual(self.server.requests, [])
+
+    def test_changed_url(self):
+        self.server.add('/old.png', make_image(100, 100))
+        self.server.add('/new.png', make_image(120, 100))
+        ad = self.create(self.server.url('/old.png'))
+        ad.image_url = self.server.url('/new.png')
+        ad.save()
+        run_pending()
+        self.assertEqual(self.server.requests, ['/new.png'])
+        ad.refresh_from_db()
+        self.assertEqual(ad.thumbnail.width, 120)
+        # Ссылка удалена: миниатюры больше не показываются
+        ad.image_url = ''
+        ad.save()
+        self.assertIsNone(Ad.objects.select_related('image').get(pk=ad.pk).thumbnail)
+
+    def test_thumbnail_view_rejects_other_files(self):
+        self.assertEqual(self.client.get('/media/thumbs/ab/x.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/thumbs/ab/missing.webp').status_code, 404)
+        self.assertEqual(self.client.get('/media/thumbs/../secret.webp').status_code, 404)
+
+
+class ReplicaRoutingTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass')
+        self.replica = self.enterContext(SQLiteReplica())
+
+    def create(self, title):
+        return Ad.objects.create(user=self.author, title=title, description='...', category='books')
+
+    def test_reads_go_to_replica(self):
+        ad = self.create('Новая книга')
+        # Реплика ещё не получила объявление
+        self.assertNotContains(self.client.get(reverse('ad_list')), 'Новая книга')
+        self.assertEqual(self.client.get(ad.get_absolute_url()).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/ads/{ad.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/ads/').data['results'], [])
+
+        self.replica.sync()
+        cache.clear()
+        self.assertContains(self.client.get(reverse('ad_list')), 'Новая книга')
+        self.assertEqual(self.client.get(f'/api/ads/{ad.pk}/').status_code, 200)
+
+    def test_other_views_and_sessions_use_primary(self):
+        self.client.login(username='author', password='pass')  # сессия только на основной базе
+        self.create('Новая книга')
+        response = self.client.get(reverse('user_ads'))
+        self.assertContains(response, 'Новая книга')
+        self.assertTrue(self.client.get(reverse('ad_list')).context['user'].is_authenticated)
+
+    def test_read_your_writes_after_post(self):
+        self.client.login(username='author', password='pass')
+        response = self.client.post(reverse('ad_create'), {
+            'title': 'Свежая книга', 'description': '...', 'category': 'books', 'condition': 'new',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        ad = Ad.objects.get(title='Свежая книга')
+        self.assertEqual(self.client.get(ad.get_absolute_url()).status_code, 200)
+
+        # Другой клиент читает отстающую реплику (мимо кеша страницы)
+        cache.clear()
+        other = Client()
+        self.assertEqual(other.get(ad.get_absolute_url()).status_code, 404)
+        # Окно закрепления истекло
+        self.client.cookies[routers.PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.client.get(ad.get_absolute_url()).status_code, 404)
+
+    def test_matches_read_primary(self):
+        # Список подбора считается при первом запросе и сразу читается
+        other = User.objects.create_user(username='other', password='pass')
+        wanted = Ad.objects.create(user=other, title='Книга', description='...', category='books')
+        ad = self.create('Новая книга')
+        self.replica.sync()
+        response = self.client.get(f'/api/ads/{ad.pk}/matches/')
+        self.assertEqual([item['ad']['id'] for item in response.data], [wanted.pk])
+
+    async def test_async_stack(self):
+        await sync_to_async(self.create)('Новая книга')
+        response = await self.async_client.get('/api/ads/')
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_delayed_cache_invalidation(self):
+        self.create('Новая книга')
+        job = Job.objects.get(name='ads.bump_cache_versions')
+        self.assertGreater(job.run_at, job.created_at)
+        self.assertIn(caching.FEED_VERSION_KEY, job.payload['keys'])
+
+    def test_replica_is_not_migrated(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'ads'))
+        self.assertTrue(router.allow_migrate('default', 'ads'))
+        self.assertEqual(router.db_for_write(Ad), 'default')
+
+
+class SQLiteProductionTestCase(TestCase):
+    def test_pragmas(self):
+        options = sqlite.production_settings(busy_timeout=3, mmap_size=1024 * 1024, cache_size=2 * 1024 * 1024)
+        self.assertEqual((options['CONN_MAX_AGE'], options['CONN_HEALTH_CHECKS']), (600, True))
+        with tempfile.TemporaryDirectory() as directory:
+            databases = connections.configure_settings({
+                'default': connections.settings['default'],
+                'production': {'ENGINE': 'django.db.backends.sqlite3',
+                               'NAME': os.path.join(directory, 'db.sqlite3'), **options},
+            })
+            wrapper = load_backend('django.db.backends.sqlite3').DatabaseWrapper(databases['production'], 'production')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = [cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                              for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')]
+                self.assertEqual(values, ['wal', 1, 3000, 1024 * 1024, -2048])
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', duration=0.3, writers=2, readers=2, rows=100, stdout=out)
+        output = out.getvalue()
+        self.assertIn('SQLITE_PRODUCTION:', output)
+        self.assertEqual(output.count('database is locked'), 4)
+
+
+class BenchmarksTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.counts = benchmarks.seed(users=6, ads=40, proposals=80, random_seed=3)
+
+    def test_seed(self):
+        users, ads, proposals = self.counts
+        self.assertEqual((users, ads), (6, 40))
+        self.assertEqual(ExchangeProposal.objects.count(), proposals)
+        self.assertFalse(ExchangeProposal.objects.filter(ad_sender__user=F('ad_receiver__user')).exists())
+        # Счётчики сходятся, ожидающие предложения — только между активными объявлениями
+        self.assertEqual(services.reconcile_counters(dry_run=True), [])
+        self.assertFalse(ExchangeProposal.objects.filter(status='pending', ad_receiver__is_active=False).exists())
+        self.assertEqual(benchmarks.clear(), 6)
+        self.assertFalse(Ad.objects.exists())
+
+    def test_run_and_compare(self):
+        out = StringIO()
+        pending = ExchangeProposal.objects.filter(status='pending').count()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('run_benchmarks', requests=5, warmup=1, repeat=2, save_baseline=path, stdout=out)
+            for name in benchmarks.SCENARIOS:
+                self.assertIn(f'{name}: ', out.getvalue())
+            self.assertNotIn('нет данных', out.getvalue())
+            # Изменения сценариев откатываются
+            self.assertEqual(ExchangeProposal.objects.filter(status='pending').count(), pending)
+
+            baseline = benchmarks.load_baseline(path)
+            self.assertEqual(baseline['scenarios']['feed']['errors'], 0)
+            self.assertGreater(baseline['scenarios']['create_proposal']['queries_max'], 1)
+            call_command('run_benchmarks', 'feed', requests=5, warmup=1, baseline=path, tolerance=100, stdout=out)
+
+        results = {'feed': dict(baseline['scenarios']['feed'])}
+        self.assertEqual(benchmarks.compare(results, baseline), [])
+        results['feed'].update(queries_max=results['feed']['queries_max'] + 1, errors=2)
+        self.assertEqual(len(benchmarks.compare(results, baseline)), 2)
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', 'missing', stdout=out)
+
+
+class FacetsTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.ads = [
+            Ad.objects.create(user=self.owner, title='Велосипед', description='...', category='other', condition='used'),
+            Ad.objects.create(user=self.other, title='Книга', description='...', category='books'),
+            Ad.objects.create(user=self.other, title='Учебник', description='...', category='books', condition='used'),
+            Ad.objects.create(user=self.other, title='Лампа', description='...', category='home', condition='used'),
+        ]
+
+    def assertFacetsInSync(self):
+        self.assertEqual(facets.rebuild(), [])
+
+    def feed_counts(self, **params):
+        context = self.client.get(reverse('ad_list'), params).context
+        return ({value: count for value, _, count in context['categories']},
+                {value: count for value, _, count in context['conditions']})
+
+    def test_incremental_updates(self):
+        self.assertFacetsInSync()
+        book = self.ads[1]
+        book.category, book.condition = 'other', 'broken'
+        book.save()
+        self.ads[3].is_active = False
+        self.ads[3].save(update_fields=['is_active'])
+        self.ads[2].save(update_fields=['title'])
+        self.assertFacetsInSync()
+        self.ads[2].delete()
+        self.assertFacetsInSync()
+        self.assertEqual(
+            set(FacetCount.objects.filter(count__gt=0).values_list('category', 'condition', 'count')),
+            {('other', 'used', 1), ('other', 'broken', 1)},
+        )
+
+        # Принятие обмена скрывает оба объявления
+        proposal = ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=book, comment='...')
+        services.accept_proposal(proposal)
+        self.assertFacetsInSync()
+        self.assertFalse(FacetCount.objects.filter(count__gt=0).exists())
+
+        rows = [{'title': 'Кресло', 'description': '...', 'category': 'home', 'condition': 'used'}]
+        bulk.import_ads(enumerate(rows, start=1), bulk.form_validator(self.owner))
+        self.assertFacetsInSync()
+
+    def test_feed_counts(self):
+        categories, conditions = self.feed_counts()
+        self.assertEqual(categories, {'electronics': 0, 'clothing': 0, 'books': 2, 'home': 1, 'other': 1})
+        self.assertEqual(conditions, {'new': 1, 'used': 3, 'broken': 0})
+
+        # Своих объявлений пользователь в ленте не видит — и в счётчиках тоже
+        self.client.login(username='owner', password='pass')
+        categories, conditions = self.feed_counts()
+        self.assertEqual((categories['other'], conditions['used']), (0, 2))
+
+        categories, conditions = self.feed_counts(category='books', condition='used')
+        self.assertEqual(categories, {'electronics': 0, 'clothing': 0, 'books': 1, 'home': 1, 'other': 0})
+        self.assertEqual(conditions, {'new': 1, 'used': 1, 'broken': 0})
+
+        categories, conditions = self.feed_counts(q='книга')
+        self.assertEqual((categories['books'], categories['home'], conditions['new']), (1, 0, 1))
+        self.assertContains(self.client.get(reverse('ad_list')), 'Книги (2)')
+
+    def test_counts_are_cached(self):
+        self.client.get(reverse('ad_list'), {'category': 'books'})
+        with self.assertQueryBudget(0):
+            self.client.get(reverse('ad_list'), {'category': 'books'})
+        # Новое объявление сбрасывает версию ленты
+        Ad.objects.create(user=self.owner, title='Роман', description='...', category='books')
+        self.assertEqual(self.feed_counts(category='books')[0]['books'], 3)
+
+
+class AsyncFacetsTestCase(AsyncViewsMixin, TestCase):
+    async def test_feed_counts(self):
+        user = await User.objects.acreate(username='owner')
+        await sync_to_async(Ad.objects.create)(user=user, title='Книга', description='...', category='books')
+        response = await self.async_client.get(reverse('ad_list'))
+        self.assertEqual(response.context['categories'][2], ('books', 'Книги', 1))
+        response = await self.async_client.get(reverse('ad_list'), {'q': 'книга', 'category': 'home'})
+        self.assertEqual(response.context['categories'][2], ('books', 'Книги', 1))
+
+
+class AsyncConditionalGetTestCase(AsyncViewsMixin, TestCase):
+    async def test_not_modified(self):
+        user = await User.objects.acreate(username='owner')
+        ad = await sync_to_async(Ad.objects.create)(user=user, title='Книга', description='...', category='books')
+        for url in (reverse('ad_list'), reverse('ad_detail', kwargs={'pk': ad.pk})):
+            response = await self.async_client.get(url)
+            self.assertIs(response.resolver_match.func.view_class.view_is_async, True)
+            response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        User.objects.create_user(username='stranger', password='pass')
+        ad = lambda user, title: Ad.objects.create(user=user, title=title, description='...', category='books')
+        self.old, self.blocked, self.recent, self.traded = (
+            ad(self.owner, title) for title in ('Книга', 'Учебник', 'Роман', 'Словарь')
+        )
+        self.live, self.swapped = ad(self.other, 'Лампа'), ad(self.other, 'Кресло')
+
+        self.rejected = ExchangeProposal.objects.create(ad_sender=self.old, ad_receiver=self.live, comment='...')
+        services.reject_proposal(self.rejected)
+        services.accept_proposal(
+            ExchangeProposal.objects.create(ad_sender=self.traded, ad_receiver=self.swapped, comment='...')
+        )
+        # Ожидающее предложение не даёт перенести объявление в архив
+        ExchangeProposal.objects.create(ad_sender=self.live, ad_receiver=self.blocked, comment='...')
+        for item in (self.old, self.blocked, self.recent):
+            item.is_active = False
+            item.save()
+        Ad.objects.exclude(pk=self.recent.pk).filter(is_active=False).update(
+            updated_at=F('updated_at') - datetime.timedelta(days=100)
+        )
+
+    def test_archive(self):
+        self.assertEqual(archive.archive(), (3, 2))
+        archived = {self.old.pk, self.traded.pk, self.swapped.pk}
+        self.assertEqual(set(ArchivedAd.objects.values_list('pk', flat=True)), archived)
+        self.assertFalse(Ad.objects.filter(pk__in=archived).exists())
+        self.assertFalse(AdTerm.objects.filter(ad__in=archived).exists())
+        self.assertEqual(ExchangeProposal.objects.count(), 1)
+        proposal = ArchivedProposal.objects.get(pk=self.rejected.pk)
+        self.assertEqual((proposal.status, proposal.receiver, proposal.ad_sender_title), ('rejected', self.other, 'Книга'))
+
+        # Перенесённые предложения ушли и из счётчиков оставшихся объявлений
+        self.assertEqual(services.reconcile_counters(), [])
+        self.live.refresh_from_db()
+        self.assertEqual(self.live.received_rejected_count, 0)
+        self.assertEqual(facets.rebuild(), [])
+        self.assertEqual(archive.archive(), (0, 0))
+
+    def test_tab_counts_match_lists(self):
+        archive.archive()
+        self.client.login(username='other', password='pass')
+        response = self.client.get(reverse('my_proposals'))
+        self.assertEqual(response.context['counts']['received'], len(response.context['proposals']))
+        self.assertEqual(response.context['counts']['received'], 0)
+        response = self.client.get(reverse('my_proposals'), {'tab': 'sent'})
+        self.assertEqual(response.context['counts']['sent_pending'], len(response.context['proposals']))
+
+    def test_archived_pages(self):
+        archive.archive()
+        response = self.client.get(reverse('ad_detail', kwargs={'pk': self.old.pk}))
+        self.assertTemplateUsed(response, 'ads/ad_archived.html')
+        self.assertContains(response, 'Книга')
+        self.assertEqual(self.client.get(reverse('ad_detail', kwargs={'pk': 0})).status_code, 404)
+
+        url = reverse('proposal_detail', kwargs={'pk': self.rejected.pk})
+        self.client.login(username='other', password='pass')
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'ads/proposal_archived.html')
+        self.assertContains(response, reverse('ad_detail', kwargs={'pk': self.old.pk}))
+        self.client.login(username='stranger', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_ads', dry_run=True, stdout=out)
+        self.assertIn('Можно перенести в архив объявлений: 3', out.getvalue())
+        call_command('archive_ads', days=200, stdout=out)
+        self.assertIn('Перенесено в архив объявлений: 0, предложений: 0', out.getvalue())
+        call_command('archive_ads', batch_size=2, repeat=1, stdout=out)
+        self.assertIn('ads_archivedad: строк 3', out.getvalue())
+        self.assertIn('Перенесено в архив объявлений: 3, предложений: 2', out.getvalue())
+
+    def test_background(self):
+        run_pending()
+        call_command('archive_ads', background=True, batch_size=1, stdout=StringIO())
+        # Задача переносит пачку и ставит в очередь следующую, пока есть что переносить
+        self.assertEqual(run_pending(), 4)
+        self.assertEqual(ArchivedAd.objects.count(), 3)
+
+
+class AsyncArchiveTestCase(AsyncViewsMixin, TestCase):
+    async def test_archived_ad(self):
+        user = await User.objects.acreate(username='owner')
+        ad = await sync_to_async(Ad.objects.create)(user=user, title='Книга', description='...', category='books')
+        await Ad.objects.filter(pk=ad.pk).aupdate(is_active=False, updated_at=ad.updated_at - datetime.timedelta(days=100))
+        await sync_to_async(archive.archive)()
+        response = await self.async_client.get(reverse('ad_detail', kwargs={'pk': ad.pk}))
+        self.assertTemplateUsed(response, 'ads/ad_archived.html')
+
+
+class MyProposalsTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        trader = User.objects.create_user(username='trader', password='pass')
+        own = Ad.objects.create(user=self.owner, title='Велосипед', description='...', category='other')
+        self.received = [
+            ExchangeProposal.objects.create(
+                ad_sender=Ad.objects.create(user=trader, title=f'Книга {i}', description='...', category='books'),
+                ad_receiver=own, comment='...',
+            )
+            for i in range(25)
+        ]
+        services.reject_proposal(self.received[0])
+        self.sent = ExchangeProposal.objects.create(
+            ad_sender=own, ad_receiver=self.received[1].ad_sender, comment='Исходящее'
+        )
+        self.client.login(username='owner', password='pass')
+
+    def test_active_tab_only(self):
+        # Сессия, пользователь, страница вкладки и счётчики на вкладках
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('my_proposals'))
+        self.assertEqual(response.context['proposals'], list(reversed(self.received))[:20])
+        self.assertEqual(response.context['counts'], {'received': 25, 'sent_pending': 1})
+        self.assertNotContains(response, 'Исходящее')
+        self.assertContains(response, reverse('my_proposals_fragment') + '?tab=sent')
+
+        cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(reverse('my_proposals'), {'cursor': cursor})
+        self.assertEqual(response.context['proposals'], list(reversed(self.received))[20:])
+        self.assertEqual(self.client.get(reverse('my_proposals'), {'cursor': 'x'}).status_code, 404)
+
+    def test_status_filter(self):
+        response = self.client.get(reverse('my_proposals'), {'status': 'rejected'})
+        self.assertEqual(response.context['proposals'], [self.received[0]])
+        response = self.client.get(reverse('my_proposals'), {'status': 'unknown', 'tab': 'unknown'})
+        self.assertEqual((response.context['active_tab'], response.context['active_status']), ('received', ''))
+        self.assertEqual(len(response.context['proposals']), 20)
+
+    def test_fragment(self):
+        response = self.client.get(reverse('my_proposals_fragment'), {'tab': 'sent'})
+        data = response.json()
+        self.assertEqual((data['tab'], data['next_cursor']), ('sent', None))
+        self.assertIn('Исходящее', data['html'])
+        self.assertNotIn('<html', data['html'])
+
+        data = self.client.get(reverse('my_proposals_fragment')).json()
+        self.assertIn(f'cursor={data["next_cursor"]}'.replace(':', '%3A'), data['html'])
+        data = self.client.get(reverse('my_proposals_fragment'), {'cursor': data['next_cursor']}).json()
+        self.assertEqual(data['next_cursor'], None)
+        self.assertIn('Книга 0', data['html'])
+        self.assertEqual(self.client.get(reverse('my_proposals_fragment'), {'cursor': 'x'}).status_code, 404)
+
+
+class AsyncMyProposalsTestCase(AsyncViewsMixin, TestCase):
+    async def test_tabs(self):
+        user = await sync_to_async(User.objects.create_user)(username='owner', password='pass')
+        other = await User.objects.acreate(username='trader')
+        own = await sync_to_async(Ad.objects.create)(user=user, title='Велосипед', description='...', category='other')
+        ad = await sync_to_async(Ad.objects.create)(user=other, title='Книга', description='...', category='books')
+        await sync_to_async(ExchangeProposal.objects.create)(ad_sender=ad, ad_receiver=own, comment='...')
+        await self.async_client.alogin(username='owner', password='pass')
+        response = await self.async_client.get(reverse('my_proposals'))
+        self.assertEqual(response.context['counts'], {'received': 1, 'sent_pending': 0})
+        self.assertEqual(len(response.context['proposals']), 1)
+        response = await self.async_client.get(reverse('my_proposals_fragment'), {'tab': 'sent'})
+        self.assertIs(response.resolver_match.func.view_class, async_views.MyProposalsFragmentView)
+        self.assertIn('Вы не отправляли предложений', response.json()['html'])
+
+
+@override_settings(RATELIMITS={'global': '3/m', 'ad_create': '1/m', 'test': '3/m'})
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('20/m'), (20, 60))
+        self.assertEqual(ratelimit.parse_rate('5/10s'), (5, 10))
+        self.assertEqual(ratelimit.parse_rate('1000/hour'), (1000, 3600))
+        self.assertIsNone(ratelimit.parse_rate(None))
+        with self.assertRaises(ImproperlyConfigured):
+            ratelimit.parse_rate('20 per minute')
+
+    def test_token_bucket(self):
+        decisions = [ratelimit.hit('test', 'ip:1') for _ in range(4)]
+        self.assertEqual([item.remaining for item in decisions[:3]], [2, 1, 0])
+        self.assertFalse(decisions[3].allowed)
+        self.assertAlmostEqual(decisions[3].retry_after, 20, delta=1)
+        # Ведра клиентов независимы, неизвестный бюджет не ограничивает
+        self.assertTrue(ratelimit.hit('test', 'ip:2').allowed)
+        self.assertTrue(ratelimit.hit('unknown', 'ip:1').allowed)
+        with override_settings(RATELIMIT_ENABLED=False):
+            self.assertTrue(ratelimit.hit('test', 'ip:1').allowed)
+
+    def test_memory_fallback(self):
+        with unittest.mock.patch.object(ratelimit, '_store', side_effect=ConnectionError):
+            with self.assertLogs('ads.ratelimit', 'WARNING'):
+                decisions = [ratelimit.hit('test', 'ip:fallback') for _ in range(4)]
+        self.assertEqual([item.allowed for item in decisions], [True, True, True, False])
+
+    async def test_async(self):
+        decisions = [await ratelimit.ahit('test', 'ip:async') for _ in range(4)]
+        self.assertEqual([item.allowed for item in decisions], [True, True, True, False])
+
+    def test_middleware(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('ad_list')).status_code, 200)
+        response = self.client.get(reverse('ad_list'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(self.client.get(reverse('ad_list'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+        # За прокси клиент определяется по последнему адресу заголовка
+        with override_settings(RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+            response = self.client.get(reverse('ad_list'), headers={'X-Forwarded-For': '1.2.3.4, 10.0.0.3'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_view_budget(self):
+        User.objects.create_user(username='user1', password='pass')
+        self.client.login(username='user1', password='pass')
+        self.assertEqual(self.client.get(reverse('ad_create')).status_code, 200)
+        self.assertEqual(self.client.post(reverse('ad_create'), {'title': ''}).status_code, 200)
+        response = self.client.post(reverse('ad_create'), {'title': ''})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        # GET не ограничивается бюджетом представления
+        self.assertEqual(self.client.get(reverse('ad_create'), REMOTE_ADDR='10.0.0.2').status_code, 200)
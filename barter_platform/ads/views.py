@@ -1,16 +1,34 @@
+from contextlib import aclosing
+
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, DetailView, UpdateView, DeleteView, ListView, TemplateView
-from .models import Ad, ExchangeProposal
+from django.views.generic import CreateView, DetailView, UpdateView, DeleteView, ListView
+from .models import Ad, ArchivedAd, ArchivedProposal, ExchangeProposal, TradeCycle, TradeCycleLeg
 from .forms import AdForm, ProposalCreateForm, ProposalStatusForm
-from django.db.models import Q
-from django.db import connection
+from .conditional import ConditionalGetMixin
+from .pagination import KeysetPaginationMixin
+from .ratelimit import client_ip, ratelimit
+from .search import get_backend
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Prefetch, Q, Sum
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.core.cache import cache
+from .metrics import registry as metrics_registry
+from . import caching, conditional, events, facets, images, matching, services
 
 
+@method_decorator(ratelimit('ad_create'), name='dispatch')
 class AdCreateView(LoginRequiredMixin, CreateView):
     model = Ad
     form_class = AdForm
@@ -28,11 +46,97 @@ class RegisterView(CreateView):
     success_url = reverse_lazy('login')
 
 
-class AdDetailView(DetailView):
+class AdDetailView(ConditionalGetMixin, DetailView):
     model = Ad
+    replica_reads = True  # чтение с реплики, см. ads.routers
     template_name = 'ads/ad_detail.html'
     context_object_name = 'ad'
 
+    def get_queryset(self):
+        return Ad.objects.select_related('user', 'image')
+
+    def get_etag(self):
+        # Версия объявления меняется и при изменении предложений по нему,
+        # ключ sender_ad — при изменении объявлений пользователя
+        pk, user = self.kwargs['pk'], self.request.user
+        parts = [caching.ad_key(pk, 'page'), user.pk]
+        if user.is_authenticated:
+            parts.append(caching.sender_ad_key(user, pk))
+        return conditional.make_etag(*parts)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            # Объявление могло быть перенесено в архив (см. ads.archive)
+            archived = self.get_archived_queryset().first()
+            if archived is None:
+                raise
+            return self.render_archived(archived)
+
+    def get_archived_queryset(self):
+        return ArchivedAd.objects.filter(pk=self.kwargs['pk']).select_related('user')
+
+    def render_archived(self, archived):
+        return render(self.request, 'ads/ad_archived.html', {'ad': archived})
+
+    def get_object(self, queryset=None):
+        key = caching.ad_key(self.kwargs['pk'], 'object')
+        ad = cache.get(key)
+        if ad is None:
+            ad = super().get_object(queryset)
+            cache.set(key, ad, caching.get_timeout())
+        return ad
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        ad = self.object
+
+        # Всё, что читает шаблон, выбираем здесь, а не ленивыми вызовами в шаблоне
+        context['proposals'] = []
+        context['sender_ad'] = None
+        if user.is_authenticated and user.pk == ad.user_id:
+            context['proposals'] = cache.get_or_set(
+                caching.ad_key(ad.pk, 'proposals'),
+                lambda: list(self.get_proposals_queryset()),
+                caching.get_timeout()
+            )
+        elif user.is_authenticated:
+            # Хранится кортежем, чтобы отличать «нет объявления» от промаха кеша
+            context['sender_ad'], = cache.get_or_set(
+                caching.sender_ad_key(user, ad.pk),
+                lambda: (self.get_sender_ad_queryset().first(),),
+                caching.get_timeout()
+            )
+        return context
+
+    def get_proposals_queryset(self):
+        return self.object.received_proposals.select_related('ad_sender')
+
+    def get_sender_ad_queryset(self):
+        """
+        Объявления пользователя, которые он может предложить в обмен:
+        сначала лучшее по подбору обменов, затем самые новые.
+        """
+        return self.request.user.ads.filter(is_active=True).annotate(
+            match_score=Max('matches__score', filter=Q(matches__candidate=self.object.pk))
+        ).order_by(F('match_score').desc(nulls_last=True), '-created_at')
+
+
+class AdMatchesView(DetailView):
+    """Подходящие обмены для объявления (см. ``ads.matching``)."""
+
+    model = Ad
+    template_name = 'ads/ad_matches.html'
+    context_object_name = 'ad'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['matches'] = matching.get_matches(self.object)
+        context['is_owner'] = self.request.user.pk == self.object.user_id
+        return context
+
 
 class AdUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Ad
@@ -55,39 +159,94 @@ class AdDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.get_object().user == self.request.user
 
 
-class AdListView(ListView):
+class AdListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     model = Ad
+    replica_reads = True  # чтение с реплики, см. ads.routers
     template_name = 'ads/ad_list.html'
     paginate_by = 10
     context_object_name = 'ads'
 
-    def get_queryset(self):
+    # Параметры, от которых зависят счётчики фасетов
+    facet_params = ('q', 'category', 'condition')
+
+    def get_search_queryset(self):
+        """Лента без фильтров по категории и состоянию (с поиском, если задан ``q``)."""
         # Начинаем с фильтрации по is_active
         queryset = Ad.objects.filter(
             is_active=True
-        ).exclude(
-            user=self.request.user  # Исключаем объявления текущего пользователя
-        ).order_by('-created_at')
+        ).select_related('user', 'image')
+        if self.request.user.is_authenticated:
+            # Исключаем объявления текущего пользователя
+            queryset = queryset.exclude(user=self.request.user)
 
-        # Получаем параметры
+        # Полнотекстовый поиск: сначала самые релевантные
         search = self.request.GET.get('q')
+        if search:
+            queryset = get_backend().search(queryset, search)
+        return queryset
+
+    def get_queryset(self):
+        queryset = self.get_search_queryset()
+
+        # Получаем параметры
         category = self.request.GET.get('category')
         condition = self.request.GET.get('condition')
 
         # Применяем фильтры
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search)
-            )
-
         if category:
             queryset = queryset.filter(category=category)
 
         if condition:
             queryset = queryset.filter(condition=condition)
 
-        return queryset.order_by('-created_at')
+        return queryset.order_by(*self.get_cursor_ordering())
+
+    def get_facet_arguments(self):
+        """Аргументы ``facets.get_counts``: с поиском — по найденным, без — из таблицы."""
+        arguments = {
+            'category': self.request.GET.get('category', ''),
+            'condition': self.request.GET.get('condition', ''),
+        }
+        if self.request.GET.get('q'):
+            arguments['search_queryset'] = self.get_search_queryset()
+        else:
+            arguments['user'] = self.request.user
+        return arguments
+
+    def get_facets(self):
+        key = caching.facets_key(self.request, self.facet_params)
+        counts = cache.get(key)
+        if counts is None:
+            counts = facets.get_counts(**self.get_facet_arguments())
+            cache.set(key, counts, caching.get_timeout())
+        return counts
+
+    def get_etag(self):
+        # Ключ кеша страницы: версия ленты, пользователь и параметры запроса
+        return conditional.make_etag(caching.feed_key(self.request))
+
+    def get_last_modified(self):
+        return caching.feed_last_modified()
+
+    def get_cursor_ordering(self):
+        if self.request.GET.get('q'):
+            return ('-search_rank', '-created_at', '-id')
+        return super().get_cursor_ordering()
+
+    def paginate_queryset(self, queryset, page_size):
+        # Кешируются только страницы по курсору; нумерованные страницы
+        # запрашиваются явно и редко
+        if self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+
+        key = caching.feed_key(self.request)
+        page = cache.get(key)
+        if page is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(
+                queryset, page_size
+            )
+            cache.set(key, page, caching.get_timeout())
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -95,13 +254,15 @@ class AdListView(ListView):
             'search_query': self.request.GET.get('q', ''),
             'selected_category': self.request.GET.get('category', ''),
             'selected_condition': self.request.GET.get('condition', ''),
-            'categories': Ad.CATEGORY_CHOICE,
-            'conditions': Ad.CONDITION_CHOICE,
         })
+        # Варианты фильтров со счётчиками: (значение, подпись, число объявлений)
+        labeled = facets.with_labels(self.get_facets())
+        context['categories'] = labeled['category']
+        context['conditions'] = labeled['condition']
         return context
 
 
-class UserAdsView(LoginRequiredMixin, ListView):
+class UserAdsView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'ads/user_ads.html'
     context_object_name = 'ads'
     paginate_by = 10  # Пагинация по 10 объявлений
@@ -111,9 +272,10 @@ class UserAdsView(LoginRequiredMixin, ListView):
         return Ad.objects.filter(
             user=self.request.user,
             is_active=True
-        ).order_by('-created_at')
+        ).select_related('user', 'image').order_by(*self.get_cursor_ordering())
 
 
+@method_decorator(ratelimit('propose_exchange'), name='dispatch')
 class ExchangeProposalCreateView(LoginRequiredMixin, CreateView):
     form_class = ProposalCreateForm
     template_name = 'ads/proposal_form.html'
@@ -148,8 +310,18 @@ class ExchangeProposalCreateView(LoginRequiredMixin, CreateView):
         form.instance.ad_sender = self.ad_sender
         form.instance.ad_receiver = self.ad_receiver
         form.instance.status = 'pending'
+        # Предложение и счётчики объявлений (сигнал post_save) — одной транзакцией
+        try:
+            with transaction.atomic():
+                response = super().form_valid(form)
+        except IntegrityError:
+            # Повторная отправка формы или одновременный запрос успели раньше
+            # (ограничение unique_proposal_pair)
+            messages.error(
+                self.request, "Вы уже отправляли предложение для этого обмена")
+            return redirect(self.ad_receiver.get_absolute_url())
         messages.success(self.request, "Предложение успешно отправлено!")
-        return super().form_valid(form)
+        return response
 
     def get_success_url(self):
         return reverse('ad_detail', kwargs={'pk': self.ad_receiver.pk})
@@ -170,26 +342,14 @@ class ExchangeProposalUpdateView(LoginRequiredMixin, UserPassesTestMixin, Update
         proposal = self.get_object()
         return proposal.ad_receiver.user == self.request.user and proposal.status == 'pending'
 
-    def post(self, request, *args, **kwargs):
-        # Должно появиться в консоли сервера
-        print("POST запрос получен! Данные:", request.POST)
-
-        return super().post(request, *args, **kwargs)
-
     def accept(self, request, *args, **kwargs):
         """Обработка принятия предложения"""
         proposal = self.get_object()
-        if proposal.status != 'pending':
-            messages.error(request, "Предложение уже обработано")
+        try:
+            services.accept_proposal(proposal)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
             return redirect('my_proposals')
-        proposal = self.get_object()
-        proposal.status = 'accepted'
-        proposal.save()
-
-        proposal.ad_sender.is_active = False
-        proposal.ad_receiver.is_active = False
-        proposal.ad_sender.save()
-        proposal.ad_receiver.save()
 
         messages.success(request, "Обмен подтверждён! Объявления скрыты.")
         return redirect('my_proposals')
@@ -197,8 +357,11 @@ class ExchangeProposalUpdateView(LoginRequiredMixin, UserPassesTestMixin, Update
     def reject(self, request, *args, **kwargs):
         """Обработка отклонения предложения"""
         proposal = self.get_object()
-        proposal.status = 'rejected'
-        proposal.save()
+        try:
+            services.reject_proposal(proposal)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
+            return redirect('my_proposals')
 
         messages.warning(request, "Предложение отклонено.")
         return redirect('my_proposals')
@@ -207,47 +370,133 @@ class ExchangeProposalUpdateView(LoginRequiredMixin, UserPassesTestMixin, Update
         return reverse('my_proposals')
 
 
-class MyProposalsView(LoginRequiredMixin, TemplateView):
+class MyProposalsView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """
+    Входящие и исходящие предложения пользователя.
+
+    Выбирается только активная вкладка (``tab``), постранично по курсору и
+    с фильтром по статусу (``status``). Другая вкладка и следующие страницы
+    подгружаются по запросу через ``MyProposalsFragmentView``. Числа на
+    вкладках берутся из счётчиков объявлений, без подсчёта предложений.
+    """
+
     template_name = 'ads/my_proposals.html'
+    context_object_name = 'proposals'
+    paginate_by = 20
+    tabs = ('received', 'sent')
+    include_counts = True
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
-        # Получаем активную вкладку
-        tab = self.request.GET.get('tab', 'received')
+    def get_tab(self):
+        tab = self.request.GET.get('tab')
+        return tab if tab in self.tabs else self.tabs[0]
+
+    def get_status(self):
+        status = self.request.GET.get('status')
+        return status if status in dict(ExchangeProposal.STATUS_CHOICES) else ''
 
-        context['active_tab'] = tab
-        context['received_proposals'] = ExchangeProposal.objects.filter(
-            ad_receiver__user=user
+    def get_received_queryset(self):
+        return ExchangeProposal.objects.filter(
+            ad_receiver__user=self.request.user
         ).select_related('ad_sender', 'ad_receiver')
 
-        context['sent_proposals'] = ExchangeProposal.objects.filter(
-            ad_sender__user=user
+    def get_sent_queryset(self):
+        return ExchangeProposal.objects.filter(
+            ad_sender__user=self.request.user
         ).select_related('ad_receiver', 'ad_sender')
 
+    def get_queryset(self):
+        queryset = getattr(self, f'get_{self.get_tab()}_queryset')()
+        status = self.get_status()
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset.order_by(*self.get_cursor_ordering())
+
+    def get_counts_arguments(self):
+        """Суммы счётчиков по объявлениям пользователя (см. ``Ad.COUNTER_FIELDS``)."""
+        return {
+            'received': Sum(F('received_pending_count') + F('received_accepted_count')
+                            + F('received_rejected_count'), default=0),
+            'sent_pending': Sum('sent_pending_count', default=0),
+        }
+
+    def get_counts(self):
+        return Ad.objects.filter(user=self.request.user).aggregate(**self.get_counts_arguments())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['active_tab'] = self.get_tab()
+        context['active_status'] = self.get_status()
+        context['statuses'] = ExchangeProposal.STATUS_CHOICES
+        # Поток событий держит соединение открытым, что возможно только под ASGI
+        context['live_events'] = isinstance(self.request, ASGIRequest)
+        if self.include_counts:
+            context['counts'] = self.get_counts()
         return context
 
 
+class MyProposalsFragmentView(MyProposalsView):
+    """
+    Страница вкладки «Моих предложений» в JSON: HTML карточек и курсор
+    следующей страницы. Параметры те же, что у ``MyProposalsView``.
+    """
+
+    template_name = 'ads/_proposal_list.html'
+    include_counts = False
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        return JsonResponse({
+            'tab': context['active_tab'],
+            'html': render_to_string(self.template_name, context, self.request),
+            'next_cursor': getattr(page, 'next_cursor', None),
+        })
+
+
+class ProposalEventsView(View):
+    """
+    Поток SSE с событиями о предложениях пользователя (см. ``ads.events``).
+
+    Работает только под ASGI: поток открыт, пока клиент подключён. Под WSGI
+    каждый открытый поток занимал бы поток воркера, поэтому ответ — 204
+    (EventSource после него не переподключается), а страница «Моих
+    предложений» поток и не открывает.
+    """
+
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponseForbidden()
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        response = StreamingHttpResponse(self.stream(user.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+        return response
+
+    async def stream(self, user_id):
+        yield f'retry: {events.RETRY_MS}\n\n'
+        async with aclosing(events.listen(user_id)) as stream:
+            async for event in stream:
+                yield events.format_sse(event)
+
+
 class ProposalAcceptView(LoginRequiredMixin, View):
     """Обработка принятия предложения обмена"""
 
     def post(self, request, pk):
-        proposal = get_object_or_404(
-            ExchangeProposal,
-            pk=pk,
-            ad_receiver__user=request.user,  # Только получатель может принять
-            status='pending'  # Только ожидающие предложения
-        )
-
-        # Обновляем статус
-        proposal.status = 'accepted'
-        proposal.save()
-
-        # Делаем объявления неактивными
-        proposal.ad_sender.is_active = False
-        proposal.ad_receiver.is_active = False
-        proposal.ad_sender.save()
-        proposal.ad_receiver.save()
+        # Обновляем статус, скрываем объявления и отклоняем конкурирующие
+        # предложения; параллельное принятие могло нас опередить
+        try:
+            proposal = services.retry_locked(lambda: get_object_or_404(
+                ExchangeProposal,
+                pk=pk,
+                ad_receiver__user=request.user,  # Только получатель может принять
+                status='pending'  # Только ожидающие предложения
+            ))
+            services.accept_proposal(proposal)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
+            return redirect('my_proposals')
 
         messages.success(
             request, "Вы приняли предложение обмена! Объявления скрыты.")
@@ -258,16 +507,18 @@ class ProposalRejectView(LoginRequiredMixin, View):
     """Обработка отклонения предложения обмена"""
 
     def post(self, request, pk):
-        proposal = get_object_or_404(
-            ExchangeProposal,
-            pk=pk,
-            ad_receiver__user=request.user,  # Только получатель может отклонить
-            status='pending'  # Только ожидающие предложения
-        )
-
-        # Обновляем статус
-        proposal.status = 'rejected'
-        proposal.save()
+        # Обновляем статус и счётчики
+        try:
+            proposal = services.retry_locked(lambda: get_object_or_404(
+                ExchangeProposal,
+                pk=pk,
+                ad_receiver__user=request.user,  # Только получатель может отклонить
+                status='pending'  # Только ожидающие предложения
+            ))
+            services.reject_proposal(proposal)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
+            return redirect('my_proposals')
 
         messages.warning(request, "Вы отклонили предложение обмена.")
         return redirect('my_proposals')
@@ -282,4 +533,121 @@ class ExchangeProposalDetailView(LoginRequiredMixin, DetailView):
         return ExchangeProposal.objects.filter(
             Q(ad_sender__user=self.request.user) |
             Q(ad_receiver__user=self.request.user)
+        ).select_related('ad_sender__user', 'ad_receiver__user')
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            # Предложение могло быть перенесено в архив вместе с объявлением
+            archived = ArchivedProposal.objects.filter(
+                Q(sender=request.user) | Q(receiver=request.user), pk=self.kwargs['pk']
+            ).select_related('sender', 'receiver').first()
+            if archived is None:
+                raise
+            return render(request, 'ads/proposal_archived.html', {'proposal': archived})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MetricsView(View):
+    """
+    Метрики в текстовом формате Prometheus.
+
+    Доступны персоналу и адресам из ``INTERNAL_IPS``. Адрес клиента за
+    обратным прокси берётся из ``RATELIMIT_IP_HEADER`` (см.
+    ``ratelimit.client_ip``). POST с параметром ``enabled`` (``1``/``0``)
+    включает или выключает сбор метрик на лету, ``reset=1`` обнуляет
+    накопленные данные. С внутренних адресов (скрейпер, curl) POST
+    принимается без CSRF-токена, от персонала через браузер — только с ним.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if client_ip(request) in settings.INTERNAL_IPS:
+            return super().dispatch(request, *args, **kwargs)
+        if not request.user.is_staff:
+            raise PermissionDenied
+        dispatch = super().dispatch
+        return csrf_protect(lambda request: dispatch(request, *args, **kwargs))(request)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics_registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
         )
+
+    def post(self, request):
+        if 'enabled' in request.POST:
+            metrics_registry.enabled = request.POST['enabled'] == '1'
+        if request.POST.get('reset') == '1':
+            metrics_registry.reset()
+        return self.get(request)
+
+
+class ThumbnailView(View):
+    """
+    Миниатюра изображения объявления из хранилища. Имя файла — хеш
+    содержимого, поэтому ответ кешируется браузером и CDN навсегда; в
+    продакшене каталог миниатюр можно отдавать веб-сервером с теми же
+    заголовками.
+    """
+
+    def get(self, request, name):
+        extension = name.rpartition('.')[2]
+        if extension not in images.CONTENT_TYPES or '..' in name:
+            raise Http404
+        try:
+            file = default_storage.open(f'{images.THUMBNAIL_DIR}/{name}')
+        except FileNotFoundError:
+            raise Http404
+        response = FileResponse(file, content_type=images.CONTENT_TYPES[extension])
+        response['Cache-Control'] = images.CACHE_CONTROL
+        return response
+
+
+class TradeCycleListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """Обмены по цепочке, в которых участвует пользователь."""
+
+    template_name = 'ads/trade_cycles.html'
+    context_object_name = 'cycles'
+    paginate_by = 20
+
+    def get_queryset(self):
+        legs = TradeCycleLeg.objects.select_related('user', 'receives', 'gives')
+        return TradeCycle.objects.filter(
+            legs__user=self.request.user
+        ).prefetch_related(Prefetch('legs', queryset=legs))
+
+
+class TradeCycleConfirmView(LoginRequiredMixin, View):
+    """Подтверждение обмена по цепочке участником"""
+
+    def post(self, request, pk):
+        cycle = get_object_or_404(TradeCycle, pk=pk, legs__user=request.user)
+        try:
+            cycle = services.confirm_cycle(cycle, request.user)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
+            return redirect('trade_cycles')
+
+        if cycle.status == 'accepted':
+            messages.success(request, "Все участники подтвердили обмен! Объявления скрыты.")
+        elif cycle.status == 'broken':
+            messages.error(request, "Обмен больше невозможен: одно из предложений уже обработано.")
+        else:
+            messages.success(request, "Вы подтвердили обмен. Ждём остальных участников.")
+        return redirect('trade_cycles')
+
+
+class TradeCycleDeclineView(LoginRequiredMixin, View):
+    """Отказ участника от обмена по цепочке"""
+
+    def post(self, request, pk):
+        cycle = get_object_or_404(TradeCycle, pk=pk, legs__user=request.user)
+        try:
+            services.decline_cycle(cycle, request.user)
+        except services.ExchangeError as error:
+            messages.error(request, str(error))
+            return redirect('trade_cycles')
+
+        messages.warning(request, "Вы отказались от обмена по цепочке.")
+        return redirect('trade_cycles')
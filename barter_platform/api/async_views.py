@@ -0,0 +1,82 @@
+"""
+Асинхронные варианты списков API (включаются настройкой ``ASYNC_VIEWS``).
+
+DRF 3.16 не поддерживает async-представления, поэтому GET списка
+обрабатывается обычным async-представлением Django: запрос, сериализатор
+(``ValuesSerializer``, см. ``api.sparse``) и пагинация берутся из
+DRF-представления, а страница выбирается асинхронно
+(``KeysetPagination.apaginate_queryset``). Проверки DRF до обработки
+(``initial()``: аутентификация, права, согласование формата и ограничение
+частоты) выполняются в потоке, как в синхронном варианте; их ошибки
+(401/403, 406, 429 с ``Retry-After``) и ошибки параметров отдаёт
+обработчик исключений DRF. Успешный ответ — тот же JSON (без браузерного
+интерфейса DRF). Остальные методы (создание) выполняет DRF-представление
+в потоке.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+
+from . import views
+
+
+class AsyncListView(View):
+    """
+    Асинхронный GET для ``ListCreateAPIView`` из ``api_view_class``.
+
+    До выборки страницы выполняется ``initial()`` DRF-представления с его
+    ``authentication_classes``, ``permission_classes``,
+    ``content_negotiation_class`` и ``throttle_classes``; исключения
+    обрабатывает его ``handle_exception``. Не поддерживаются только
+    браузерный интерфейс DRF и ``finalize_response`` успешного ответа.
+
+    Attributes:
+        api_view_class (type): DRF-представление с ``SparseFieldsMixin``:
+            источник ``queryset``, сериализатора и пагинации; обрабатывает
+            все методы, кроме GET.
+    """
+
+    api_view_class = None
+    replica_reads = True  # GET читает с реплики, см. ads.routers
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Схема API (drf_yasg) описывает эндпоинт по DRF-представлению
+        view.cls = cls.api_view_class
+        view.initkwargs = {}
+        # CSRF для сессий проверяет аутентификация DRF, как и в синхронном варианте
+        return csrf_exempt(view)
+
+    async def get(self, request, *args, **kwargs):
+        api_view = self.api_view_class(args=args, kwargs=kwargs, format_kwarg=None)
+        api_view.request = request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.headers = api_view.default_response_headers
+        try:
+            await sync_to_async(api_view.initial)(request, *args, **kwargs)
+            values_serializer = api_view.get_values_serializer()
+            queryset = api_view.get_values_queryset(values_serializer)
+            page = await api_view.paginator.apaginate_queryset(queryset, request, api_view)
+        except Exception as error:
+            response = api_view.handle_exception(error)
+            return api_view.finalize_response(request, response, *args, **kwargs)
+        data = api_view.paginator.get_paginated_response(values_serializer.serialize(page)).data
+        return self.render(data)
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.api_view_class.as_view())(request, *args, **kwargs)
+
+    def render(self, data, status=200):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AdListCreateView(AsyncListView):
+    api_view_class = views.AdListCreateView
+
+
+class ProposalListCreateView(AsyncListView):
+    api_view_class = views.ProposalListCreateView
@@ -0,0 +1,127 @@
+"""
+Пакетные эндпоинты API.
+
+Один HTTP-запрос создаёт (``POST``), изменяет (``PATCH``) или удаляет
+(``DELETE``) много объектов. Тело запроса — JSON-список: объекты для
+создания, объекты с ``id`` для изменения или ``id`` для удаления.
+Каждый элемент проверяется отдельно, корректные элементы записываются
+в одной транзакции через ``bulk_create``/``bulk_update``, а в ответе для
+каждого элемента возвращается результат::
+
+    {"results": [{"index": 0, "status": "created", "id": 7},
+                 {"index": 1, "status": "error", "errors": {...}}]}
+
+Код ответа: 200 — все элементы обработаны, 207 — часть с ошибками,
+400 — ни одного успешного элемента. Размер пакета ограничен настройкой
+``API_BATCH_MAX_ITEMS``.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class BatchResults:
+    """Результаты обработки элементов пакета по их индексам."""
+
+    def __init__(self):
+        self.items = {}
+
+    def ok(self, index, result, pk):
+        self.items[index] = {'index': index, 'status': result, 'id': pk}
+
+    def error(self, index, errors):
+        self.items[index] = {'index': index, 'status': 'error', 'errors': errors}
+
+    def response(self):
+        results = [self.items[index] for index in sorted(self.items)]
+        failed = sum(item['status'] == 'error' for item in results)
+        if not failed:
+            code = status.HTTP_200_OK
+        elif failed < len(results):
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=code)
+
+
+class BatchAPIView(APIView):
+    """
+    Базовое представление пакетных операций.
+
+    Подклассы реализуют ``create_items``, ``update_items`` и
+    ``delete_items``; каждый получает список элементов и ``BatchResults``
+    и вызывается внутри одной транзакции.
+    """
+
+    throttle_scope = 'api_write'  # бюджет изменений, см. api.throttling
+
+    def get_max_items(self):
+        return getattr(settings, 'API_BATCH_MAX_ITEMS', 100)
+
+    def get_throttle_cost(self, request):
+        # Жетон на элемент пакета, а не на запрос
+        items = request.data
+        return len(items) if isinstance(items, list) and items else 1
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Ожидается JSON-список']})
+        if not items:
+            raise ValidationError({'non_field_errors': ['Пустой пакет']})
+        max_items = self.get_max_items()
+        if len(items) > max_items:
+            raise ValidationError({
+                'non_field_errors': [f'В пакете не больше {max_items} элементов']
+            })
+        return items
+
+    def split_updates(self, items, results):
+        """Отделяет элементы ``PATCH`` без корректного ``id`` (с ошибкой)."""
+        valid = []
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else None
+            if not isinstance(pk, int):
+                results.error(index, {'id': ['Обязательное целое поле']})
+            else:
+                valid.append((index, pk, item))
+        return valid
+
+    def split_ids(self, items, results):
+        """Проверяет список ``id`` для ``DELETE``."""
+        valid = []
+        for index, pk in enumerate(items):
+            if not isinstance(pk, int):
+                results.error(index, {'id': ['Ожидается целое число']})
+            else:
+                valid.append((index, pk))
+        return valid
+
+    def handle_batch(self, request, handler):
+        items = self.get_items(request)
+        results = BatchResults()
+        with transaction.atomic():
+            handler(items, results)
+        return results.response()
+
+    def post(self, request):
+        return self.handle_batch(request, self.create_items)
+
+    def patch(self, request):
+        return self.handle_batch(request, self.update_items)
+
+    def delete(self, request):
+        return self.handle_batch(request, self.delete_items)
+
+    def create_items(self, items, results):
+        raise NotImplementedError
+
+    def update_items(self, items, results):
+        raise NotImplementedError
+
+    def delete_items(self, items, results):
+        raise NotImplementedError
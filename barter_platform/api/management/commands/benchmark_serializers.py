@@ -0,0 +1,82 @@
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ads.models import Ad, ExchangeProposal
+from api.serializers import AdSerializer, AdValuesSerializer, ProposalSerializer, ProposalValuesSerializer
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк сериализации длинных списков API: ModelSerializer против '
+            'ValuesSerializer (values(), ?fields=, ?expand=). Данные создаются '
+            'во временной транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000,
+                            help='Объявлений и предложений в списке')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Повторов замера; в отчёт идёт лучший результат')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ads, proposals = self.create_data(options['rows'])
+            # Первый вариант в группе — текущий ModelSerializer, с ним сравниваются остальные
+            groups = {
+                'Объявления': [
+                    ('AdSerializer', lambda: AdSerializer(list(ads), many=True).data),
+                    ('ValuesSerializer', lambda: self.serialize(AdValuesSerializer(), ads)),
+                    ('?fields=id,title', lambda: self.serialize(AdValuesSerializer(fields=['id', 'title']), ads)),
+                    ('?expand=user', lambda: self.serialize(AdValuesSerializer(expand=['user']), ads)),
+                ],
+                'Предложения': [
+                    ('ProposalSerializer', lambda: ProposalSerializer(list(proposals), many=True).data),
+                    ('ValuesSerializer', lambda: self.serialize(ProposalValuesSerializer(), proposals)),
+                    ('?expand=ad_sender,ad_receiver', lambda: self.serialize(
+                        ProposalValuesSerializer(expand=['ad_sender', 'ad_receiver']), proposals)),
+                ],
+            }
+            for group, cases in groups.items():
+                baseline = None
+                for label, case in cases:
+                    seconds = self.measure(case, options['repeat'])
+                    baseline = baseline or seconds
+                    self.report(f'{group}: {label}', seconds, options['rows'], baseline)
+            transaction.set_rollback(True)
+
+    def create_data(self, rows):
+        users = User.objects.bulk_create(
+            User(username=f'benchmark_serializers_{number}') for number in range(2)
+        )
+        ads = Ad.objects.bulk_create(
+            Ad(user=users[number % 2], title=f'Объявление {number}',
+               description='Описание объявления ' * 10, category='other', condition='used')
+            for number in range(rows)
+        )
+        # Пары (i, i + 1) уникальны, как требует ограничение модели
+        ExchangeProposal.objects.bulk_create(
+            ExchangeProposal(ad_sender=ads[number], ad_receiver=ads[(number + 1) % rows],
+                             comment='Предложение обмена')
+            for number in range(rows)
+        )
+        return (
+            Ad.objects.filter(user__in=users),
+            ExchangeProposal.objects.filter(ad_sender__user__in=users),
+        )
+
+    def serialize(self, serializer, queryset):
+        return serializer.serialize(serializer.values(queryset))
+
+    def measure(self, case, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = perf_counter()
+            case()
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def report(self, label, seconds, rows, baseline):
+        speedup = f', ×{baseline / seconds:.1f}' if seconds != baseline else ''
+        self.stdout.write(f'{label}: {seconds * 1000:.1f} мс, {rows / seconds:.0f} строк/с{speedup}')
@@ -0,0 +1,91 @@
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from ads.pagination import InvalidCursor, KeysetPaginator
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация для списков API.
+
+    Ответ имеет вид ``{"next": ..., "previous": ..., "results": [...]}``;
+    ``COUNT(*)`` не выполняется. Если явно передан ``?page=``, используется
+    обычная нумерованная пагинация DRF (с полем ``count``).
+    """
+
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_query_param = 'page'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fallback = None
+        if self.page_query_param in request.query_params:
+            self.fallback = PageNumberPagination()
+            self.fallback.page_size = self.get_page_size(request)
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), self.ordering)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Некорректный курсор страницы')
+        return self.page.object_list
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Асинхронный вариант ``paginate_queryset`` для ``api.async_views``."""
+        self.request = request
+        self.fallback = None
+        if self.page_query_param in request.query_params:
+            # Нумерованные страницы запрашиваются явно и редко: COUNT(*)
+            # и выборка страницы идут через синхронную пагинацию DRF в потоке
+            self.fallback = PageNumberPagination()
+            self.fallback.page_size = self.get_page_size(request)
+            return await sync_to_async(self.fallback.paginate_queryset)(queryset, request, view)
+
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), self.ordering)
+        try:
+            self.page = await paginator.apage(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Некорректный курсор страницы')
+        return self.page.object_list
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
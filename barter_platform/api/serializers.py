@@ -1,12 +1,110 @@
+from django.contrib.auth.models import User
 from rest_framework import serializers
-from ads.models import Ad, ExchangeProposal
+from ads.models import Ad, AdMatch, ExchangeProposal
+from .sparse import ValuesSerializer
+
+
+class CachedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связанный объект по pk с кешем в ``context['related']``.
+
+    Один сериализатор в пакетном запросе проверяет много строк с одними и
+    теми же пользователями и объявлениями; кеш оставляет один запрос на объект.
+    """
+
+    def to_internal_value(self, data):
+        related = self.context.setdefault('related', {})
+        key = (self.get_queryset().model._meta.label, str(data))
+        if key not in related:
+            related[key] = super().to_internal_value(data)
+        return related[key]
+
 
 class AdSerializer(serializers.ModelSerializer):
+    user = CachedRelatedField(queryset=User.objects.all())
+
     class Meta:
         model = Ad
         fields = ['id', 'title', 'description', 'user', 'category', 'is_active']
 
+
+class UserValuesSerializer(ValuesSerializer):
+    """Пользователь во вложенном объекте (``?expand=user``)."""
+
+    fields = ('id', 'username')
+
+
+class AdValuesSerializer(ValuesSerializer):
+    """Чтение объявлений: те же поля, что у ``AdSerializer``."""
+
+    fields = tuple(AdSerializer.Meta.fields)
+    expandable = {'user': UserValuesSerializer}
+
+
+class AdMatchSerializer(serializers.ModelSerializer):
+    """Подходящий обмен: объявление-кандидат и оценка совпадения."""
+
+    ad = AdSerializer(source='candidate', read_only=True)
+
+    class Meta:
+        model = AdMatch
+        fields = ['ad', 'score']
+
+
+class AdImportSerializer(AdSerializer):
+    """Строка массового импорта: поля ``AdSerializer`` и поля ``AdForm``."""
+
+    class Meta(AdSerializer.Meta):
+        fields = ['user', 'title', 'description', 'image_url', 'category', 'condition']
+
+
 class ProposalSerializer(serializers.ModelSerializer):
+    ad_sender = CachedRelatedField(queryset=Ad.objects.all())
+    ad_receiver = CachedRelatedField(queryset=Ad.objects.all())
+
     class Meta:
         model = ExchangeProposal
-        fields = ['id', 'ad_sender', 'ad_receiver', 'status', 'comment']
\ No newline at end of file
+        fields = ['id', 'ad_sender', 'ad_receiver', 'status', 'comment']
+
+    def validate_ad_sender(self, value):
+        return self.validate_unchanged('ad_sender', value)
+
+    def validate_ad_receiver(self, value):
+        return self.validate_unchanged('ad_receiver', value)
+
+    def validate_unchanged(self, field, value):
+        # Объявления задаются при создании: на них считаются счётчики
+        # предложений (ads.services.update_counters)
+        instance = self.instance
+        if isinstance(instance, ExchangeProposal) and getattr(instance, f'{field}_id') != value.pk:
+            raise serializers.ValidationError('Объявления предложения после создания не меняются')
+        return value
+
+    def validate_status(self, value):
+        # Статус обработанного предложения только для чтения: принять или
+        # отклонить можно лишь ожидающее (через ads.services)
+        instance = self.instance
+        if isinstance(instance, ExchangeProposal) and instance.status != 'pending' and value != instance.status:
+            raise serializers.ValidationError('Предложение уже обработано, статус изменить нельзя')
+        return value
+
+
+class ProposalValuesSerializer(ValuesSerializer):
+    """Чтение предложений: те же поля, что у ``ProposalSerializer``."""
+
+    fields = tuple(ProposalSerializer.Meta.fields)
+    expandable = {'ad_sender': AdValuesSerializer, 'ad_receiver': AdValuesSerializer}
+
+
+class ProposalBatchSerializer(ProposalSerializer):
+    """Предложение в пакетном запросе: уникальность пар проверяется одним запросом."""
+
+    class Meta(ProposalSerializer.Meta):
+        validators = []
+
+
+class ProposalBatchUpdateSerializer(ProposalSerializer):
+    """Изменение предложения в пакетном запросе: только статус и комментарий."""
+
+    class Meta(ProposalSerializer.Meta):
+        fields = ['id', 'status', 'comment']
@@ -0,0 +1,158 @@
+"""
+Разреженные наборы полей (``?fields=``, ``?expand=``) и быстрое чтение.
+
+``ModelSerializer`` на каждую строку создаёт модель и проходит по объектам
+полей сериализатора; на длинных списках это основная часть времени ответа.
+``ValuesSerializer`` собирает словари прямо из строк ``QuerySet.values()``:
+в ``SELECT`` попадают только запрошенные столбцы, а связанные объекты
+присоединяются (``JOIN``) только при раскрытии через ``?expand=``.
+
+Параметры запроса:
+
+* ``fields=id,title`` — только перечисленные поля (порядок полей — как в
+  ответе без параметра); ``ad_sender.title`` выбирает поля вложенного
+  объекта;
+* ``expand=user`` — вместо pk связанного объекта вложенный объект;
+  ``ad_sender.user`` раскрывает связь вложенного объекта.
+
+Без параметров ответ совпадает с ответом ``ModelSerializer`` представления.
+"""
+
+from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+def split_param(value):
+    """Список имён из параметра вида ``a,b.c``; None, если параметр пуст."""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    return names or None
+
+
+def _split_nested(names):
+    top, nested = [], {}
+    for name in names:
+        head, _, rest = name.partition('.')
+        if head not in top:
+            top.append(head)
+        if rest:
+            nested.setdefault(head, []).append(rest)
+    return top, nested
+
+
+class ValuesSerializer:
+    """
+    Сериализация только для чтения из строк ``QuerySet.values()``.
+
+    Attributes:
+        fields (tuple): Поля ответа по умолчанию (как у ``ModelSerializer``).
+        expandable (dict): Связи, которые раскрывает ``expand``:
+            имя поля → ``ValuesSerializer`` связанной модели.
+    """
+
+    fields = ()
+    expandable = {}
+
+    def __init__(self, fields=None, expand=None):
+        """
+        Args:
+            fields (list): Запрошенные поля; None — все поля ``fields``.
+            expand (list): Раскрываемые связи.
+
+        Raises:
+            ValidationError: Неизвестное поле или связь.
+        """
+        expand_top, expand_nested = _split_nested(expand or ())
+        unknown = [name for name in expand_top if name not in self.expandable]
+        if unknown:
+            raise ValidationError({'expand': [f'Нельзя раскрыть: {", ".join(unknown)}']})
+
+        fields_nested = {}
+        if fields is None:
+            self.selected = list(self.fields)
+        else:
+            top, fields_nested = _split_nested(fields)
+            unknown = [name for name in top if name not in self.fields]
+            if unknown:
+                raise ValidationError({'fields': [f'Неизвестные поля: {", ".join(unknown)}']})
+            self.selected = [name for name in self.fields if name in top]
+
+        self.expanded = {
+            name: self.expandable[name](fields_nested.get(name), expand_nested.get(name))
+            for name in expand_top if name in self.selected
+        }
+
+    def get_columns(self, prefix=''):
+        """Столбцы для ``values()``; раскрытые связи — через ``__``."""
+        for name in self.selected:
+            if name in self.expanded:
+                yield from self.expanded[name].get_columns(f'{prefix}{name}__')
+            else:
+                yield prefix + name
+
+    def values(self, queryset, extra=()):
+        """
+        Выборка строк для сериализации.
+
+        Args:
+            queryset (QuerySet): Исходная выборка.
+            extra: Дополнительные столбцы (например, поля упорядочивания для
+                курсора keyset-пагинации); в ответ не попадают.
+        """
+        columns = list(self.get_columns())
+        return queryset.values(*columns, *(name for name in extra if name not in columns))
+
+    def to_representation(self, row, prefix=''):
+        return {
+            name: (
+                self.expanded[name].to_representation(row, f'{prefix}{name}__')
+                if name in self.expanded else row[prefix + name]
+            )
+            for name in self.selected
+        }
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class SparseFieldsMixin:
+    """
+    Чтение списка и объекта ``GenericAPIView`` через ``ValuesSerializer``.
+
+    Запись (создание, изменение) по-прежнему идёт через ``serializer_class``.
+
+    Attributes:
+        values_serializer_class (type): ``ValuesSerializer`` модели представления.
+    """
+
+    values_serializer_class = None
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_values_serializer(self):
+        params = self.request.query_params
+        return self.values_serializer_class(
+            fields=split_param(params.get(self.fields_query_param)),
+            expand=split_param(params.get(self.expand_query_param)),
+        )
+
+    def get_values_queryset(self, values_serializer):
+        # Поля упорядочивания нужны keyset-пагинации для курсора
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        return values_serializer.values(self.filter_queryset(self.get_queryset()), ordering)
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        queryset = self.get_values_queryset(values_serializer)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values_serializer.serialize(queryset))
+        return self.get_paginated_response(values_serializer.serialize(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        queryset = values_serializer.values(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(values_serializer.to_representation(row))
@@ -0,0 +1,99 @@
+"""
+Ограничение частоты запросов к API (DRF throttling) на ведрах ``ads.ratelimit``.
+
+DRF отвечает 429 с ``Retry-After`` из ``wait()``. Бюджеты — в ``RATELIMITS``:
+``api_anon`` (анонимы, по IP), ``api_user`` (по пользователю) и бюджет
+эндпоинта из атрибута ``throttle_scope`` представления (только изменяющие
+запросы, по пользователю). Изменяющий запрос тратит из бюджета эндпоинта
+``view.get_throttle_cost(request)`` жетонов — по жетону на элемент пакета
+или строку импорта.
+
+Отклонённый запрос не тратит жетоны ни одного бюджета: 429 по бюджету
+эндпоинта не уменьшает общий бюджет ``api_user`` или ``api_anon``.
+"""
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from ads import ratelimit
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Бюджет ``scope`` на клиента (``by``: ``'user'`` или ``'ip'``).
+
+    Attributes:
+        scope (str): Имя бюджета в ``RATELIMITS``.
+        by (str): Ключ ведра: пользователь (анонимы — по IP) или IP.
+    """
+
+    scope = None
+    by = 'user'
+
+    def get_scope(self, request, view):
+        """Бюджет для запроса; None — запрос не ограничивается."""
+        return self.scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        if scope is None:
+            return True
+        key, cost = ratelimit.client_key(request, self.by), self.get_cost(request, view)
+        # DRF проверяет все бюджеты запроса. Жетоны прошедших проверку
+        # бюджетов запоминаются на запросе (None — запрос уже отклонён).
+        # При отказе они возвращаются, а следующие бюджеты только проверяются
+        spent = getattr(request, '_token_bucket_spent', [])
+        self.decision = ratelimit.hit(scope, key, cost=cost, consume=spent is not None)
+        if spent is None:
+            return self.decision.allowed
+        if self.decision.allowed:
+            request._token_bucket_spent = [*spent, (scope, key, cost)]
+        else:
+            for spent_scope, spent_key, spent_cost in spent:
+                ratelimit.refund(spent_scope, spent_key, cost=spent_cost)
+            request._token_bucket_spent = None
+        return self.decision.allowed
+
+    def get_cost(self, request, view):
+        """Сколько жетонов тратит запрос."""
+        return 1
+
+    def wait(self):
+        return self.decision.retry_after
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'api_anon'
+    by = 'ip'
+
+    def get_scope(self, request, view):
+        return None if request.user.is_authenticated else self.scope
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'api_user'
+
+    def get_scope(self, request, view):
+        return self.scope if request.user.is_authenticated else None
+
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """Бюджет эндпоинта (``view.throttle_scope``) на изменяющие запросы."""
+
+    def get_scope(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        return getattr(view, 'throttle_scope', None)
+
+    def get_cost(self, request, view):
+        get_throttle_cost = getattr(view, 'get_throttle_cost', None)
+        return 1 if get_throttle_cost is None else get_throttle_cost(request)
+
+
+class ProposeExchangeThrottle(ScopedTokenBucketThrottle):
+    """Бюджет ``propose_exchange`` на создание предложений — общий с сайтом."""
+
+    scope = 'propose_exchange'
+
+    def get_scope(self, request, view):
+        return self.scope if request.method == 'POST' else None
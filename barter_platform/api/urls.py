@@ -1,13 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from .views import AdListCreateView, AdDetailView, ProposalListCreateView, ProposalDetailView
+from .views import (AdListCreateView, AdDetailView, AdBatchView, AdExportView, AdFacetsView, AdImportView,
+                    AdMatchesView, ProposalListCreateView, ProposalDetailView, ProposalBatchView)
+
+# Асинхронные списки для запуска под ASGI (см. api.async_views)
+if settings.ASYNC_VIEWS:
+    from .async_views import AdListCreateView, ProposalListCreateView
 
 
 urlpatterns = [
     # Эндпоинты для объявлений
     path('ads/', AdListCreateView.as_view(), name='api-ads-list'),
+    path('ads/facets/', AdFacetsView.as_view(), name='api-ads-facets'),
     path('ads/<int:pk>/', AdDetailView.as_view(), name='api-ads-detail'),
+    path('ads/<int:pk>/matches/', AdMatchesView.as_view(), name='api-ads-matches'),
+    path('ads/export.<str:file_format>', AdExportView.as_view(), name='api-ads-export'),
+    path('ads/import/', AdImportView.as_view(), name='api-ads-import'),
+    path('ads/batch/', AdBatchView.as_view(), name='api-ads-batch'),
     
     # Эндпоинты для предложений обмена
     path('proposals/', ProposalListCreateView.as_view(), name='api-proposals-list'),
     path('proposals/<int:pk>/', ProposalDetailView.as_view(), name='api-proposals-detail'),
+    path('proposals/batch/', ProposalBatchView.as_view(), name='api-proposals-batch'),
 ]
\ No newline at end of file
@@ -1,21 +1,365 @@
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from ads.models import Ad, ExchangeProposal
-from .serializers import AdSerializer, ProposalSerializer
+import io
 
-# Для объявлений
-class AdListCreateView(ListCreateAPIView):
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from ads import bulk, caching, conditional, facets, matching, services
+from ads.models import Ad, AdMatch, ExchangeProposal
+from ads.search import get_backend
+from ads.signals import ads_saved_in_bulk, proposals_created_in_bulk
+from .batch import BatchAPIView
+from .throttling import ProposeExchangeThrottle
+from .serializers import (AdImportSerializer, AdMatchSerializer, AdSerializer, AdValuesSerializer,
+                          ProposalBatchSerializer, ProposalBatchUpdateSerializer, ProposalSerializer,
+                          ProposalValuesSerializer)
+from .sparse import SparseFieldsMixin
+
+# Для объявлений; чтение — через values() с ?fields= и ?expand=, см. api.sparse
+class AdListCreateView(SparseFieldsMixin, ListCreateAPIView):
     queryset = Ad.objects.filter(is_active=True)
+    throttle_scope = 'api_write'  # бюджет изменений, см. api.throttling
+    replica_reads = True  # GET читает с реплики, см. ads.routers
     serializer_class = AdSerializer
+    values_serializer_class = AdValuesSerializer
 
-class AdDetailView(RetrieveUpdateDestroyAPIView):
+class AdDetailView(SparseFieldsMixin, RetrieveUpdateDestroyAPIView):
     queryset = Ad.objects.all()
+    throttle_scope = 'api_write'  # бюджет изменений, см. api.throttling
+    replica_reads = True
     serializer_class = AdSerializer
+    values_serializer_class = AdValuesSerializer
+
+    def get(self, request, *args, **kwargs):
+        # ETag по версии объявления: на 304 объявление не выбирается и не сериализуется
+        etag = conditional.make_etag(
+            caching.ad_key(self.kwargs['pk'], 'api'), request.get_full_path(),
+            request.accepted_media_type, request.user.pk,
+        )
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return conditional.set_validators(response, etag)
+
+class AdMatchesView(ListAPIView):
+    """
+    Лучшие подходящие обмены для объявления (готовый список без пагинации).
+
+    Читает основную базу, а не реплику: отсутствующий список считается и
+    записывается при первом запросе, и отстающая реплика его бы не увидела.
+    """
+
+    serializer_class = AdMatchSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return AdMatch.objects.none()  # генерация схемы drf_yasg, pk нет
+        ad = get_object_or_404(Ad, pk=self.kwargs['pk'])
+        return matching.get_matches(ad)
+
+
+class AdFacetsView(APIView):
+    """
+    Счётчики фасетов объявлений: число активных объявлений по категориям
+    и состояниям (см. ``ads.facets``). ``q`` — поисковый запрос,
+    ``category`` и ``condition`` — выбранные фильтры.
+    """
+
+    replica_reads = True
+
+    def get(self, request):
+        search = request.query_params.get('q')
+        search_queryset = None
+        if search:
+            search_queryset = get_backend().search(Ad.objects.filter(is_active=True), search)
+        counts = facets.get_counts(
+            search_queryset,
+            category=request.query_params.get('category', ''),
+            condition=request.query_params.get('condition', ''),
+        )
+        return Response({
+            name: [{'value': value, 'label': label, 'count': count} for value, label, count in items]
+            for name, items in facets.with_labels(counts).items()
+        })
+
+
+class AdBatchView(BatchAPIView):
+    """Пакетные операции с объявлениями (см. ``api.batch``)."""
+
+    def create_items(self, items, results):
+        context = {'request': self.request}
+        ads, indexes = [], []
+        for index, item in enumerate(items):
+            serializer = AdSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                results.error(index, serializer.errors)
+                continue
+            ads.append(Ad(**serializer.validated_data))
+            indexes.append(index)
+
+        ads = Ad.objects.bulk_create(ads)
+        ads_saved_in_bulk(ads)
+        for index, ad in zip(indexes, ads):
+            results.ok(index, 'created', ad.pk)
+
+    def update_items(self, items, results):
+        valid = self.split_updates(items, results)
+        ads = Ad.objects.select_for_update().in_bulk([pk for _, pk, _ in valid])
+        previous = {pk: facets.facet_key(ad) for pk, ad in ads.items()}
+        context = {'request': self.request}
+        now = timezone.now()
+        changed, fields = {}, {'updated_at'}
+        for index, pk, item in valid:
+            ad = ads.get(pk)
+            if ad is None:
+                results.error(index, {'id': ['Объявление не найдено']})
+                continue
+            data = {key: value for key, value in item.items() if key != 'id'}
+            serializer = AdSerializer(ad, data=data, partial=True, context=context)
+            if not serializer.is_valid():
+                results.error(index, serializer.errors)
+                continue
+            for field, value in serializer.validated_data.items():
+                setattr(ad, field, value)
+                fields.add(field)
+            ad.updated_at = now
+            changed[pk] = ad
+            results.ok(index, 'updated', pk)
+
+        if changed:
+            # Счётчики предложений не входят в fields и не перезаписываются
+            Ad.objects.bulk_update(changed.values(), sorted(fields))
+            ads_saved_in_bulk(list(changed.values()), previous=previous)
+
+    def delete_items(self, items, results):
+        valid = self.split_ids(items, results)
+        existing = set(Ad.objects.filter(
+            pk__in=[pk for _, pk in valid]
+        ).values_list('pk', flat=True))
+        # QuerySet.delete() отправляет сигналы: индекс, кеш и счётчики обновятся
+        Ad.objects.filter(pk__in=existing).delete()
+        for index, pk in valid:
+            if pk in existing:
+                results.ok(index, 'deleted', pk)
+            else:
+                results.error(index, {'id': ['Объявление не найдено']})
+
+
+class AdExportView(APIView):
+    """Потоковая выгрузка объявлений: ``ads/export.csv`` или ``ads/export.jsonl``."""
+
+    def get(self, request, file_format):
+        if file_format not in bulk.FORMATS:
+            raise Http404('Неизвестный формат выгрузки')
+        queryset = Ad.objects.all()
+        if request.query_params.get('active'):
+            queryset = queryset.filter(is_active=True)
+        response = StreamingHttpResponse(
+            bulk.export_ads(queryset, file_format),
+            content_type=bulk.CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="ads.{file_format}"'
+        return response
+
+
+class AdImportView(APIView):
+    """
+    Массовый импорт объявлений из файла ``file`` (CSV или JSONL).
+
+    Строки проверяются ``AdImportSerializer``; ошибочные строки не прерывают
+    импорт и возвращаются в ответе по номерам строк.
+    """
+
+    parser_classes = [MultiPartParser]
+    throttle_scope = 'api_write'
+
+    def get_throttle_cost(self, request):
+        # Жетон на строку файла (без пустых строк и заголовка CSV)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return 1
+        rows = sum(1 for line in upload.file if line.strip())
+        upload.file.seek(0)
+        fmt = request.data.get('file_format') or bulk.guess_format(upload.name)
+        return max(rows - (fmt == 'csv'), 1)
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['Файл не передан']})
+        fmt = request.data.get('file_format') or bulk.guess_format(upload.name)
+        if fmt not in bulk.FORMATS:
+            raise ValidationError({'file_format': [f'Поддерживаются форматы: {", ".join(bulk.FORMATS)}']})
+
+        context = {'request': request}
+
+        def validate(row):
+            serializer = AdImportSerializer(data=row, context=context)
+            if not serializer.is_valid():
+                return None, serializer.errors
+            return Ad(**serializer.validated_data), None
+
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        result = bulk.import_ads(bulk.read_rows(lines, fmt), validate)
+        return Response(
+            {'created': result.created, 'errors': result.errors},
+            status=201 if result.created else 400,
+        )
+
 
 # Для предложений обмена
-class ProposalListCreateView(ListCreateAPIView):
+class ProposalListCreateView(SparseFieldsMixin, ListCreateAPIView):
     queryset = ExchangeProposal.objects.all()
+    throttle_scope = 'api_write'  # бюджет изменений, см. api.throttling
+    # Создание тратит и бюджет предложений обмена, общий с формой на сайте
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, ProposeExchangeThrottle]
+    replica_reads = True
     serializer_class = ProposalSerializer
+    values_serializer_class = ProposalValuesSerializer
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        serializer.save()
+
+class ProposalBatchView(BatchAPIView):
+    """
+    Пакетные операции с предложениями (см. ``api.batch``).
+
+    Принятие идёт через ``services.accept_proposal`` (блокировки и каскад
+    отказов), остальные смены статуса — одним ``bulk_update`` с
+    пересчётом счётчиков. Статус обработанного предложения (в том числе
+    отклонённого принятием из того же пакета) не меняется: такой элемент
+    получает ошибку.
+    """
 
-class ProposalDetailView(RetrieveUpdateDestroyAPIView):
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, ProposeExchangeThrottle]
+
+    def create_items(self, items, results):
+        context = {'request': self.request}
+        candidates = []
+        for index, item in enumerate(items):
+            serializer = ProposalBatchSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                results.error(index, serializer.errors)
+                continue
+            candidates.append((index, ExchangeProposal(**serializer.validated_data)))
+
+        # Уникальность пар проверяется одним запросом, а не запросом на элемент
+        existing = set(ExchangeProposal.objects.filter(
+            ad_sender__in=[proposal.ad_sender_id for _, proposal in candidates],
+            ad_receiver__in=[proposal.ad_receiver_id for _, proposal in candidates],
+        ).values_list('ad_sender', 'ad_receiver'))
+        proposals, indexes = [], []
+        for index, proposal in candidates:
+            pair = (proposal.ad_sender_id, proposal.ad_receiver_id)
+            if pair in existing:
+                results.error(index, {'non_field_errors': ['Такое предложение уже существует']})
+                continue
+            existing.add(pair)
+            proposals.append(proposal)
+            indexes.append(index)
+
+        proposals = ExchangeProposal.objects.bulk_create(proposals)
+        proposals_created_in_bulk(proposals)
+        for index, proposal in zip(indexes, proposals):
+            results.ok(index, 'created', proposal.pk)
+
+    def update_items(self, items, results):
+        valid = self.split_updates(items, results)
+        proposals = ExchangeProposal.objects.select_for_update().in_bulk(
+            [pk for _, pk, _ in valid]
+        )
+        context = {'request': self.request}
+        updates = []
+        for index, pk, item in valid:
+            proposal = proposals.get(pk)
+            if proposal is None:
+                results.error(index, {'id': ['Предложение не найдено']})
+                continue
+            data = {key: value for key, value in item.items() if key != 'id'}
+            serializer = ProposalBatchUpdateSerializer(proposal, data=data, partial=True, context=context)
+            if not serializer.is_valid():
+                results.error(index, serializer.errors)
+                continue
+            data = dict(serializer.validated_data)
+            if proposal.status == 'pending' and data.get('status') == 'accepted':
+                try:
+                    services.accept_proposal(proposal)
+                except services.ExchangeError as error:
+                    results.error(index, {'status': [str(error)]})
+                    continue
+                del data['status']
+            updates.append((index, proposal, data))
+
+        # Принятия могли отклонить другие предложения пакета: берём текущие статусы
+        current = dict(ExchangeProposal.objects.filter(
+            pk__in=[proposal.pk for _, proposal, _ in updates]
+        ).values_list('pk', 'status'))
+        changes, fields = [], set()
+        for index, proposal, data in updates:
+            old_status = proposal.status = current[proposal.pk]
+            if old_status != 'pending' and data.get('status', old_status) != old_status:
+                results.error(index, {'status': ['Предложение уже обработано, статус изменить нельзя']})
+                continue
+            for field, value in data.items():
+                setattr(proposal, field, value)
+                fields.add(field)
+            current[proposal.pk] = proposal.status
+            changes.append((proposal, old_status, proposal.status))
+            results.ok(index, 'updated', proposal.pk)
+
+        if fields:
+            ExchangeProposal.objects.bulk_update(
+                list({proposal.pk: proposal for proposal, _, _ in changes}.values()),
+                sorted(fields),
+            )
+        services.update_counters_in_bulk(changes)
+
+    def delete_items(self, items, results):
+        valid = self.split_ids(items, results)
+        existing = set(ExchangeProposal.objects.filter(
+            pk__in=[pk for _, pk in valid]
+        ).values_list('pk', flat=True))
+        ExchangeProposal.objects.filter(pk__in=existing).delete()
+        for index, pk in valid:
+            if pk in existing:
+                results.ok(index, 'deleted', pk)
+            else:
+                results.error(index, {'id': ['Предложение не найдено']})
+
+
+class ProposalDetailView(SparseFieldsMixin, RetrieveUpdateDestroyAPIView):
     queryset = ExchangeProposal.objects.all()
-    serializer_class = ProposalSerializer
\ No newline at end of file
+    throttle_scope = 'api_write'  # бюджет изменений, см. api.throttling
+    replica_reads = True
+    serializer_class = ProposalSerializer
+    values_serializer_class = ProposalValuesSerializer
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        proposal = serializer.instance
+        new_status = serializer.validated_data.get('status', proposal.status)
+        # Статус обработанного предложения не меняется (см. validate_status;
+        # здесь — на случай, если его обработали после чтения)
+        if proposal.status != 'pending' and new_status != proposal.status:
+            raise ValidationError({'status': ['Предложение уже обработано, статус изменить нельзя']})
+        # Принятие и отклонение идут через сервис: блокировки и каскад отказов
+        transition = {
+            'accepted': services.accept_proposal,
+            'rejected': services.reject_proposal,
+        }.get(new_status)
+        if proposal.status == 'pending' and transition is not None:
+            try:
+                transition(proposal)
+            except services.ExchangeError as error:
+                raise ValidationError({'status': [str(error)]})
+        old_status = proposal.status
+        proposal = serializer.save()
+        services.update_counters(proposal, old_status, proposal.status)
\ No newline at end of file
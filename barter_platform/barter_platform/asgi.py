@@ -3,6 +3,10 @@ ASGI config for barter_platform project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Поток событий о предложениях (``/events/``, SSE) и асинхронные представления
+(``ASYNC_VIEWS``) рассчитаны на запуск через это приложение, например
+``uvicorn barter_platform.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
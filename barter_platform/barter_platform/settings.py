@@ -14,6 +14,8 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 
+from . import sqlite
+
 load_dotenv()  # Загружает переменные из .env
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,6 +35,9 @@ DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = []
 
+# Адреса, которым доступен /metrics без входа в систему
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -45,19 +50,23 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'ads.apps.AdsConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'rest_framework',
     'drf_yasg',
 
 ]
 
 MIDDLEWARE = [
+    'ads.middleware.QueryMetricsMiddleware',  # первым: учитывает время всех остальных
     'django.middleware.security.SecurityMiddleware',
+    'ads.ratelimit.RateLimitMiddleware',  # до сессий: отклонённый запрос не идёт в БД
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ads.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'barter_platform.urls'
@@ -90,6 +99,65 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения (см. ads.routers): DB_REPLICAS — пути к копиям SQLite
+# через запятую, которые поддерживает внешняя репликация (например,
+# Litestream или LiteFS). Лента, страница объявления и GET API читают
+# с реплик, кроме DATABASE_REPLICA_STICKY_SECONDS секунд после записи
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# SQLITE_PRODUCTION=True — рабочий режим SQLite (см. barter_platform.sqlite):
+# WAL, synchronous=NORMAL, IMMEDIATE-транзакции с ожиданием занятой базы
+# SQLITE_BUSY_TIMEOUT секунд, mmap и кеш страниц (в МиБ), соединения
+# живут CONN_MAX_AGE секунд
+if os.getenv('SQLITE_PRODUCTION', 'False') == 'True':
+    for database in DATABASES.values():
+        database.update(sqlite.production_settings(
+            busy_timeout=int(os.getenv('SQLITE_BUSY_TIMEOUT', 5)),
+            mmap_size=int(os.getenv('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024,
+            cache_size=int(os.getenv('SQLITE_CACHE_SIZE_MB', 64)) * 1024 * 1024,
+            conn_max_age=int(os.getenv('CONN_MAX_AGE', 600)),
+        ))
+
+DATABASE_ROUTERS = ['ads.routers.ReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', 10))
+
+
+# Cache
+# По умолчанию — кеш в памяти процесса. CACHE_DIR включает файловый кеш,
+# общий для нескольких процессов, REDIS_URL — Redis (нужен пакет redis).
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Время жизни закешированных страниц ленты и объявлений, секунды
+ADS_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,6 +195,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Загруженные файлы (миниатюры изображений объявлений)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -134,3 +206,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'\
 
 LOGIN_REDIRECT_URL = '/'  # Перенаправлять на главную после входа
 LOGOUT_REDIRECT_URL = '/accounts/login/'  # Перенаправлять на страницу авторизации
+
+# Поисковый бэкенд объявлений (путь к классу из ads.search).
+# Если не задан, выбирается по движку БД: FTS5 для SQLite, tsvector для PostgreSQL.
+ADS_SEARCH_BACKEND = os.getenv('ADS_SEARCH_BACKEND') or None
+
+# Сколько подходящих обменов хранить и показывать для объявления
+ADS_MATCHES_PER_AD = int(os.getenv('ADS_MATCHES_PER_AD', 20))
+
+# Обмены по цепочке: максимальное число участников и сколько цепочек
+# искать для одного нового предложения
+ADS_TRADE_CYCLE_MAX_LENGTH = int(os.getenv('ADS_TRADE_CYCLE_MAX_LENGTH', 4))
+ADS_TRADE_CYCLE_LIMIT = int(os.getenv('ADS_TRADE_CYCLE_LIMIT', 10))
+
+# Асинхронные варианты представлений чтения (ленты, объявления, «Мои
+# предложения», списков API) для запуска под ASGI (uvicorn)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# События о предложениях для потока SSE (/events/): LocalBackend — в пределах
+# процесса, RedisBackend — во все воркеры через Redis pub/sub
+ADS_EVENTS_BACKEND = os.getenv('ADS_EVENTS_BACKEND', 'ads.events.LocalBackend')
+ADS_EVENTS_REDIS_URL = os.getenv('ADS_EVENTS_REDIS_URL') or os.getenv('REDIS_URL')
+# Интервал keepalive-комментариев в потоке, секунды
+ADS_EVENTS_KEEPALIVE = 15
+
+# Миниатюры изображений объявлений (нужен Pillow): ширины в пикселях,
+# ограничения загрузки; адреса во внутренних сетях запрещены
+ADS_THUMBNAIL_SIZES = (320, 640)
+ADS_IMAGE_FETCH_TIMEOUT = int(os.getenv('ADS_IMAGE_FETCH_TIMEOUT', 5))
+ADS_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+ADS_IMAGE_ALLOW_PRIVATE = os.getenv('ADS_IMAGE_ALLOW_PRIVATE', 'False') == 'True'
+
+# Архив (manage.py archive_ads): через сколько дней неактивности объявление
+# вместе с предложениями переносится в архивные таблицы и сколько объявлений
+# переносить в одной транзакции
+ADS_ARCHIVE_AFTER_DAYS = int(os.getenv('ADS_ARCHIVE_AFTER_DAYS', 90))
+ADS_ARCHIVE_BATCH_SIZE = int(os.getenv('ADS_ARCHIVE_BATCH_SIZE', 500))
+
+# Ограничение частоты запросов (ads.ratelimit): бюджет «N/период» на
+# клиента, None — без ограничения. global — все запросы с одного IP,
+# propose_exchange и ad_create — отправка форм пользователем, api_anon и
+# api_user — запросы к API, api_write — изменения объявлений и предложений
+# через API.
+# Ведра хранятся в кеше RATELIMIT_CACHE; за обратным прокси задайте
+# заголовок с адресом клиента (RATELIMIT_IP_HEADER=HTTP_X_FORWARDED_FOR)
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True') == 'True'
+RATELIMIT_CACHE = 'default'
+RATELIMIT_IP_HEADER = os.getenv('RATELIMIT_IP_HEADER') or None
+RATELIMITS = {
+    'global': os.getenv('RATELIMIT_GLOBAL', '600/m'),
+    'propose_exchange': '20/m',
+    'ad_create': '10/m',
+    'api_anon': '120/m',
+    'api_user': '1200/m',
+    'api_write': '60/m',
+}
+
+# Очередь фоновых задач (воркер: manage.py run_jobs): сколько раз пробовать
+# задачу и базовая задержка перед повтором в секундах (удваивается)
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 10))
+# Сколько секунд от постановки действует ключ идемпотентности задачи и
+# сколько секунд хранятся завершённые задачи (их удаляет воркер)
+JOBS_IDEMPOTENCY_WINDOW = int(os.getenv('JOBS_IDEMPOTENCY_WINDOW', 86400))
+JOBS_RETENTION = int(os.getenv('JOBS_RETENTION', 7 * 86400))
+
+# Письма с уведомлениями о предложениях; по умолчанию выводятся в консоль воркера
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@barter.local')
+# Адрес сайта для ссылок в письмах (без завершающего слеша)
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
+
+REST_FRAMEWORK = {
+    # Keyset-пагинация без COUNT(*); ?page= включает нумерованные страницы
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    # Бюджеты запросов — в RATELIMITS (см. ads.ratelimit)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.AnonTokenBucketThrottle',
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.ScopedTokenBucketThrottle',
+    ],
+}
+# Максимальный размер пакета в /api/*/batch/
+API_BATCH_MAX_ITEMS = int(os.getenv('API_BATCH_MAX_ITEMS', 100))
+
+# Метрики запросов (/metrics); сбор можно переключать на лету POST-запросом
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_SLOW_QUERY_LIMIT = 20
@@ -0,0 +1,60 @@
+"""
+Рабочий режим SQLite (``SQLITE_PRODUCTION``).
+
+Настройки Django по умолчанию рассчитаны на разработку: журнал отката
+(rollback journal), при котором запись блокирует чтение всей базы,
+отложенные (DEFERRED) транзакции и новое соединение на каждый запрос.
+Под одновременной записью предложений это даёт ошибки
+``database is locked``: транзакция, начавшаяся с чтения, не может
+повысить блокировку до записи, пока базу держит другая, и SQLite сразу
+отказывает ей, не дожидаясь таймаута.
+
+Рабочий режим:
+
+* ``journal_mode=WAL`` — читатели не блокируют писателя и наоборот;
+* ``synchronous=NORMAL`` — в WAL безопасно при сбое приложения, fsync
+  только на контрольных точках;
+* ``transaction_mode=IMMEDIATE`` — транзакция сразу берёт блокировку
+  записи и при занятой базе ждёт ``busy_timeout``, а не падает;
+* ``mmap_size`` и ``cache_size`` — чтение страниц без системных вызовов
+  и больший кеш страниц на соединение;
+* ``CONN_MAX_AGE`` с проверкой соединений — соединение (и прагмы)
+  переиспользуется между запросами.
+
+Сравнение режимов под нагрузкой — команда ``benchmark_sqlite``.
+"""
+
+# Прагмы журнала: journal_mode=WAL сохраняется в файле базы
+JOURNAL_PRAGMAS = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL')
+
+
+def production_settings(busy_timeout=5, mmap_size=256 * 1024 * 1024,
+                        cache_size=64 * 1024 * 1024, conn_max_age=600):
+    """
+    Дополнения к записи ``DATABASES`` для рабочего режима.
+
+    Args:
+        busy_timeout (int): Сколько секунд ждать занятую базу.
+        mmap_size (int): Размер отображаемой в память части файла, байт.
+        cache_size (int): Кеш страниц одного соединения, байт.
+        conn_max_age (int): Время жизни соединения, секунд (None — без ограничения).
+
+    Returns:
+        dict: ``OPTIONS``, ``CONN_MAX_AGE`` и ``CONN_HEALTH_CHECKS``.
+    """
+    pragmas = (
+        *JOURNAL_PRAGMAS,
+        f'PRAGMA mmap_size={int(mmap_size)}',
+        # Отрицательное значение — размер в КиБ, а не в страницах
+        f'PRAGMA cache_size={-(int(cache_size) // 1024)}',
+        'PRAGMA temp_store=MEMORY',
+    )
+    return {
+        'OPTIONS': {
+            'init_command': '; '.join(pragmas),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': busy_timeout,
+        },
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+    }
@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth.views import LogoutView
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from ads.images import THUMBNAIL_DIR
+from ads.views import MetricsView, ThumbnailView
 
 # Настройка Swagger (вынесено в отдельную переменную для читаемости)
 swagger_info = openapi.Info(
@@ -27,6 +30,13 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
     path('accounts/logout/', LogoutView.as_view(), name='logout'),
     
+    # Метрики в формате Prometheus
+    path('metrics', MetricsView.as_view(), name='metrics'),
+
+    # Миниатюры изображений объявлений (в продакшене — веб-сервером)
+    path(f'{settings.MEDIA_URL.strip("/")}/{THUMBNAIL_DIR}/<path:name>', ThumbnailView.as_view(),
+         name='thumbnail'),
+
     # Основное приложение
     path('', include('ads.urls')),
     
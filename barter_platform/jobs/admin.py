@@ -0,0 +1,33 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели Job в административной панели.
+
+    Attributes:
+        list_display (tuple): Поля, отображаемые в списке задач.
+        list_filter (tuple): Поля для фильтрации справа.
+        search_fields (tuple): Поля, по которым осуществляется поиск.
+        readonly_fields (tuple): Поля только для чтения.
+        actions (list): Массовые действия над задачами.
+    """
+
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'idempotency_key')
+    readonly_fields = ('claimed_by', 'claimed_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry']
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), claimed_by='', finished_at=None
+        )
+        self.message_user(request, f'Поставлено в очередь задач: {updated}')
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,66 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs import queue
+
+# Как часто воркер удаляет старые завершённые задачи, секунды
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Сколько задач забирать за раз')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--stale-timeout', type=int, default=600,
+                            help='Через сколько секунд задача в работе считается зависшей')
+        parser.add_argument('--purge-after', type=int, default=None,
+                            help='Через сколько секунд после завершения удалять задачи '
+                                 '(по умолчанию JOBS_RETENTION; 0 — не удалять)')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        purge_after = options['purge_after']
+        if purge_after is None:
+            purge_after = queue.get_retention()
+        done = failed = 0
+        purged_at = None
+        while not self.stopping:
+            close_old_connections()
+            requeued = queue.requeue_stale(options['stale_timeout'])
+            if requeued:
+                self.stdout.write(f'Возвращено в очередь зависших задач: {requeued}')
+            if purge_after and (purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL):
+                purged_at = time.monotonic()
+                purged = queue.purge(purge_after)
+                if purged:
+                    self.stdout.write(f'Удалено завершённых задач: {purged}')
+            jobs = queue.claim(options['batch_size'])
+            for job in jobs:
+                # Взятые задачи доделываются и после сигнала остановки
+                if queue.run_job(job):
+                    done += 1
+                else:
+                    failed += 1
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}, с ошибкой: {failed}'))
+
+    def stop(self, signum, frame):
+        self.stdout.write('Остановка после текущей пачки задач')
+        self.stopping = True
@@ -0,0 +1,78 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в очереди (см. ``jobs.queue``).
+
+    Attributes:
+        STATUS_CHOICES (list): Варианты статусов задачи.
+        name (CharField): Имя зарегистрированной задачи.
+        payload (JSONField): Именованные аргументы задачи.
+        status (CharField): Текущий статус задачи.
+        idempotency_key (CharField): Ключ, по которому повторная постановка
+            той же задачи игнорируется; пустой — без проверки.
+        attempts (PositiveSmallIntegerField): Число начатых попыток.
+        max_attempts (PositiveSmallIntegerField): Сколько попыток допускается.
+        run_at (DateTimeField): Время, раньше которого задачу не выполнять.
+        claimed_by (CharField): Метка пачки, в которой задачу взял воркер.
+        claimed_at (DateTimeField): Когда задачу взял воркер.
+        last_error (TextField): Трассировка последней ошибки.
+        created_at (DateTimeField): Дата постановки в очередь (автоматически).
+        finished_at (DateTimeField): Дата успешного выполнения или отказа.
+    """
+
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Аргументы')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name='Статус'
+    )
+    idempotency_key = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        unique=True,
+        verbose_name='Ключ идемпотентности'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name='Максимум попыток')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Выполнить после')
+    claimed_by = models.CharField(max_length=64, blank=True, verbose_name='Воркер')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-created_at']
+        indexes = [
+            # Выборка готовых к выполнению задач воркером
+            models.Index(
+                fields=['run_at', 'id'],
+                name='job_queued_idx',
+                condition=Q(status='queued'),
+            ),
+            # Поиск зависших задач (воркер остановился, не завершив их)
+            models.Index(
+                fields=['claimed_at'],
+                name='job_running_idx',
+                condition=Q(status='running'),
+            ),
+        ]
@@ -0,0 +1,256 @@
+"""
+Очередь фоновых задач в базе данных (без внешнего брокера).
+
+Задача — функция, зарегистрированная декоратором ``task`` в модуле
+``tasks`` любого приложения. ``enqueue`` записывает строку ``Job`` в
+текущей транзакции: воркер увидит задачу только после её фиксации, а при
+откате задача пропадёт вместе с остальными изменениями.
+
+Воркер (``manage.py run_jobs``) забирает задачи пачками (``claim``): на
+PostgreSQL — ``SELECT ... FOR UPDATE SKIP LOCKED``, так что несколько
+воркеров не ждут друг друга; на SQLite, где этого нет, — условным
+``UPDATE ... WHERE status='queued'`` (запись в SQLite и так
+последовательна). Каждая задача выполняется в своей транзакции; после
+ошибки она возвращается в очередь с экспоненциальной задержкой, пока не
+исчерпаны попытки.
+
+Ключ идемпотентности действует ``JOBS_IDEMPOTENCY_WINDOW`` секунд от
+постановки задачи (и пока она не завершена). Завершённые задачи старше
+``JOBS_RETENTION`` секунд удаляет ``purge`` (воркер — раз в час).
+"""
+
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница задержки перед повтором, секунды
+MAX_RETRY_DELAY = 3600
+
+_tasks = {}
+
+
+def get_max_attempts():
+    return getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+
+
+def get_retry_delay():
+    return getattr(settings, 'JOBS_RETRY_DELAY', 10)
+
+
+def get_idempotency_window():
+    return getattr(settings, 'JOBS_IDEMPOTENCY_WINDOW', 86400)
+
+
+def get_retention():
+    return getattr(settings, 'JOBS_RETENTION', 7 * 86400)
+
+
+def task(name=None, max_attempts=None):
+    """
+    Регистрирует функцию как фоновую задачу.
+
+    Args:
+        name: Имя задачи в очереди; по умолчанию ``модуль.функция``.
+        max_attempts: Сколько раз пробовать; по умолчанию ``JOBS_MAX_ATTEMPTS``.
+    """
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        _tasks[func.task_name] = func
+        return func
+    return decorator
+
+
+def _new_job(func, payload, key, delay):
+    name = getattr(func, 'task_name', func)
+    if name not in _tasks:
+        raise LookupError(f'Задача {name} не зарегистрирована')
+    return Job(
+        name=name,
+        payload=payload,
+        idempotency_key=key,
+        max_attempts=_tasks[name].max_attempts or get_max_attempts(),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue(func, key=None, delay=0, **payload):
+    """
+    Ставит задачу в очередь.
+
+    Args:
+        func: Задача (функция с декоратором ``task``) или её имя.
+        key: Ключ идемпотентности: если задача с таким ключом ставилась
+            в пределах ``JOBS_IDEMPOTENCY_WINDOW`` или ещё не завершена,
+            новая не создаётся и возвращается существующая.
+        delay: Через сколько секунд выполнить.
+        **payload: Аргументы задачи (должны сериализоваться в JSON).
+
+    Returns:
+        Job: Новая или уже существующая задача.
+    """
+    job = _new_job(func, payload, key, delay)
+    if key is None:
+        job.save()
+        return job
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                job.save()
+            return job
+        except IntegrityError:
+            # Ключ освобождается лениво: когда с ним пришла новая задача
+            if attempt or not release_keys([key]):
+                return Job.objects.get(idempotency_key=key)
+
+
+def enqueue_many(func, payloads, keys=None, delay=0):
+    """
+    Ставит в очередь пачку задач одним ``INSERT``. Задачи с ключами,
+    которые уже встречались в пределах ``JOBS_IDEMPOTENCY_WINDOW``,
+    пропускаются.
+    """
+    keys = keys or [None] * len(payloads)
+    jobs = [_new_job(func, payload, key, delay) for payload, key in zip(payloads, keys)]
+    if any(keys):
+        release_keys([key for key in keys if key])
+    Job.objects.bulk_create(jobs, ignore_conflicts=any(keys))
+    return jobs
+
+
+def release_keys(keys):
+    """
+    Снимает ключи идемпотентности с завершённых задач, поставленных раньше
+    ``JOBS_IDEMPOTENCY_WINDOW`` секунд назад: с такими ключами снова можно
+    ставить задачи.
+
+    Returns:
+        int: Число освобождённых ключей.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_idempotency_window())
+    return Job.objects.filter(
+        idempotency_key__in=keys, status__in=('done', 'failed'), created_at__lt=cutoff
+    ).update(idempotency_key=None)
+
+
+def purge(older_than=None):
+    """
+    Удаляет выполненные и проваленные задачи, завершённые больше
+    ``older_than`` секунд назад (по умолчанию ``JOBS_RETENTION``).
+
+    Returns:
+        int: Число удалённых задач.
+    """
+    older_than = get_retention() if older_than is None else older_than
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def claim(batch_size=10):
+    """
+    Забирает до ``batch_size`` готовых задач в работу.
+
+    Returns:
+        list: Задачи со статусом ``running`` и общей меткой ``claimed_by``.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        ready = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        ids = list(ready.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return []
+        # На SQLite другой воркер мог успеть забрать часть задач
+        Job.objects.filter(pk__in=ids, status='queued').update(
+            status='running', claimed_by=token, claimed_at=now, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(pk__in=ids, claimed_by=token).order_by('run_at', 'id'))
+
+
+def retry_delay(attempt):
+    """Задержка перед повтором: экспоненциальная, со случайным разбросом ±20%."""
+    delay = min(get_retry_delay() * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _finish(job, **fields):
+    # Условие по метке: если задачу сочли зависшей и отдали другому
+    # воркеру, результат этой попытки не перезаписывает её состояние
+    Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by).update(**fields)
+    for field, value in fields.items():
+        setattr(job, field, value)
+
+
+def run_job(job):
+    """
+    Выполняет взятую задачу в отдельной транзакции.
+
+    Returns:
+        bool: True, если задача выполнена успешно.
+    """
+    func = _tasks.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована')
+        with transaction.atomic():
+            func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if func is not None and job.attempts < job.max_attempts:
+            logger.warning('Задача %s #%s: ошибка, попытка %s из %s', job.name, job.pk,
+                           job.attempts, job.max_attempts, exc_info=True)
+            _finish(job, status='queued', run_at=now + retry_delay(job.attempts),
+                    claimed_by='', last_error=error)
+        else:
+            logger.error('Задача %s #%s: попытки исчерпаны', job.name, job.pk, exc_info=True)
+            _finish(job, status='failed', finished_at=now, last_error=error)
+        return False
+    _finish(job, status='done', finished_at=timezone.now())
+    return True
+
+
+def requeue_stale(timeout):
+    """
+    Возвращает в очередь задачи, которые выполняются дольше ``timeout``
+    секунд (воркер остановился, не завершив их); если попытки исчерпаны,
+    задача считается проваленной.
+
+    Returns:
+        int: Число возвращённых в очередь задач.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', claimed_at__lt=now - timedelta(seconds=timeout))
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now, last_error='Воркер не завершил задачу'
+    )
+    return stale.update(status='queued', claimed_by='', run_at=now)
+
+
+def run_pending(batch_size=10):
+    """
+    Выполняет все готовые задачи, пока очередь не опустеет.
+
+    Returns:
+        int: Число выполненных (в том числе неудачно) задач.
+    """
+    count = 0
+    while jobs := claim(batch_size):
+        for job in jobs:
+            run_job(job)
+            count += 1
+    return count
@@ -0,0 +1,163 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+
+calls = []
+
+
+@queue.task(name='jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@queue.task(name='jobs.tests.flaky', max_attempts=2)
+def flaky(fail):
+    calls.append(fail)
+    Job.objects.create(name='side effect')  # откатывается вместе с ошибкой
+    if fail:
+        raise ValueError('ошибка')
+
+
+class JobsTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        job = queue.enqueue(record, value=1)
+        queue.enqueue('jobs.tests.record', value=2)
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(queue.run_pending(), 2)
+        self.assertEqual(calls, [1, 2])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertIsNotNone(job.finished_at)
+        with self.assertRaises(LookupError):
+            queue.enqueue('jobs.tests.missing')
+
+    def test_idempotency_key(self):
+        first = queue.enqueue(record, key='once', value=1)
+        self.assertEqual(queue.enqueue(record, key='once', value=2), first)
+        queue.enqueue_many(record, [{'value': 3}, {'value': 4}], keys=['once', 'other'])
+        queue.run_pending()
+        self.assertEqual(calls, [1, 4])
+        # Ключ действует и после выполнения задачи
+        queue.enqueue(record, key='once', value=5)
+        self.assertEqual(queue.run_pending(), 0)
+
+    @override_settings(JOBS_IDEMPOTENCY_WINDOW=3600)
+    def test_idempotency_window(self):
+        first = queue.enqueue(record, key='once', value=1)
+        pending = queue.enqueue(record, key='pending', value=2)
+        Job.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        # Незавершённая задача удерживает ключ и после окна
+        self.assertEqual(queue.enqueue(record, key='pending', value=3), pending)
+        queue.run_pending()
+        self.assertEqual(calls, [1, 2])
+
+        # После окна ключ выполненной задачи снова свободен
+        second = queue.enqueue(record, key='once', value=4)
+        self.assertNotEqual(second, first)
+        queue.enqueue_many(record, [{'value': 5}], keys=['pending'])
+        queue.run_pending()
+        self.assertEqual(calls, [1, 2, 4, 5])
+        first.refresh_from_db()
+        self.assertIsNone(first.idempotency_key)
+
+    def test_purge(self):
+        old, recent = queue.enqueue_many(record, [{'value': 1}, {'value': 2}])
+        failed = Job.objects.create(name='jobs.tests.missing')
+        waiting = queue.enqueue(record, delay=60, value=3)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        Job.objects.filter(pk__in=[old.pk, failed.pk]).update(finished_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(queue.purge(), 2)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, waiting.pk})
+
+        out = StringIO()
+        call_command('run_jobs', once=True, purge_after=0, stdout=out)
+        self.assertNotIn('Удалено', out.getvalue())
+        call_command('run_jobs', once=True, purge_after=1, stdout=out)
+        self.assertNotIn('Удалено', out.getvalue())
+        Job.objects.filter(pk=recent.pk).update(finished_at=timezone.now() - timedelta(minutes=1))
+        call_command('run_jobs', once=True, purge_after=1, stdout=out)
+        self.assertIn('Удалено завершённых задач: 1', out.getvalue())
+
+    def test_delay(self):
+        job = queue.enqueue(record, delay=60, value=1)
+        self.assertEqual(queue.claim(), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(queue.claim(), [job])
+
+    def test_claim_batch(self):
+        jobs = queue.enqueue_many(record, [{'value': i} for i in range(5)])
+        claimed = queue.claim(batch_size=3)
+        self.assertEqual([job.pk for job in claimed], [job.pk for job in jobs[:3]])
+        self.assertEqual({job.status for job in claimed}, {'running'})
+        self.assertEqual(len({job.claimed_by for job in claimed}), 1)
+        # Взятые задачи второй раз не выдаются
+        self.assertEqual([job.pk for job in queue.claim(batch_size=10)], [job.pk for job in jobs[3:]])
+
+    @override_settings(JOBS_RETRY_DELAY=10)
+    def test_retry_with_backoff(self):
+        job = queue.enqueue(flaky, fail=True)
+        self.assertEqual(job.max_attempts, 2)
+        before = timezone.now()
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertFalse(queue.run_job(queue.claim()[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=8))
+        self.assertFalse(Job.objects.filter(name='side effect').exists())
+
+        # Задержка растёт с каждой попыткой
+        self.assertGreater(queue.retry_delay(3), queue.retry_delay(1) * 2)
+        self.assertLessEqual(queue.retry_delay(30).total_seconds(), queue.MAX_RETRY_DELAY * 1.2)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(calls, [True, True])
+
+    def test_unknown_task_fails(self):
+        Job.objects.create(name='jobs.tests.missing')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        self.assertEqual(Job.objects.get().status, 'failed')
+
+    def test_requeue_stale(self):
+        stale, exhausted = queue.enqueue_many(record, [{'value': 1}, {'value': 2}])
+        queue.claim()
+        Job.objects.filter(pk=exhausted.pk).update(attempts=5)
+        Job.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        old_token = Job.objects.get(pk=stale.pk).claimed_by
+        self.assertEqual(queue.requeue_stale(600), 1)
+        self.assertEqual(Job.objects.get(pk=exhausted.pk).status, 'failed')
+
+        # Результат старой попытки не перезаписывает задачу, отданную заново
+        abandoned = Job.objects.get(pk=stale.pk)
+        abandoned.claimed_by = old_token
+        queue.run_job(abandoned)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'queued')
+        queue.run_pending()
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, 'done')
+
+    def test_run_jobs_command(self):
+        queue.enqueue(record, value=1)
+        queue.enqueue(flaky, fail=True)
+        out = StringIO()
+        with mock.patch('signal.signal') as handler, self.assertLogs('jobs.queue', 'WARNING'):
+            call_command('run_jobs', once=True, stdout=out)
+        handler.assert_not_called()
+        self.assertIn('Выполнено задач: 1, с ошибкой: 1', out.getvalue())
+        self.assertEqual(calls, [1, True])